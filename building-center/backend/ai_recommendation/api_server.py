@@ -3,7 +3,8 @@
 Flask API服务器接收前端问卷数据并返回AI推荐结果
 
 使用方法：
-    python api_server.py
+    python api_server.py                      # 开发服务器
+    gunicorn -c gunicorn.conf.py wsgi:app     # 生产环境（多进程 + 线程，master 预加载数据）
 
 前端POST数据格式：
 {
@@ -26,10 +27,12 @@ Flask API服务器接收前端问卷数据并返回AI推荐结果
 
 import json
 import os
+import threading
+import time
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 
@@ -37,6 +40,13 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from src.recommendation import HousingRecommender
+from src.recommendation.building_store import BUILDING_VIEWS
+from src.recommendation.cascade import ROUTE_SKIP, CascadePolicy
+from src.recommendation.geocoding import CachedGeocoder
+from src.recommendation.jobs import JobStore
+from src.recommendation.llm_cache import LLMResponseCache
+from src.recommendation.openai_client import OPENAI_BASE_URL, OpenAIClient
+from src.recommendation.reloader import DataFileWatcher
 
 app = Flask(__name__)
 CORS(app)  # 允许跨域请求
@@ -53,26 +63,160 @@ EMBEDDING_PATHS = [
     BASE_DIR / "data/processed/buildings/san_mateo/buildings_with_embeddings.json",
     BASE_DIR / "data/processed/buildings/santa_clara/buildings_with_embeddings.json",
 ]
+# 预处理后的推荐器状态快照（源数据变化时自动重建）
+SNAPSHOT_DIR = BASE_DIR / "data/cache/recommender_snapshot"
+# 离线地名表（校园、地标、城市），与楼宇地址一起构成本地地理编码索引
+PLACES_PATH = BASE_DIR / "data/places/bay_area_places.json"
+# first: 离线精确命中优先，其余走HTTP，HTTP未命中再用离线近似匹配；only: 只用离线索引；off: 只用HTTP地理编码
+OFFLINE_GEOCODING = os.getenv("OFFLINE_GEOCODING", "first")
+# 地理编码持久缓存（SQLite）
+GEOCODE_CACHE_PATH = BASE_DIR / "data/cache/geocode_cache.sqlite3"
+# GPT排序结果缓存（相同问卷 -> 相同候选与提示词，直接复用结果）
+LLM_CACHE_PATH = BASE_DIR / "data/cache/llm_cache.sqlite3"
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))
+# OpenAI 客户端：连接池 + 并发上限 + 429/5xx 指数退避重试；OPENAI_HEDGE_AFTER>0 时开启对冲请求
+OPENAI_BASE_URL_SETTING = os.getenv("OPENAI_BASE_URL", OPENAI_BASE_URL)
+OPENAI_MAX_IN_FLIGHT = int(os.getenv("OPENAI_MAX_IN_FLIGHT", "8"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_HEDGE_AFTER = float(os.getenv("OPENAI_HEDGE_AFTER", "0"))
+# 单次推荐中模型调用的总时间预算（秒）
+RECOMMEND_BUDGET_SECONDS = float(os.getenv("RECOMMEND_BUDGET_SECONDS", "240"))
+# 同址去重距离（米，0 关闭）；DEDUPE_AT_LOAD=1 时加载数据后一次性划分同址房源，请求时不再逐条计算距离
+DEDUPE_RADIUS_M = float(os.getenv("DEDUPE_RADIUS_M", "30"))
+DEDUPE_AT_LOAD = os.getenv("DEDUPE_AT_LOAD", "0") == "1"
+# GPT排序调用使用 JSON schema 结构化输出（模型不支持时设为 0，按JSON数组解析）
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "1") == "1"
+# GPT精选使用的模型；CASCADE=1 时规则评分差距明显的请求改用小模型（或跳过GPT），
+# 差距小、有备注或风格偏好时才使用 GPT_MODEL。阈值为第3名与第4名的分差占第1名分数的比例，
+# CASCADE_SKIP_MARGIN 为空表示从不跳过（跳过时没有GPT推荐理由）
+GPT_MODEL = os.getenv("GPT_MODEL", "gpt-4o")
+CASCADE = os.getenv("CASCADE", "1") == "1"
+CASCADE_SMALL_MODEL = os.getenv("CASCADE_SMALL_MODEL", "gpt-4o-mini")
+CASCADE_SMALL_MARGIN = float(os.getenv("CASCADE_SMALL_MARGIN", "0.02"))
+CASCADE_SKIP_MARGIN = os.getenv("CASCADE_SKIP_MARGIN")
+# 异步推荐模式：GPT精选在后台线程执行，结果通过轮询或SSE获取
+RECOMMEND_JOB_WORKERS = int(os.getenv("RECOMMEND_JOB_WORKERS", "4"))
+RECOMMEND_JOB_TTL = float(os.getenv("RECOMMEND_JOB_TTL", "600"))
+# 任务状态共享存储：多 worker 部署时任意 worker 都能响应轮询/SSE
+RECOMMEND_JOB_STORE_PATH = BASE_DIR / "data/cache/jobs.sqlite3"
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_SECONDS = 300
+# 推荐结果 data 字段默认视图（summary / card / full），可用 ?view= 或 ?fields= 覆盖
+DEFAULT_RESULT_VIEW = os.getenv("DEFAULT_RESULT_VIEW", "card")
+# 检索接口单页最大候选数
+MAX_CANDIDATES_PER_PAGE = 200
+# 数据文件轮询间隔（秒），0 表示不自动热重载
+DATA_WATCH_INTERVAL = float(os.getenv("DATA_WATCH_INTERVAL", "0"))
+# 跨 worker 重载信号：/api/admin/reload 写入该文件，其他 worker 的监视线程在 RELOAD_POLL_INTERVAL 秒内跟随重载
+RELOAD_TRIGGER_PATH = BASE_DIR / "data/cache/reload.trigger"
+RELOAD_POLL_INTERVAL = float(os.getenv("RELOAD_POLL_INTERVAL", "5"))
+# 管理接口令牌（设置后 /api/admin/* 需要 X-Admin-Token 请求头）
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
 # 初始化推荐器（全局单例，避免重复加载数据）
 recommender = None
+data_watcher = None
+geocoder = None
+llm_cache = None
+job_store = None
+# 进程级资源（SQLite连接、线程池、监视线程）所属的进程；fork 出的 worker 需要重新创建
+_resources_pid = None
+_init_lock = threading.Lock()
 
 
-def init_recommender():
-    """延迟初始化推荐器"""
+def load_recommender():
+    """
+    加载建筑数据与索引（不创建任何连接或线程）
+    可在 gunicorn master 中预加载，workers fork 后以写时复制方式共享，嵌入矩阵通过 mmap 共享
+    """
     global recommender
-    if recommender is None:
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            print("⚠️  警告: OPENAI_API_KEY 未设置，将使用基于规则的推荐")
-        
-        recommender = HousingRecommender(
-            enriched_paths=[str(p) for p in ENRICHED_PATHS],
-            embedding_paths=[str(p) for p in EMBEDDING_PATHS],
-            openai_api_key=api_key,
-            gpt_model="gpt-4o",  # 使用gpt-4o模型
+    with _init_lock:
+        if recommender is None:
+            api_key = os.getenv("OPENAI_API_KEY")
+            openai_client = None
+            if api_key:
+                # 事件循环与连接池在每个进程首次调用时才创建，可以安全地在 master 中构造
+                openai_client = OpenAIClient(
+                    api_key,
+                    model=GPT_MODEL,
+                    base_url=OPENAI_BASE_URL_SETTING,
+                    max_in_flight=OPENAI_MAX_IN_FLIGHT,
+                    max_retries=OPENAI_MAX_RETRIES,
+                    hedge_after=OPENAI_HEDGE_AFTER or None,
+                )
+            else:
+                print("⚠️  警告: OPENAI_API_KEY 未设置，将使用基于规则的推荐")
+            
+            recommender = HousingRecommender(
+                enriched_paths=[str(p) for p in ENRICHED_PATHS],
+                embedding_paths=[str(p) for p in EMBEDDING_PATHS],
+                openai_api_key=api_key,
+                openai_client=openai_client,
+                request_budget_seconds=RECOMMEND_BUDGET_SECONDS or None,
+                dedupe_radius_m=DEDUPE_RADIUS_M or None,
+                dedupe_at_load=DEDUPE_AT_LOAD,
+                structured_output=STRUCTURED_OUTPUT,
+                cascade_policy=CascadePolicy(
+                    small_model=CASCADE_SMALL_MODEL,
+                    small_margin=CASCADE_SMALL_MARGIN,
+                    skip_margin=float(CASCADE_SKIP_MARGIN) if CASCADE_SKIP_MARGIN else None,
+                ) if CASCADE else None,
+                snapshot_dir=str(SNAPSHOT_DIR),
+                places_path=str(PLACES_PATH),
+                offline_geocoding=OFFLINE_GEOCODING,
+                gpt_model=GPT_MODEL,
+            )
+            print("✅ AI推荐器初始化完成")
+    return recommender
+
+
+def init_process_resources():
+    """创建当前进程的缓存连接、后台任务线程池和数据文件监视线程（不能跨 fork 共享）"""
+    global data_watcher, geocoder, llm_cache, job_store, _resources_pid
+    if _resources_pid == os.getpid():
+        return
+    load_recommender()
+    with _init_lock:
+        if _resources_pid == os.getpid():
+            return
+        geocoder = CachedGeocoder(cache_path=GEOCODE_CACHE_PATH)
+        # LLM_CACHE_TTL=0 关闭GPT结果缓存
+        llm_cache = LLMResponseCache(cache_path=LLM_CACHE_PATH, ttl_seconds=LLM_CACHE_TTL) if LLM_CACHE_TTL > 0 else None
+        recommender.geocoder = geocoder
+        recommender.llm_cache = llm_cache
+        job_store = JobStore(
+            max_workers=RECOMMEND_JOB_WORKERS,
+            ttl_seconds=RECOMMEND_JOB_TTL,
+            store_path=RECOMMEND_JOB_STORE_PATH,
         )
-        print("✅ AI推荐器初始化完成")
+
+        # 监视线程总是运行以接收重载信号；DATA_WATCH_INTERVAL>0 时同时监视数据文件
+        interval = min(DATA_WATCH_INTERVAL, RELOAD_POLL_INTERVAL) if DATA_WATCH_INTERVAL > 0 else RELOAD_POLL_INTERVAL
+        data_watcher = DataFileWatcher(
+            recommender,
+            interval_seconds=interval,
+            trigger_path=RELOAD_TRIGGER_PATH,
+            watch_sources=DATA_WATCH_INTERVAL > 0,
+        )
+        data_watcher.start()
+        if DATA_WATCH_INTERVAL > 0:
+            print(f"👀 数据文件热重载已开启（每 {interval:g} 秒检查）")
+        _resources_pid = os.getpid()
+
+
+def init_recommender():
+    """延迟初始化推荐器（数据 + 当前进程的资源）"""
+    init_process_resources()
+
+
+def create_app(preload: bool = True) -> Flask:
+    """
+    WSGI 应用工厂（gunicorn -c gunicorn.conf.py wsgi:app）
+    preload=True 时立即加载建筑数据；配合 preload_app 只在 master 中加载一次
+    """
+    if preload:
+        load_recommender()
+    return app
 
 
 def convert_questionnaire_to_request(data: Dict[str, Any]) -> Dict[str, Any]:
@@ -134,12 +278,44 @@ def convert_questionnaire_to_request(data: Dict[str, Any]) -> Dict[str, Any]:
     return request_data
 
 
+def convert_refined_preferences(refined: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    将前端细化偏好转换为 HousingRecommender.refine 的结构化约束
+    """
+    commute = None
+    if refined.get("commuteDestination"):
+        commute = {
+            "destination": refined["commuteDestination"],
+            "max_minutes": refined.get("maxCommuteTime", 30),
+        }
+    return {
+        "amenities": refined.get("amenities") or [],
+        "custom_amenities": refined.get("customAmenities"),
+        "commute": commute,
+        "notes": refined.get("additionalNotes"),
+    }
+
+
 @app.route("/health", methods=["GET"])
 def health_check():
     """健康检查接口"""
     return jsonify({"status": "ok", "service": "ai_recommendation"})
 
 
+@app.route("/api/ai/stats", methods=["GET"])
+def service_stats():
+    """运行指标：地理编码 / GPT结果缓存命中率、延迟等"""
+    init_recommender()
+    return jsonify({
+        "data_version": recommender.data_version,
+        "buildings": len(recommender._store),
+        "geocode_cache": geocoder.stats(),
+        "llm_cache": llm_cache.stats() if llm_cache else None,
+        "openai": recommender._openai_client.stats() if recommender.gpt_enabled else None,
+        "ranking": recommender.ranking_stats(),
+    })
+
+
 @app.route("/api/ai/recommend", methods=["POST"])
 def recommend():
     """
@@ -155,54 +331,68 @@ def recommend():
         if not questionnaire_data:
             return jsonify({"error": "请提供问卷数据"}), 400
         
+        try:
+            view, fields = parse_projection()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
         # 转换格式
         ai_request = convert_questionnaire_to_request(questionnaire_data)
         
         print(f"📥 收到推荐请求: {json.dumps(ai_request, indent=2, ensure_ascii=False)}")
         
+        # ?async=1：立即返回规则评分结果，GPT精选在后台执行
+        run_async = request.args.get("async") in ("1", "true") and recommender.gpt_enabled
+        
         # 调用推荐器
-        result = recommender.recommend(ai_request)
+        result = recommender.recommend(ai_request, use_gpt=not run_async)
         
         # 提取推荐结果（现在包含ID和推荐理由）
         final_recommendations = result.get("final_recommendations", [])
         top20 = result.get("top20", [])
+        store = result.get("store")
         
         # 获取完整的建筑信息
-        recommendations = []
-        for rec in final_recommendations:
-            # rec 现在是 {'id': 'building_xxxx', 'reasons': ['reason1', 'reason2', 'reason3']}
-            building_id = rec.get('id') if isinstance(rec, dict) else rec
-            reasons = rec.get('reasons', []) if isinstance(rec, dict) else []
-            
-            # 从top20中找到对应的建筑
-            building = next((b for b in top20 if b["building_id"] == building_id), None)
-            if building:
-                recommendations.append({
-                    "building_id": building["building_id"],
-                    "name": building.get("name"),
-                    "address": building.get("address"),
-                    "county": building.get("county"),
-                    "score": building.get("total_score"),
-                    "tag_scores": building.get("tag_scores", {}),
-                    "data": building.get("data", {}),
-                    "reasons": reasons,  # 添加推荐理由
-                })
+        recommendations = build_recommendations(final_recommendations, top20, view, fields, store)
+        
+        selection = result.get("selection")
+        job = None
+        if run_async and top20:
+            decision = recommender.plan_selection(ai_request, top20, final_count=None)
+            selection = decision.to_dict()
+        if run_async and top20 and decision.route == ROUTE_SKIP:
+            # 级联判定无需调用GPT：评分结果即为最终结果，不创建后台任务
+            final_recommendations = recommender.select_with_gpt(ai_request, top20, final_count=None, decision=decision)
+            recommendations = build_recommendations(final_recommendations, top20, view, fields, store)
+        elif run_async and top20:
+            job_id = job_store.submit(
+                lambda: build_recommendations(
+                    recommender.select_with_gpt(ai_request, top20, final_count=None, decision=decision),
+                    top20,
+                    view,
+                    fields,
+                    store,
+                )
+            )
+            job = {
+                "job_id": job_id,
+                "status": "pending",
+                "poll_url": f"/api/ai/recommend/jobs/{job_id}",
+                "events_url": f"/api/ai/recommend/jobs/{job_id}/events",
+            }
+            print(f"⏳ GPT精选已转入后台任务: {job_id}")
         
         print(f"✅ 推荐完成: {len(recommendations)} 个建筑")
         
         return jsonify({
             "success": True,
             "recommendations": recommendations,
-            "top20": [
-                {
-                    "building_id": b["building_id"],
-                    "name": b.get("name"),
-                    "address": b.get("address"),
-                    "county": b.get("county"),
-                    "score": b.get("total_score"),
-                }
-                for b in top20
-            ],
+            # 异步模式下 recommendations 是按评分的临时前3名，GPT结果见 job
+            "provisional": job is not None,
+            "job": job,
+            # 级联路径：route 为 skip / small / large，model 为实际使用的模型
+            "selection": selection,
+            "top20": summarize_candidates(top20),
         })
     
     except Exception as e:
@@ -212,15 +402,251 @@ def recommend():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/ai/recommend/stream", methods=["POST"])
+def recommend_stream():
+    """
+    流式推荐接口（SSE）：请求体与 /api/ai/recommend 相同
+    先发送 candidates 事件（规则评分的候选列表），随后GPT每写完一个推荐就发送一个
+    recommendation 事件，最后发送 done 事件；GPT不可用或无有效输出时按评分前3名回退
+    处理过程中出错时先发送 error 事件，再发送 done 事件结束
+    """
+    init_recommender()
+    questionnaire_data = request.get_json()
+    if not questionnaire_data:
+        return jsonify({"error": "请提供问卷数据"}), 400
+    try:
+        view, fields = parse_projection()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    def stream():
+        started = time.monotonic()
+        count = 0
+        try:
+            ai_request = convert_questionnaire_to_request(questionnaire_data)
+            print(f"📥 收到流式推荐请求: {json.dumps(ai_request, indent=2, ensure_ascii=False)}")
+            result = recommender.recommend(ai_request, use_gpt=False)
+            top20 = result.get("top20", [])
+            store = result.get("store")
+            decision = recommender.plan_selection(ai_request, top20, final_count=None) if top20 else None
+            yield sse_event("candidates", {
+                "top20": summarize_candidates(top20),
+                "selection": decision.to_dict() if decision else None,
+            })
+            if top20:
+                for pick in recommender.stream_select_with_gpt(ai_request, top20, final_count=None, decision=decision):
+                    for recommendation in build_recommendations([pick], top20, view, fields, store):
+                        if not count:
+                            print(f"⚡ 首个推荐已发送: {time.monotonic() - started:.2f}s")
+                        count += 1
+                        yield sse_event("recommendation", recommendation)
+        except Exception as e:
+            # 任何异常都以 error + done 事件结束，客户端不会一直等待
+            print(f"❌ 流式推荐失败: {e}")
+            import traceback
+            traceback.print_exc()
+            yield sse_event("error", {"error": str(e)})
+            yield sse_event("done", {"count": count, "error": True})
+            return
+        print(f"✅ 流式推荐完成: {count} 个建筑, {time.monotonic() - started:.2f}s")
+        yield sse_event("done", {"count": count})
+    
+    return Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def summarize_candidates(candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """响应中的 top20 列表：只保留ID、名称、地址和评分"""
+    return [
+        {
+            "building_id": b["building_id"],
+            "name": b.get("name"),
+            "address": b.get("address"),
+            "county": b.get("county"),
+            "score": b.get("total_score"),
+        }
+        for b in candidates
+    ]
+
+
+def parse_projection(default_view: str = DEFAULT_RESULT_VIEW) -> Tuple[str, Optional[List[str]]]:
+    """
+    解析 ?view=summary|card|full 与 ?fields=a,b,c（fields 优先），决定 data 字段内容
+    """
+    view = request.args.get("view", default_view)
+    if view not in BUILDING_VIEWS:
+        raise ValueError(f"view 必须是 {', '.join(BUILDING_VIEWS)} 之一")
+    fields = [f.strip() for f in request.args.get("fields", "").split(",") if f.strip()]
+    return view, fields or None
+
+
+def build_recommendations(
+    final_recommendations: List[Any],
+    candidates: List[Dict[str, Any]],
+    view: str = DEFAULT_RESULT_VIEW,
+    fields: Optional[List[str]] = None,
+    store: Optional[Any] = None,
+) -> List[Dict[str, Any]]:
+    """
+    把GPT选出的 {'id', 'reasons'} 映射为推荐列表，data 按视图/字段投影
+    建筑数据通过 get_buildings 一次批量按ID查询；不在候选列表中的ID（模型编造或过期）会被丢弃
+    store 为 recommend() 结果中的数据快照：即使期间发生了重载，数据也与候选列表一致
+    """
+    by_id = {b["building_id"]: b for b in candidates}
+    picks = []
+    for rec in final_recommendations:
+        # rec 现在是 {'id': 'building_xxxx', 'reasons': ['reason1', 'reason2', 'reason3']}
+        building_id = rec.get('id') if isinstance(rec, dict) else rec
+        reasons = rec.get('reasons', []) if isinstance(rec, dict) else []
+        if building_id in by_id:
+            picks.append((building_id, reasons))
+        else:
+            print(f"⚠️ 推荐结果中的ID不在候选列表中，已忽略: {building_id}")
+    
+    buildings = recommender.get_buildings(
+        [building_id for building_id, _ in picks], view=view, fields=fields, store=store
+    )
+    recommendations = []
+    for building_id, reasons in picks:
+        building = by_id[building_id]
+        recommendations.append({
+            "building_id": building["building_id"],
+            "name": building.get("name"),
+            "address": building.get("address"),
+            "county": building.get("county"),
+            "score": building.get("total_score"),
+            "tag_scores": building.get("tag_scores", {}),
+            "data": buildings.get(building_id, {}),
+            "reasons": reasons,  # 添加推荐理由
+        })
+    return recommendations
+
+
+def job_payload(state: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "job_id": state["job_id"],
+        "status": state["status"],
+        "recommendations": state["result"],
+        "error": state["error"],
+    }
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route("/api/ai/recommend/jobs/<job_id>", methods=["GET"])
+def recommend_job_status(job_id: str):
+    """轮询异步推荐任务：status 为 done 时 recommendations 为GPT精选结果"""
+    init_recommender()
+    state = job_store.get(job_id)
+    if state is None:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(job_payload(state))
+
+
+@app.route("/api/ai/recommend/jobs/<job_id>/events", methods=["GET"])
+def recommend_job_events(job_id: str):
+    """
+    SSE订阅异步推荐任务：先发送 status 事件，完成后发送 result（或 error）事件并关闭连接
+    等待期间每 SSE_HEARTBEAT_SECONDS 秒发送一次注释行保持连接
+    """
+    init_recommender()
+    state = job_store.get(job_id)
+    if state is None:
+        return jsonify({"error": "job not found"}), 404
+    
+    def stream():
+        current = state
+        yield sse_event("status", {"job_id": job_id, "status": current["status"]})
+        deadline = time.monotonic() + SSE_MAX_SECONDS
+        while current["status"] not in ("done", "failed") and time.monotonic() < deadline:
+            current = job_store.wait(job_id, SSE_HEARTBEAT_SECONDS) or current
+            if current["status"] not in ("done", "failed"):
+                yield ": keep-alive\n\n"
+        if current["status"] == "done":
+            yield sse_event("result", job_payload(current))
+        elif current["status"] == "failed":
+            yield sse_event("error", job_payload(current))
+        else:
+            yield sse_event("timeout", {"job_id": job_id, "status": current["status"]})
+    
+    return Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/api/buildings/<building_id>", methods=["GET"])
+def building_detail(building_id: str):
+    """建筑详情：默认返回完整原始记录，?view= / ?fields= 可投影"""
+    init_recommender()
+    try:
+        view, fields = parse_projection(default_view="full")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    building = recommender.get_building(building_id, view=view, fields=fields)
+    if building is None:
+        return jsonify({"error": "building not found"}), 404
+    return jsonify({"success": True, "building_id": building_id, "data": building})
+
+
+@app.route("/api/ai/candidates", methods=["POST"])
+def retrieve_candidates():
+    """
+    检索接口：只做过滤与评分（不调用GPT），返回精简的候选列表
+    供地图视图、分页列表、A/B实验使用；?k=20&offset=0 分页
+    """
+    try:
+        init_recommender()
+        
+        questionnaire_data = request.get_json()
+        if not questionnaire_data:
+            return jsonify({"error": "请提供问卷数据"}), 400
+        
+        try:
+            k = int(request.args.get("k", 20))
+            offset = int(request.args.get("offset", 0))
+        except ValueError:
+            return jsonify({"error": "k 和 offset 必须是整数"}), 400
+        if not 0 < k <= MAX_CANDIDATES_PER_PAGE or offset < 0:
+            return jsonify({"error": f"k 必须在 1-{MAX_CANDIDATES_PER_PAGE} 之间，offset 不能为负"}), 400
+        
+        ai_request = convert_questionnaire_to_request(questionnaire_data)
+        result = recommender.retrieve_candidates(ai_request, k=k, offset=offset)
+        
+        return jsonify({
+            "success": True,
+            "k": k,
+            "offset": offset,
+            **result,
+        })
+    
+    except Exception as e:
+        print(f"❌ 候选检索失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/api/ai/recommend/refine", methods=["POST"])
 def refine_recommend():
     """
     细化推荐接口：基于用户的细化偏好，返回40个候选给GPT重新推荐
+    细化偏好（设施、通勤）作为结构化约束传给推荐器，每次请求只调用一次GPT
     """
     try:
         init_recommender()
         
         data = request.get_json()
+        try:
+            view, fields = parse_projection()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         original = data.get("original", {})
         refined = data.get("refined", {})
         
@@ -230,74 +656,20 @@ def refine_recommend():
         
         # 转换为recommender需要的格式
         request_data = convert_questionnaire_to_request(data)
-        
-        # 添加细化偏好到请求
-        refined_text_parts = []
-        
-        # 设施偏好
-        if refined.get("amenities"):
-            amenities_text = ", ".join(refined["amenities"])
-            refined_text_parts.append(f"Required amenities: {amenities_text}")
-        
-        if refined.get("customAmenities"):
-            refined_text_parts.append(f"Additional amenities: {refined['customAmenities']}")
-        
-        # 通勤偏好
-        if refined.get("commuteDestination"):
-            max_time = refined.get("maxCommuteTime", 30)
-            refined_text_parts.append(f"Commute to {refined['commuteDestination']} within {max_time} minutes")
-        
-        # 其他需求
-        if refined.get("additionalNotes"):
-            refined_text_parts.append(f"Additional requirements: {refined['additionalNotes']}")
-        
-        # 合并细化偏好文本
-        refined_text = "; ".join(refined_text_parts) if refined_text_parts else None
-        if refined_text:
-            # 将细化偏好添加到notes字段
-            existing_notes = request_data.get("notes", "")
-            request_data["notes"] = f"{existing_notes}; REFINED PREFERENCES: {refined_text}" if existing_notes else f"REFINED PREFERENCES: {refined_text}"
+        refinements = convert_refined_preferences(refined)
         
         print(f"📝 转换后的请求数据: {json.dumps(request_data, indent=2, ensure_ascii=False)}")
         
-        # 获取推荐结果（返回top40）
-        result = recommender.recommend(request_data, return_top_n=40)  # 请求40个候选
-        
-        # 从top40中提取前20个和后20个
+        # 生成40个候选并让GPT精选3个（只调用一次模型）
+        result = recommender.refine(request_data, refinements, candidate_count=40, final_count=3)
         top40 = result.get("top20", [])  # 实际是top40
-        first_20 = top40[:20]
-        second_20 = top40[20:40] if len(top40) > 20 else []
-        
-        print(f"✅ 获得 {len(first_20)} + {len(second_20)} = {len(top40)} 个候选建筑")
-        
-        # 让GPT从40个中选择最佳3个
-        gpt_results = recommender._select_top_with_gpt(
-            top40, 
-            request_data,
-            final_count=3
-        )
         
-        # 提取推荐结果
-        final_recommendations = result.get("final_recommendations", gpt_results)
+        print(f"✅ 获得 {len(top40)} 个候选建筑")
         
         # 获取完整的建筑信息
-        recommendations = []
-        for rec in final_recommendations:
-            building_id = rec.get('id') if isinstance(rec, dict) else rec
-            reasons = rec.get('reasons', []) if isinstance(rec, dict) else []
-            
-            building = next((b for b in top40 if b["building_id"] == building_id), None)
-            if building:
-                recommendations.append({
-                    "building_id": building["building_id"],
-                    "name": building.get("name"),
-                    "address": building.get("address"),
-                    "county": building.get("county"),
-                    "score": building.get("total_score"),
-                    "tag_scores": building.get("tag_scores", {}),
-                    "data": building.get("data", {}),
-                    "reasons": reasons,
-                })
+        recommendations = build_recommendations(
+            result.get("final_recommendations", []), top40, view, fields, result.get("store")
+        )
         
         print(f"🎯 最终返回 {len(recommendations)} 个细化推荐")
         
@@ -306,6 +678,7 @@ def refine_recommend():
             "recommendations": recommendations,
             "top40_count": len(top40),
             "refined_preferences": refined,
+            "selection": result.get("selection"),
         })
     
     except Exception as e:
@@ -315,6 +688,40 @@ def refine_recommend():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/admin/reload", methods=["POST"])
+def reload_data():
+    """
+    热重载建筑数据：后台构建新数据集后原子替换，进行中的请求继续使用旧数据
+    ?wait=1 时同步等待当前 worker 重载完成；其他 worker 通过重载信号文件在 RELOAD_POLL_INTERVAL 秒内跟随重载
+    """
+    if ADMIN_TOKEN and request.headers.get("X-Admin-Token") != ADMIN_TOKEN:
+        return jsonify({"error": "unauthorized"}), 401
+    
+    try:
+        init_recommender()
+        
+        if request.args.get("wait") in ("1", "true"):
+            reloaded = recommender.reload()
+            status = 200 if reloaded else 409
+        else:
+            reloaded = recommender.reload_async()
+            status = 202 if reloaded else 409
+        broadcast = reloaded and data_watcher.broadcast()
+        
+        return jsonify({
+            "success": reloaded,
+            "message": None if reloaded else "reload already in progress",
+            "data_version": recommender.data_version,
+            "broadcast": broadcast,
+        }), status
+    
+    except Exception as e:
+        print(f"❌ 数据重载失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/api/ai/test", methods=["POST"])
 def test_recommend():
     """
@@ -355,6 +762,7 @@ if __name__ == "__main__":
     # 预加载推荐器
     init_recommender()
     
-    # 启动服务器
-    app.run(host="0.0.0.0", port=5001, debug=True)
+    # 启动开发服务器（多线程；FLASK_DEBUG=1 开启调试与自动重载）
+    # 生产环境请使用: gunicorn -c gunicorn.conf.py wsgi:app
+    app.run(host="0.0.0.0", port=5001, debug=os.getenv("FLASK_DEBUG") == "1", threaded=True)
 
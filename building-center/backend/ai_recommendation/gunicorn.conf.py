@@ -0,0 +1,37 @@
+"""
+gunicorn 配置（生产环境）
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+环境变量：
+    BIND                监听地址，默认 0.0.0.0:5001
+    WEB_CONCURRENCY     worker 进程数，默认 2
+    GUNICORN_THREADS    每个 worker 的线程数，默认 8（GPT 调用阻塞时其他请求仍可处理）
+    GUNICORN_TIMEOUT    请求超时秒数，默认 300（GPT 调用最长 240 秒）
+    PRELOAD_APP         1（默认）在 master 中预加载数据，workers 写时复制共享；0 关闭
+"""
+import gc
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5001")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+graceful_timeout = 30
+keepalive = 5
+preload_app = os.getenv("PRELOAD_APP", "1") != "0"
+accesslog = "-"
+
+
+def when_ready(server):
+    # 预加载的对象移出 GC 跟踪，避免 workers 中的垃圾回收写入这些页面而破坏写时复制共享
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    # SQLite 连接、线程池、监视线程不能跨 fork 共享，在每个 worker 中单独创建
+    import api_server
+
+    api_server.init_process_resources()
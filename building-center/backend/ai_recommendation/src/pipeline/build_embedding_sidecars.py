@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+把 buildings_with_embeddings.json 转换为二进制旁路文件
+
+每个 JSON 旁边生成：
+    buildings_with_embeddings.npy       float32 (n, dim)，行已单位归一化
+    buildings_with_embeddings.ids.json  与矩阵行顺序一致的 building_id 列表
+
+推荐器启动时会内存映射这些文件；缺失或比 JSON 旧时自动回退到解析 JSON。
+数据更新后重新运行本脚本即可。
+
+使用方法（在 backend/ai_recommendation 目录下）：
+    python -m src.pipeline.build_embedding_sidecars
+    python -m src.pipeline.build_embedding_sidecars path/to/buildings_with_embeddings.json
+"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import Optional, Sequence
+
+from src.recommendation.embedding_index import write_sidecar
+
+DEFAULT_DATA_DIR = Path(__file__).resolve().parents[2] / "data/processed/buildings"
+EMBEDDING_JSON_NAME = "buildings_with_embeddings.json"
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="将 embedding JSON 转换为 .npy 旁路文件")
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        type=Path,
+        help=f"embedding JSON 文件（默认：{DEFAULT_DATA_DIR} 下所有 {EMBEDDING_JSON_NAME}）",
+    )
+    args = parser.parse_args(argv)
+
+    paths = args.paths or sorted(DEFAULT_DATA_DIR.glob(f"*/{EMBEDDING_JSON_NAME}"))
+    if not paths:
+        print("⚠️ 未找到 embedding 文件")
+        return
+
+    for json_path in paths:
+        matrix_path, ids_path = write_sidecar(json_path)
+        size_mb = matrix_path.stat().st_size / 1e6
+        print(f"✅ {json_path} -> {matrix_path.name} ({size_mb:.2f} MB) + {ids_path.name}")
+
+
+if __name__ == "__main__":
+    main()
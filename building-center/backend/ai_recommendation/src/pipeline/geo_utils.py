@@ -11,9 +11,14 @@ from __future__ import annotations
 import math
 from typing import Tuple
 
+import numpy as np
+
 # 地球半径（英里）- WGS84椭球体平均半径
 R_MILES = 3958.7613
 
+# 1 英里 = 1609.344 米
+METERS_PER_MILE = 1609.344
+
 # 角度转换常数
 DEG_PER_RADIAN = 180.0 / math.pi
 RADIAN_PER_DEG = math.pi / 180.0
@@ -34,21 +39,25 @@ def bbox_thresholds(lat_deg: float, radius_miles: float) -> Tuple[float, float]:
         (dlat_deg, dlon_deg): 纬度阈值和经度阈值（度）
     
     算法：
-        dlat = (radius / R) * (180/π)
-        dlon = (radius / (R * cos(φ))) * (180/π)
+        δ = radius / R（角半径）
+        dlat = δ * (180/π)
+        dlon = asin(sin(δ) / cos(φ)) * (180/π)   圆上各点的最大经度差
     
     注意：
-        - 经度阈值根据纬度动态计算，避免高/低纬度误差
-        - 在极地附近（cos(φ)→0），使用最小值防止数值发散
+        - 经度阈值取圆的精确经度半宽，而不是 δ / cos(φ)（后者偏小，
+          大半径或高纬度时会漏掉圆内的点）
+        - 圆覆盖极点（sin(δ) >= cos(φ)）时经度阈值为 180，即不按经度过滤
     """
+    angular_radius = radius_miles / R_MILES
+    
     # 纬度阈值（全球一致）
-    dlat_deg = (radius_miles / R_MILES) * DEG_PER_RADIAN
+    dlat_deg = angular_radius * DEG_PER_RADIAN
     
     # 经度阈值（随纬度变化）
     cos_lat = math.cos(math.radians(lat_deg))
-    # 防止极地附近cos(φ)→0导致的数值问题
-    cos_lat = max(cos_lat, 1e-12)
-    dlon_deg = (radius_miles / (R_MILES * cos_lat)) * DEG_PER_RADIAN
+    if angular_radius >= math.pi / 2 or math.sin(angular_radius) >= cos_lat:
+        return dlat_deg, 180.0
+    dlon_deg = math.asin(math.sin(angular_radius) / cos_lat) * DEG_PER_RADIAN
     
     return dlat_deg, dlon_deg
 
@@ -231,6 +240,128 @@ def filter_nearby_points(
     return nearby
 
 
+# ============================================================================
+# 向量化版本（NumPy 数组，一次处理整批坐标）
+# ============================================================================
+
+def lon_diff_deg_array(lon1: float, lons: np.ndarray) -> np.ndarray:
+    """
+    lon_diff_deg 的数组版本：基准经度与一组经度之间的最短角度差（度）
+    
+    Args:
+        lon1: 基准经度（度）
+        lons: 经度数组（度）
+    
+    Returns:
+        与 lons 同形状的角度差数组，范围 [0, 180]
+    """
+    diff = np.abs(np.asarray(lons, dtype=float) - lon1) % 360.0
+    return np.minimum(diff, 360.0 - diff)
+
+
+def haversine_distance_array(
+    lat1: float,
+    lon1: float,
+    lats: np.ndarray,
+    lons: np.ndarray
+) -> np.ndarray:
+    """
+    haversine_distance 的数组版本：一个中心点到一组点的大圆距离（英里）
+    
+    Args:
+        lat1, lon1: 中心点纬度、经度（度）
+        lats, lons: 目标点纬度、经度数组（度）
+    
+    Returns:
+        距离数组（英里）；缺失坐标（NaN）对应的距离为 NaN
+    
+    注意：
+        - 与标量版本使用相同的换日线处理（lon_diff_deg_array）
+    """
+    lats = np.asarray(lats, dtype=float)
+    phi1 = math.radians(lat1)
+    phi2 = np.radians(lats)
+    delta_phi = np.radians(lats - lat1)
+    delta_lambda = np.radians(lon_diff_deg_array(lon1, lons))
+    
+    a = (
+        np.sin(delta_phi / 2) ** 2 +
+        math.cos(phi1) * np.cos(phi2) * np.sin(delta_lambda / 2) ** 2
+    )
+    
+    c = 2 * np.arcsin(np.sqrt(a))
+    
+    return R_MILES * c
+
+
+def within_radius_mask(
+    center_lat: float,
+    center_lon: float,
+    lats: np.ndarray,
+    lons: np.ndarray,
+    radius_miles: float
+) -> np.ndarray:
+    """
+    is_within_radius 的数组版本：返回布尔掩码
+    
+    同样是两步过滤：先用 bbox_thresholds 做矩形粗滤（阈值只算一次），
+    再只对通过粗滤的点计算 Haversine。
+    
+    Args:
+        center_lat, center_lon: 中心点坐标
+        lats, lons: 目标点坐标数组（缺失值用 NaN 表示）
+        radius_miles: 搜索半径（英里）
+    
+    Returns:
+        布尔数组，True 表示距离 <= radius_miles；NaN 坐标一律为 False
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    
+    # Step 1: 粗略过滤（NaN 比较结果为 False，自动排除缺失坐标）
+    dlat_threshold, dlon_threshold = bbox_thresholds(center_lat, radius_miles)
+    mask = (
+        (np.abs(lats - center_lat) <= dlat_threshold) &
+        (lon_diff_deg_array(center_lon, lons) <= dlon_threshold)
+    )
+    
+    # Step 2: 精确计算（仅对候选点）
+    candidates = np.flatnonzero(mask)
+    if candidates.size:
+        distances = haversine_distance_array(center_lat, center_lon, lats[candidates], lons[candidates])
+        mask[candidates] = distances <= radius_miles
+    
+    return mask
+
+
+def count_nearby_points_array(
+    center_lat: float,
+    center_lon: float,
+    lats: np.ndarray,
+    lons: np.ndarray,
+    radius_miles: float
+) -> int:
+    """count_nearby_points 的数组版本：返回半径内的点数量"""
+    return int(np.count_nonzero(within_radius_mask(center_lat, center_lon, lats, lons, radius_miles)))
+
+
+def filter_nearby_indices(
+    center_lat: float,
+    center_lon: float,
+    lats: np.ndarray,
+    lons: np.ndarray,
+    radius_miles: float
+) -> np.ndarray:
+    """
+    filter_nearby_points 的数组版本：返回半径内的点的下标（升序）
+    
+    示例：
+        idx = filter_nearby_indices(37.75, -122.42, lat_array, lon_array, 1.0)
+        nearby = [buildings[i] for i in idx]
+    """
+    return np.flatnonzero(within_radius_mask(center_lat, center_lon, lats, lons, radius_miles))
+
+
 # ============================================================================
 # 性能测试和验证
 # ============================================================================
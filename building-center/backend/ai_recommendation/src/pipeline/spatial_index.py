@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+均匀经纬度网格空间索引
+
+在加载时把所有点按网格单元分桶，半径查询时只访问与
+bbox_thresholds 矩形相交的单元，再对这些单元内的点做精确 Haversine 判断。
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+
+from src.pipeline.geo_utils import bbox_thresholds, within_radius_mask
+
+# 默认单元大小（度）：约 1.4 英里（纬度方向），适合 1–5 英里的校园周边查询
+DEFAULT_CELL_SIZE_DEG = 0.02
+
+
+class GridIndex:
+    """
+    经纬度网格索引（只读）
+
+    Args:
+        lats, lons: 点坐标数组（度），缺失坐标用 NaN 表示，不会被索引
+        cell_size_deg: 网格单元边长（度）
+
+    示例：
+        index = GridIndex(lat_array, lon_array)
+        rows = index.query_radius(37.7225, -122.4777, 3.0)
+    """
+
+    def __init__(self, lats: np.ndarray, lons: np.ndarray, cell_size_deg: float = DEFAULT_CELL_SIZE_DEG) -> None:
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.cell_size_deg = float(cell_size_deg)
+        self.n_lon_cells = max(1, int(math.ceil(360.0 / self.cell_size_deg)))
+
+        valid_rows = np.flatnonzero(~np.isnan(self.lats) & ~np.isnan(self.lons))
+        cell_i = self._lat_cell(self.lats[valid_rows])
+        cell_j = self._lon_cell(self.lons[valid_rows])
+
+        # 按单元排序后，每个单元对应 self._rows 中的一段连续区间
+        order = np.lexsort((valid_rows, cell_j, cell_i))
+        self._rows = valid_rows[order]
+        sorted_i = cell_i[order]
+        sorted_j = cell_j[order]
+
+        self._cells: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        if self._rows.size:
+            boundaries = np.flatnonzero((np.diff(sorted_i) != 0) | (np.diff(sorted_j) != 0)) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [self._rows.size]))
+            for start, end in zip(starts, ends):
+                self._cells[(int(sorted_i[start]), int(sorted_j[start]))] = (int(start), int(end))
+
+    def __len__(self) -> int:
+        return int(self._rows.size)
+
+    @property
+    def cell_count(self) -> int:
+        return len(self._cells)
+
+    def _lat_cell(self, lats: np.ndarray) -> np.ndarray:
+        return np.floor((np.asarray(lats) + 90.0) / self.cell_size_deg).astype(np.int64)
+
+    def _lon_cell(self, lons: np.ndarray) -> np.ndarray:
+        wrapped = (np.asarray(lons) + 180.0) % 360.0
+        return np.floor(wrapped / self.cell_size_deg).astype(np.int64) % self.n_lon_cells
+
+    def _cells_in_bbox(self, lat: float, lon: float, radius_miles: float) -> Iterable[Tuple[int, int]]:
+        """枚举与查询矩形相交的已占用单元（处理换日线回绕）"""
+        dlat, dlon = bbox_thresholds(lat, radius_miles)
+        i0 = int(self._lat_cell(max(-90.0, lat - dlat)))
+        i1 = int(self._lat_cell(min(90.0, lat + dlat)))
+
+        if 2 * dlon >= 360.0:
+            lon_cells = None  # 覆盖全部经度
+            n_lon = self.n_lon_cells
+        else:
+            j0 = int(self._lon_cell(lon - dlon))
+            n_lon = (int(self._lon_cell(lon + dlon)) - j0) % self.n_lon_cells + 1
+            lon_cells = [(j0 + k) % self.n_lon_cells for k in range(n_lon)]
+
+        # 矩形覆盖的单元比已占用单元还多时，直接遍历已占用单元
+        if (i1 - i0 + 1) * n_lon > len(self._cells):
+            lon_set = None if lon_cells is None else set(lon_cells)
+            return [
+                key for key in self._cells
+                if i0 <= key[0] <= i1 and (lon_set is None or key[1] in lon_set)
+            ]
+
+        if lon_cells is None:
+            lon_cells = range(self.n_lon_cells)
+        return [(i, j) for i in range(i0, i1 + 1) for j in lon_cells if (i, j) in self._cells]
+
+    def candidate_rows(self, lat: float, lon: float, radius_miles: float) -> np.ndarray:
+        """返回与查询矩形相交单元内的所有点（未做精确距离判断）"""
+        spans = [self._cells[key] for key in self._cells_in_bbox(lat, lon, radius_miles)]
+        if not spans:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self._rows[start:end] for start, end in spans])
+
+    def query_radius(self, lat: float, lon: float, radius_miles: float) -> np.ndarray:
+        """
+        半径查询：返回距离 <= radius_miles 的点下标（升序）
+
+        结果与 filter_nearby_indices(lat, lon, lats, lons, radius_miles) 一致。
+        """
+        candidates = self.candidate_rows(lat, lon, radius_miles)
+        if candidates.size == 0:
+            return candidates
+        mask = within_radius_mask(lat, lon, self.lats[candidates], self.lons[candidates], radius_miles)
+        return np.sort(candidates[mask])
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Columnar building store built once at load time.
+
+The recommender used to walk the raw enriched JSON dicts with ``.get()`` chains
+on every request. ``BuildingStore`` extracts the numeric fields the filter and
+scoring stages need into flat NumPy arrays (one row per building) so that those
+stages can work on row-index arrays instead of lists of dicts.
+"""
+from __future__ import annotations
+
+import copy
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.pipeline.spatial_index import GridIndex
+from src.recommendation.embedding_index import EmbeddingBlock
+from src.recommendation.utils import ensure_list, parse_float
+
+# nearby_pois.categories 中出现的全部类别
+POI_CATEGORIES = ("dining", "shopping", "entertainment", "fitness", "healthcare", "education", "parks")
+
+# 每个评分标签使用的原始特征（tag_features 的列顺序）
+TAG_FEATURE_COLUMNS = (
+    "crime_incidents",   # Safety
+    "transit_total",     # Public Transit / Commute fallback
+    "commute_minutes",   # Commute
+    "grocery_pois",      # Near Grocery: dining + shopping
+    "lifestyle_pois",    # Lifestyle: entertainment + fitness
+    "car_score",         # Car Friendly
+    "pet_friendly",      # Pet Friendly: 1.0 if any amenity mentions pet/dog/cat
+    "amenity_count",     # Amenities
+)
+TAG_FEATURE_INDEX = {name: idx for idx, name in enumerate(TAG_FEATURE_COLUMNS)}
+PET_KEYWORDS = ("pet", "dog", "cat")
+
+# 推荐结果 data 字段的预定义视图；full 为完整原始记录
+SUMMARY_FIELDS = ("building_id", "title", "address", "county", "lat", "lon")
+CARD_FIELDS = SUMMARY_FIELDS + (
+    "type", "pricing", "rentcast_data", "image_path", "review_rating", "review_count", "website",
+)
+# 卡片视图只保留嵌套统计中的评级/总数，不带 by_category 等明细
+CARD_NESTED_FIELDS = {
+    "crime_stats": ("total_incidents", "safety_score"),
+    "transit_accessibility": ("total_transit", "transit_score"),
+    "car_friendly": ("car_score", "car_friendly_rating"),
+}
+BUILDING_VIEWS = ("summary", "card", "full")
+
+
+@dataclass
+class BuildingRecord:
+    building_id: str
+    county: str
+    data: Dict[str, Any]
+
+
+class BuildingStore:
+    """
+    Row-aligned arrays over a list of ``BuildingRecord``.
+
+    Missing coordinates / commute times are stored as NaN; missing counters are
+    stored as 0 (matching the ``or 0`` defaults the scoring code always used).
+
+    Embeddings stay in their source ``EmbeddingBlock`` matrices (contiguous
+    float32, unit-normalized rows, possibly memory-mapped sidecars) and are not
+    copied: ``embedding_block[row]`` / ``embedding_row[row]`` locate a building's
+    vector (-1 when it has none).
+    """
+
+    def __init__(
+        self,
+        records: Sequence[BuildingRecord],
+        embeddings: Optional[Sequence[EmbeddingBlock]] = None,
+    ) -> None:
+        self.records: List[BuildingRecord] = list(records)
+        n = len(self.records)
+
+        self.ids: List[str] = [r.building_id for r in self.records]
+        self.id_to_row: Dict[str, int] = {building_id: row for row, building_id in enumerate(self.ids)}
+
+        self.lat = np.full(n, np.nan)
+        self.lon = np.full(n, np.nan)
+        self.crime_incidents = np.zeros(n)
+        self.transit_total = np.zeros(n)
+        self.commute_minutes = np.full(n, np.nan)
+        self.car_score = np.zeros(n)
+        self.amenity_count = np.zeros(n)
+        self.pet_friendly = np.zeros(n, dtype=bool)
+        self.poi_counts: Dict[str, np.ndarray] = {cat: np.zeros(n) for cat in POI_CATEGORIES}
+
+        # 每种卧室数的最低租金（rentcast_data）、不区分卧室数的最低租金、pricing 字符串中的最低价
+        self.rent_min_by_bedrooms: Dict[Any, np.ndarray] = {}
+        self.rent_min_any = np.full(n, np.nan)
+        self.pricing_min = np.full(n, np.nan)
+
+        for row, record in enumerate(self.records):
+            self._fill_row(row, record.data)
+
+        # 评分用的特征表：一次 gather 即可取出候选行的全部原始特征
+        self.tag_features = np.column_stack([
+            self.crime_incidents,
+            self.transit_total,
+            self.commute_minutes,
+            self.poi_counts["dining"] + self.poi_counts["shopping"],
+            self.poi_counts["entertainment"] + self.poi_counts["fitness"],
+            self.car_score,
+            self.pet_friendly.astype(float),
+            self.amenity_count,
+        ]) if n else np.zeros((0, len(TAG_FEATURE_COLUMNS)))
+
+        # 预先计算的精简视图，响应时直接引用，不再序列化整条原始记录
+        self.views: Dict[str, List[Dict[str, Any]]] = {
+            "summary": [_project(record.data, SUMMARY_FIELDS) for record in self.records],
+            "card": [_card_view(record.data) for record in self.records],
+        }
+
+        # 同址房源标签（dedupe-at-load 时由 HousingRecommender 设置；None 表示未启用）
+        self.site_labels: Optional[np.ndarray] = None
+
+        # 离线地名索引（由 HousingRecommender 构建，随数据集一起热重载/快照）
+        self.gazetteer = None
+
+        self.rent_index = RentIndex(self.rent_min_by_bedrooms, self.rent_min_any, self.pricing_min)
+
+        # 半径查询只访问与查询矩形相交的网格单元
+        self.spatial_index = GridIndex(self.lat, self.lon)
+
+        self.embedding_blocks: List[np.ndarray] = []
+        self.embedding_block = np.full(n, -1, dtype=np.int64)
+        self.embedding_row = np.full(n, -1, dtype=np.int64)
+        if embeddings:
+            self._attach_embeddings(embeddings)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def all_rows(self) -> np.ndarray:
+        return np.arange(len(self.records))
+
+    def colocated_sites(self, radius_miles: float) -> np.ndarray:
+        """
+        Site label per row: the row of the first (lowest-row) listing of the site,
+        where a site is every later listing within ``radius_miles`` of it.
+        Rows without coordinates are their own site.
+        """
+        labels = self.all_rows()
+        assigned = np.zeros(len(self.records), dtype=bool)
+        for row in range(len(self.records)):
+            lat, lon = self.lat[row], self.lon[row]
+            if assigned[row] or np.isnan(lat) or np.isnan(lon):
+                continue
+            nearby = self.spatial_index.query_radius(lat, lon, radius_miles)
+            nearby = nearby[(nearby > row) & ~assigned[nearby]]
+            labels[nearby] = row
+            assigned[nearby] = True
+        return labels
+
+    def colocated_duplicates(self, radius_miles: float) -> np.ndarray:
+        """
+        Mask of listings within ``radius_miles`` of an earlier (lower-row) listing.
+        The first listing of each site stays unmarked; rows without coordinates
+        are never marked.
+        """
+        return self.colocated_sites(radius_miles) != self.all_rows()
+
+    def view(self, row: int, name: str = "card") -> Dict[str, Any]:
+        """Precomputed ``summary`` / ``card`` view of a building, or the raw record for ``full``."""
+        if name == "full":
+            return self.records[row].data
+        if name not in self.views:
+            raise ValueError(f"Unknown building view: {name!r} (expected one of {BUILDING_VIEWS})")
+        return self.views[name][row]
+
+    def project(self, row: int, fields: Sequence[str]) -> Dict[str, Any]:
+        """Only the requested top-level fields of the raw record."""
+        return _project(self.records[row].data, fields)
+
+    @property
+    def embedding_dim(self) -> int:
+        return int(self.embedding_blocks[0].shape[1]) if self.embedding_blocks else 0
+
+    def _attach_embeddings(self, blocks: Sequence[EmbeddingBlock]) -> None:
+        # 后加载的文件覆盖先加载的同一 building_id（与旧的 dict 合并语义一致）
+        for block in blocks:
+            if block.dim == 0 or (self.embedding_blocks and block.dim != self.embedding_dim):
+                continue
+            block_idx = len(self.embedding_blocks)
+            self.embedding_blocks.append(block.matrix)
+            for matrix_row, building_id in enumerate(block.ids):
+                row = self.id_to_row.get(building_id)
+                if row is not None:
+                    self.embedding_block[row] = block_idx
+                    self.embedding_row[row] = matrix_row
+
+    def detach_embeddings(self) -> Tuple[np.ndarray, "BuildingStore"]:
+        """
+        Split off the embeddings for serialization.
+
+        Returns one contiguous float32 matrix holding the embedded rows in store
+        order, and a shallow copy of the store without embedding blocks whose
+        ``embedding_row`` points into that matrix. ``attach_compact_embeddings``
+        reverses this.
+        """
+        has_embedding = self.embedding_block >= 0
+        matrix = np.zeros((int(has_embedding.sum()), self.embedding_dim), dtype=np.float32)
+        for out_row, row in enumerate(np.flatnonzero(has_embedding)):
+            matrix[out_row] = self.embedding_blocks[self.embedding_block[row]][self.embedding_row[row]]
+
+        shell = copy.copy(self)
+        shell.embedding_blocks = []
+        shell.embedding_block = np.where(has_embedding, 0, -1)
+        shell.embedding_row = np.where(has_embedding, np.cumsum(has_embedding) - 1, -1)
+        return matrix, shell
+
+    def attach_compact_embeddings(self, matrix: np.ndarray) -> None:
+        """Attach the matrix produced by ``detach_embeddings`` (e.g. memory-mapped)."""
+        self.embedding_blocks = [matrix] if matrix.size else []
+        if not self.embedding_blocks:
+            self.embedding_block[:] = -1
+            self.embedding_row[:] = -1
+
+    def embedding_similarity(self, rows: np.ndarray, query: Sequence[float]) -> np.ndarray:
+        """
+        Cosine similarity between ``query`` and the embeddings of ``rows``.
+
+        The query is normalized once and multiplied against the pre-normalized
+        matrices (one matrix-vector product per source block). Rows without an
+        embedding get NaN so callers can skip blending them.
+        """
+        sims = np.full(rows.size, np.nan)
+        blocks = self.embedding_block[rows]
+        has_embedding = blocks >= 0
+        if not has_embedding.any():
+            return sims
+
+        q = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if q.ndim != 1 or q.size != self.embedding_dim or norm == 0:
+            sims[has_embedding] = 0.0
+            return sims
+        q = q / norm
+
+        matrix_rows = self.embedding_row[rows]
+        for block_idx, matrix in enumerate(self.embedding_blocks):
+            selected = blocks == block_idx
+            if selected.any():
+                sims[selected] = matrix[matrix_rows[selected]] @ q
+        return sims
+
+    def _fill_row(self, row: int, data: Dict[str, Any]) -> None:
+        lat = parse_float(data.get("lat"))
+        lon = parse_float(data.get("lon"))
+        if lat is not None and lon is not None:
+            self.lat[row] = lat
+            self.lon[row] = lon
+
+        crime = data.get("crime_stats") or {}
+        self.crime_incidents[row] = parse_float(crime.get("total_incidents")) or 0
+
+        transit = data.get("transit_accessibility") or {}
+        self.transit_total[row] = parse_float(transit.get("total_transit")) or 0
+
+        commute = parse_float(data.get("commute_to_downtown_minutes"))
+        if commute is not None:
+            self.commute_minutes[row] = commute
+
+        car = data.get("car_friendly") or {}
+        self.car_score[row] = parse_float(car.get("car_score")) or 0
+
+        amenities = ensure_list(data.get("amenities"))
+        self.amenity_count[row] = len(amenities)
+        self.pet_friendly[row] = any(
+            keyword in str(amenity).lower() for amenity in amenities for keyword in PET_KEYWORDS
+        )
+
+        pois = (data.get("nearby_pois") or {}).get("categories") or {}
+        for cat in POI_CATEGORIES:
+            self.poi_counts[cat][row] = parse_float(pois.get(cat)) or 0
+
+        for entry in ensure_list(data.get("rentcast_data")):
+            if not isinstance(entry, dict):
+                continue
+            rent = parse_float(entry.get("rent"))
+            if rent is None:
+                continue
+            self.rent_min_any[row] = np.fmin(self.rent_min_any[row], rent)
+
+            bedrooms = entry.get("bedrooms")
+            if not entry.get("rent") or bedrooms is None or isinstance(bedrooms, (list, dict)):
+                continue
+            column = self.rent_min_by_bedrooms.get(bedrooms)
+            if column is None:
+                column = np.full(len(self.records), np.nan)
+                self.rent_min_by_bedrooms[bedrooms] = column
+            column[row] = np.fmin(column[row], rent)
+
+        pricing_min = parse_pricing_min(data.get("pricing") or data.get("Pricing"))
+        if pricing_min is not None:
+            self.pricing_min[row] = pricing_min
+
+
+def parse_pricing_min(pricing: Any) -> Optional[float]:
+    """Lowest number in a pricing string like "$1,780 - $6,670" (None if there is none)."""
+    if not isinstance(pricing, str):
+        return None
+    numbers = []
+    for token in pricing.replace("$", "").replace(",", "").split():
+        try:
+            numbers.append(float(token))
+        except ValueError:
+            continue
+    return min(numbers) if numbers else None
+
+
+def _project(data: Dict[str, Any], fields: Sequence[str]) -> Dict[str, Any]:
+    return {field: data[field] for field in fields if field in data}
+
+
+def _card_view(data: Dict[str, Any]) -> Dict[str, Any]:
+    view = _project(data, CARD_FIELDS)
+    for field, keys in CARD_NESTED_FIELDS.items():
+        nested = data.get(field)
+        if isinstance(nested, dict):
+            view[field] = _project(nested, keys)
+    view["amenity_count"] = len(ensure_list(data.get("amenities")))
+    return view
+
+
+class RentIndex:
+    """
+    Budget lookups over rents normalized at load time.
+
+    For every bedroom count the "effective" rent of a building is its lowest
+    rentcast rent for that count, falling back to the lowest pricing-string
+    price when rentcast has none; NaN means the building has no pricing at all
+    (such buildings always pass the budget filter). Each effective-rent column
+    also keeps a sorted copy so "rent <= X" is a ``searchsorted`` range lookup.
+    """
+
+    def __init__(
+        self,
+        rent_min_by_bedrooms: Dict[Any, np.ndarray],
+        rent_min_any: np.ndarray,
+        pricing_min: np.ndarray,
+    ) -> None:
+        self._by_bedrooms = {
+            bedrooms: self._sorted_column(np.where(np.isnan(column), pricing_min, column))
+            for bedrooms, column in rent_min_by_bedrooms.items()
+        }
+        self._any = self._sorted_column(np.where(np.isnan(rent_min_any), pricing_min, rent_min_any))
+        self._pricing_only = self._sorted_column(pricing_min)
+
+    @staticmethod
+    def _sorted_column(rents: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        priced = np.flatnonzero(~np.isnan(rents))
+        order = priced[np.argsort(rents[priced], kind="stable")]
+        unpriced = np.flatnonzero(np.isnan(rents))
+        return rents, rents[order], order, unpriced
+
+    def _column(self, bedrooms: Any) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        if bedrooms is None:
+            return self._any
+        try:
+            return self._by_bedrooms.get(bedrooms, self._pricing_only)
+        except TypeError:  # unhashable bedrooms value never matches a rentcast entry
+            return self._pricing_only
+
+    def effective_rents(self, bedrooms: Any = None) -> np.ndarray:
+        """Per-row effective rent for ``bedrooms`` (None = any unit type)."""
+        return self._column(bedrooms)[0]
+
+    def rows_within_budget(self, max_rent: float, bedrooms: Any = None) -> np.ndarray:
+        """All rows (ascending) whose effective rent is <= max_rent, plus unpriced rows."""
+        _, sorted_rents, order, unpriced = self._column(bedrooms)
+        end = np.searchsorted(sorted_rents, max_rent, side="right")
+        return np.sort(np.concatenate([order[:end], unpriced]))
+
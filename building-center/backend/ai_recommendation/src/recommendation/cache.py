@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Small cache building blocks shared by the recommender's lookup caches.
+
+``LRUCache`` is a bounded in-process tier, ``SQLiteCache`` a persistent tier
+that several worker processes can share (expired rows are purged on open and
+every ``purge_every`` writes, together with an optional row cap), and
+``TieredCache`` puts the first in front of the second. Every entry carries its own TTL, so callers can keep
+negative results for a shorter time than positive ones. Values must be
+JSON-serializable to be stored on disk.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe LRU with per-entry expiry."""
+
+    def __init__(self, max_size: int = 1024) -> None:
+        self.max_size = max_size
+        self._data: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            value, expires_at = item
+            if expires_at <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl_seconds)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteCache:
+    """
+    Persistent key/value table with per-entry expiry (values stored as JSON).
+
+    Args:
+        max_rows: row cap; when exceeded, the rows closest to expiry are evicted
+            first (None = only expired rows are removed)
+        purge_every: writes between two purge/cap sweeps; the table can exceed
+            ``max_rows`` by at most this many rows in between
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        table: str = "cache",
+        max_rows: Optional[int] = None,
+        purge_every: int = 256,
+    ) -> None:
+        if not table.isidentifier():
+            raise ValueError(f"Invalid cache table name: {table!r}")
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.table = table
+        self.max_rows = max_rows
+        self.purge_every = purge_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=5.0)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_expires_at ON {table} (expires_at)")
+        self.purge_expired()
+
+    def get(self, key: str) -> Tuple[bool, Any, float]:
+        """Return (found, value, expires_at); expired rows count as not found."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return False, None, 0.0
+        return True, json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, payload, time.time() + ttl_seconds),
+            )
+            self._writes += 1
+            due = self._writes % self.purge_every == 0
+        if due:
+            self.purge_expired()
+
+    def purge_expired(self) -> int:
+        """Delete expired rows, then the rows closest to expiry beyond ``max_rows``."""
+        with self._lock, self._conn:
+            removed = self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),)).rowcount
+            if self.max_rows is not None:
+                (count,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+                if count > self.max_rows:
+                    removed += self._conn.execute(
+                        f"DELETE FROM {self.table} WHERE key IN "
+                        f"(SELECT key FROM {self.table} ORDER BY expires_at LIMIT ?)",
+                        (count - self.max_rows,),
+                    ).rowcount
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class TieredCache:
+    """
+    LRU memory tier in front of an optional SQLite tier.
+
+    ``get`` returns ``(found, value)`` so that a cached ``None`` (a negative
+    result) can be told apart from a miss. Disk hits are promoted to memory
+    with their remaining TTL.
+    """
+
+    def __init__(self, memory: LRUCache, disk: Optional[SQLiteCache] = None) -> None:
+        self.memory = memory
+        self.disk = disk
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        item = self.memory.get(key, _MISSING)
+        if item is not _MISSING:
+            self._count("memory_hits")
+            return True, item
+
+        if self.disk is not None:
+            try:
+                found, value, expires_at = self.disk.get(key)
+            except sqlite3.Error as e:
+                print(f"⚠️ Cache disk tier read failed: {e}")
+                found = False
+            if found:
+                self.memory.set(key, value, max(0.0, expires_at - time.time()))
+                self._count("disk_hits")
+                return True, value
+
+        self._count("misses")
+        return False, None
+
+    def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        self.memory.set(key, value, ttl_seconds)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value, ttl_seconds)
+            except sqlite3.Error as e:
+                print(f"⚠️ Cache disk tier write failed: {e}")
+        self._count("sets")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self.counters)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else None
+        stats["memory_size"] = len(self.memory)
+        stats["disk_enabled"] = self.disk is not None
+        return stats
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Model cascade for the final GPT selection step.
+
+``CascadePolicy.decide`` looks at the score-ordered candidates and the request
+and picks one of three routes:
+
+* ``skip``  - the score ranking is decisive, use the top picks without a model call;
+* ``small`` - a smaller, faster model is enough;
+* ``large`` - the full model (close scores, or free-text input that needs it).
+
+Decisiveness is the relative margin at the selection boundary: the score gap
+between the last pick and the first candidate left out, divided by the top
+score. Requests with notes, facade style preferences or free-text refinements
+always escalate to the large model. The returned ``CascadeDecision`` records
+the route, the model and why it was taken.
+"""
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+ROUTE_SKIP = "skip"
+ROUTE_SMALL = "small"
+ROUTE_LARGE = "large"
+
+
+@dataclass(frozen=True)
+class CascadeDecision:
+    route: str
+    model: Optional[str]
+    reason: str
+    margin: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass(frozen=True)
+class CascadePolicy:
+    """
+    Args:
+        small_model: model used on the "small" route
+        small_margin: relative boundary margin at or above which the small model is used
+        skip_margin: margin at or above which no model is called (None = never skip;
+            skipped requests get no GPT-written reasons)
+        escalate_on_notes / escalate_on_style / escalate_on_refinements: always use
+            the large model when the request carries that free-text input
+    """
+
+    small_model: str = "gpt-4o-mini"
+    small_margin: Optional[float] = 0.02
+    skip_margin: Optional[float] = None
+    escalate_on_notes: bool = True
+    escalate_on_style: bool = True
+    escalate_on_refinements: bool = True
+
+    def decide(
+        self,
+        user_request: Dict[str, Any],
+        candidates: List[Dict[str, Any]],
+        large_model: str,
+        final_count: Optional[int] = 3,
+    ) -> CascadeDecision:
+        escalation = self._escalation_reason(user_request)
+        if escalation:
+            return CascadeDecision(ROUTE_LARGE, large_model, escalation)
+
+        count = final_count or 3
+        if len(candidates) <= count:
+            # 候选不超过需要的数量：只需排序和写理由
+            return CascadeDecision(ROUTE_SMALL, self.small_model, f"only {len(candidates)} candidates")
+
+        margin = boundary_margin(candidates, count)
+        if self.skip_margin is not None and margin >= self.skip_margin:
+            return CascadeDecision(ROUTE_SKIP, None, f"score margin {margin:.3f} >= {self.skip_margin}", margin)
+        if self.small_margin is not None and margin >= self.small_margin:
+            return CascadeDecision(ROUTE_SMALL, self.small_model, f"score margin {margin:.3f} >= {self.small_margin}", margin)
+        return CascadeDecision(ROUTE_LARGE, large_model, f"score margin {margin:.3f} below thresholds", margin)
+
+    def _escalation_reason(self, user_request: Dict[str, Any]) -> Optional[str]:
+        notes = str(user_request.get("notes") or "").strip()
+        if self.escalate_on_notes and notes and notes != "None":
+            return "notes present"
+        if self.escalate_on_style and user_request.get("style_preference"):
+            return "style preferences present"
+        refinements = user_request.get("refinements") or {}
+        if self.escalate_on_refinements and any(refinements.get(key) for key in ("notes", "custom_amenities", "commute")):
+            return "free-text refinements present"
+        return None
+
+
+def boundary_margin(candidates: List[Dict[str, Any]], count: int) -> float:
+    """(score of pick ``count`` - score of the next candidate) / top score; candidates sorted by score."""
+    top = candidates[0]["total_score"]
+    if top <= 0:
+        return 0.0
+    return (candidates[count - 1]["total_score"] - candidates[count]["total_score"]) / top
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Binary embedding sidecars for ``buildings_with_embeddings.json``.
+
+The JSON files store each 1536-d vector as text next to a full copy of the
+enriched record, so loading them just to read ``building_id`` + ``embedding``
+is slow and memory hungry. This module writes a compact sidecar next to each
+JSON file:
+
+    buildings_with_embeddings.npy       float32 (n, dim), unit-normalized rows
+    buildings_with_embeddings.ids.json  ["building_id", ...] in row order
+
+and loads it back with ``np.load(..., mmap_mode="r")`` so that several worker
+processes share the same page-cache pages. When a sidecar is missing or older
+than its JSON source, loading falls back to parsing the JSON.
+
+Sidecars are produced by ``python -m src.pipeline.build_embedding_sidecars``.
+"""
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.recommendation.utils import load_json
+
+
+@dataclass
+class EmbeddingBlock:
+    """Embeddings of one source file: ``matrix[i]`` belongs to ``ids[i]``."""
+
+    ids: List[str]
+    matrix: np.ndarray  # float32, unit-normalized rows (may be an np.memmap)
+    source: str = "json"
+
+    @classmethod
+    def from_vectors(cls, ids: Sequence[str], vectors: Sequence[Sequence[float]], source: str = "json") -> "EmbeddingBlock":
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim != 2:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        return cls(ids=list(ids), matrix=normalize_rows(matrix), source=source)
+
+    @property
+    def dim(self) -> int:
+        return int(self.matrix.shape[1]) if self.matrix.ndim == 2 else 0
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale each row to unit L2 norm in place (all-zero rows stay zero)."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def sidecar_paths(json_path: Path) -> Tuple[Path, Path]:
+    """Return (matrix_path, ids_path) for an embeddings JSON file."""
+    json_path = Path(json_path)
+    return json_path.with_suffix(".npy"), json_path.with_suffix(".ids.json")
+
+
+def read_json_embeddings(json_path: Path) -> EmbeddingBlock:
+    """Parse ``building_id`` / ``embedding`` pairs out of the JSON source."""
+    ids: List[str] = []
+    vectors: List[List[float]] = []
+    dim: Optional[int] = None
+    for record in load_json(Path(json_path)):
+        building_id = record.get("building_id")
+        embedding = record.get("embedding")
+        if not building_id or not isinstance(embedding, list) or not embedding:
+            continue
+        if dim is None:
+            dim = len(embedding)
+        if len(embedding) != dim:
+            continue
+        ids.append(building_id)
+        vectors.append(embedding)
+    return EmbeddingBlock.from_vectors(ids, vectors, source=str(json_path))
+
+
+def write_sidecar(json_path: Path) -> Tuple[Path, Path]:
+    """Convert one embeddings JSON file into its binary sidecar."""
+    block = read_json_embeddings(json_path)
+    matrix_path, ids_path = sidecar_paths(json_path)
+
+    # 先写临时文件再替换，避免其他进程读到半写的文件
+    tmp_matrix = matrix_path.with_name(matrix_path.name + ".tmp")
+    with tmp_matrix.open("wb") as fh:
+        np.save(fh, np.ascontiguousarray(block.matrix, dtype=np.float32))
+    tmp_ids = ids_path.with_name(ids_path.name + ".tmp")
+    with tmp_ids.open("w", encoding="utf-8") as fh:
+        json.dump(block.ids, fh)
+    os.replace(tmp_matrix, matrix_path)
+    os.replace(tmp_ids, ids_path)
+    return matrix_path, ids_path
+
+
+def sidecar_is_fresh(json_path: Path) -> bool:
+    """True if both sidecar files exist and are not older than the JSON source."""
+    json_path = Path(json_path)
+    matrix_path, ids_path = sidecar_paths(json_path)
+    if not (matrix_path.exists() and ids_path.exists()):
+        return False
+    if not json_path.exists():
+        return True
+    source_mtime = json_path.stat().st_mtime
+    return matrix_path.stat().st_mtime >= source_mtime and ids_path.stat().st_mtime >= source_mtime
+
+
+def load_embedding_block(json_path: Path, use_sidecar: bool = True) -> Optional[EmbeddingBlock]:
+    """
+    Load embeddings for one source file.
+
+    Prefers the memory-mapped sidecar; falls back to parsing the JSON when the
+    sidecar is missing, stale or unreadable. Returns None if neither exists.
+    """
+    json_path = Path(json_path)
+    if use_sidecar and sidecar_is_fresh(json_path):
+        matrix_path, ids_path = sidecar_paths(json_path)
+        try:
+            matrix = np.load(matrix_path, mmap_mode="r")
+            ids = load_json(ids_path)
+            if matrix.ndim == 2 and len(ids) == matrix.shape[0]:
+                return EmbeddingBlock(ids=list(ids), matrix=matrix, source=str(matrix_path))
+            print(f"⚠️ Embedding sidecar {matrix_path} does not match its id index, falling back to JSON")
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Failed to load embedding sidecar {matrix_path}: {e}")
+    elif use_sidecar and sidecar_paths(json_path)[0].exists():
+        print(f"⚠️ Embedding sidecar for {json_path} is older than the JSON, falling back to JSON")
+
+    if not json_path.exists():
+        return None
+    return read_json_embeddings(json_path)
+
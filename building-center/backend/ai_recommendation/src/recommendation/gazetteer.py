@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Offline gazetteer geocoder.
+
+Resolves location strings in-process, without touching the network, from:
+
+* the bundled place list (``data/places/bay_area_places.json``): campuses,
+  landmarks, neighbourhoods and cities with aliases;
+* the building catalogue: every building ``address`` (in full and as
+  "street city") maps to that building's coordinates, and each city seen in
+  addresses maps to the median of its buildings' coordinates unless the place
+  list has it. Bare street parts ("680 Mission St") are not indexed, so a
+  street name can never resolve to one building on it.
+
+Lookup order is exact normalized name, then prefix (the query is the start of
+a known name), then trigram similarity. The first comma-separated part of the
+query is retried on its own, so "SFSU, San Francisco, CA" still resolves.
+Prefix and trigram hits are approximate ("San Francisco Zoo" is close to "San
+Francisco"); ``lookup(query, approximate=False)`` returns exact hits only.
+"""
+from __future__ import annotations
+
+import bisect
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.recommendation.utils import load_json, parse_float
+
+Coordinates = Tuple[float, float]
+
+# 同名时的优先级：数值越小越优先
+KIND_PRIORITY = {"landmark": 0, "neighborhood": 1, "city": 2, "address": 3, "city_centroid": 4}
+
+_ABBREVIATIONS = {
+    "street": "st",
+    "avenue": "ave",
+    "boulevard": "blvd",
+    "road": "rd",
+    "drive": "dr",
+    "court": "ct",
+    "place": "pl",
+    "lane": "ln",
+    "parkway": "pkwy",
+    "highway": "hwy",
+    "terrace": "ter",
+    "north": "n",
+    "south": "s",
+    "east": "e",
+    "west": "w",
+    "california": "ca",
+}
+_NON_ASCII_SUFFIX = re.compile(r"[^\x00-\x7f]+$")
+_ZIP = re.compile(r"\b\d{5}(?:-\d{4})?\b")
+
+
+def normalize_name(text: str) -> str:
+    """Lower-case, strip punctuation / zip codes / "USA" suffixes, abbreviate street words."""
+    text = _NON_ASCII_SUFFIX.sub("", str(text))  # e.g. trailing "美国"
+    text = text.lower().replace("é", "e").replace("ñ", "n")
+    text = _ZIP.sub(" ", text)
+    text = re.sub(r"[^a-z0-9 ]+", " ", text)
+    words = [_ABBREVIATIONS.get(w, w) for w in text.split()]
+    while words and words[-1] in ("usa", "us", "ca"):
+        words.pop()
+    return " ".join(words)
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass(frozen=True)
+class GazetteerEntry:
+    name: str
+    lat: float
+    lon: float
+    kind: str
+
+
+class Gazetteer:
+    """In-process exact / prefix / trigram index over place names."""
+
+    def __init__(self, entries: Iterable[GazetteerEntry], min_similarity: float = 0.6) -> None:
+        self.min_similarity = min_similarity
+        self._by_name: Dict[str, GazetteerEntry] = {}
+        for entry in entries:
+            key = normalize_name(entry.name)
+            if not key:
+                continue
+            current = self._by_name.get(key)
+            if current is None or KIND_PRIORITY.get(entry.kind, 9) < KIND_PRIORITY.get(current.kind, 9):
+                self._by_name[key] = entry
+
+        self._names: List[str] = sorted(self._by_name)
+        self._trigram_index: Dict[str, List[int]] = defaultdict(list)
+        self._trigram_counts: List[int] = []
+        for idx, name in enumerate(self._names):
+            grams = trigrams(name)
+            self._trigram_counts.append(len(grams))
+            for gram in grams:
+                self._trigram_index[gram].append(idx)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    @classmethod
+    def from_sources(cls, places: Sequence[dict], buildings: Sequence[dict]) -> "Gazetteer":
+        """Build from place-list records and raw building dicts (``address``/``lat``/``lon``)."""
+        entries: List[GazetteerEntry] = []
+        for place in places:
+            lat = parse_float(place.get("lat"))
+            lon = parse_float(place.get("lon"))
+            if lat is None or lon is None or not place.get("name"):
+                continue
+            kind = place.get("kind", "landmark")
+            for name in [place["name"], *place.get("aliases", [])]:
+                entries.append(GazetteerEntry(name, lat, lon, kind))
+
+        city_points: Dict[str, List[Coordinates]] = defaultdict(list)
+        for building in buildings:
+            lat = parse_float(building.get("lat"))
+            lon = parse_float(building.get("lon"))
+            address = building.get("address")
+            if lat is None or lon is None or not isinstance(address, str):
+                continue
+            parts = [p.strip() for p in address.split(",") if p.strip()]
+            entries.append(GazetteerEntry(address, lat, lon, "address"))
+            if len(parts) >= 2:
+                entries.append(GazetteerEntry(f"{parts[0]} {parts[1]}", lat, lon, "address"))
+                city_points[parts[1]].append((lat, lon))
+
+        # 地址中出现、但地名表里没有的城市，用楼宇坐标中位数作为城市中心
+        for city, points in city_points.items():
+            lat, lon = np.median(np.asarray(points), axis=0)
+            entries.append(GazetteerEntry(city, float(lat), float(lon), "city_centroid"))
+
+        return cls(entries)
+
+    @classmethod
+    def from_files(cls, places_path: Optional[Path], buildings: Sequence[dict]) -> "Gazetteer":
+        places = load_json(Path(places_path)) if places_path and Path(places_path).exists() else []
+        return cls.from_sources(places, buildings)
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+
+    def lookup(self, query: str, approximate: bool = True) -> Optional[GazetteerEntry]:
+        """Best entry for ``query``; with ``approximate=False`` only exact name matches."""
+        if not isinstance(query, str):
+            return None
+        candidates = [query]
+        head = query.split(",")[0]
+        if head != query:
+            candidates.append(head)
+        keys = [key for key in (normalize_name(text) for text in candidates) if key]
+        stages = (self._by_name.get, self._prefix, self._fuzzy) if approximate else (self._by_name.get,)
+        for stage in stages:
+            for key in keys:
+                entry = stage(key)
+                if entry is not None:
+                    return entry
+        return None
+
+    def resolve(self, query: str, approximate: bool = True) -> Optional[Coordinates]:
+        """Geocoder interface: (lat, lon) or None."""
+        entry = self.lookup(query, approximate)
+        return (entry.lat, entry.lon) if entry else None
+
+    __call__ = resolve
+
+    def _prefix(self, key: str) -> Optional[GazetteerEntry]:
+        if len(key) < 4:
+            return None
+        start = bisect.bisect_left(self._names, key)
+        best: Optional[Tuple[bool, int, int, str]] = None
+        for name in self._names[start:start + 50]:
+            if not name.startswith(key):
+                break
+            # 整词前缀优先："stanford" -> "stanford university" 优于半个单词的匹配
+            partial_word = len(name) > len(key) and name[len(key)] != " "
+            entry = self._by_name[name]
+            rank = (partial_word, KIND_PRIORITY.get(entry.kind, 9), len(name), name)
+            if best is None or rank < best:
+                best = rank
+        return self._by_name[best[3]] if best else None
+
+    def _fuzzy(self, key: str) -> Optional[GazetteerEntry]:
+        if len(key) < 4:
+            return None
+        grams = trigrams(key)
+        shared: Dict[int, int] = defaultdict(int)
+        for gram in grams:
+            for idx in self._trigram_index.get(gram, ()):
+                shared[idx] += 1
+        best_idx, best_score = -1, 0.0
+        for idx, count in shared.items():
+            score = count / (len(grams) + self._trigram_counts[idx] - count)
+            if score > best_score:
+                best_idx, best_score = idx, score
+        if best_score < self.min_similarity:
+            return None
+        return self._by_name[self._names[best_idx]]
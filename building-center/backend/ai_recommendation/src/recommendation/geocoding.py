@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Geocoding for free-text ``location`` strings.
+
+``geocode_location`` calls the local Node backend (Photon API). Most traffic
+repeats the same few hundred campus / neighbourhood names, so
+``CachedGeocoder`` puts a two-tier cache (in-process LRU + SQLite file) in
+front of it, keyed by a normalized query, with negative caching for "not
+found" and (for a shorter time) for backend errors.
+"""
+from __future__ import annotations
+
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+
+from src.recommendation.cache import LRUCache, SQLiteCache, TieredCache
+
+GEO_SEARCH_URL = "http://localhost:5003/api/geo/search"
+GEO_SEARCH_TIMEOUT = 15
+
+Coordinates = Tuple[float, float]
+
+
+def request_geocode(query: str, timeout: float = GEO_SEARCH_TIMEOUT) -> Optional[Coordinates]:
+    """
+    Resolve a place name via the local backend.
+    Returns (lat, lon) or None when nothing was found; raises on transport errors.
+    """
+    # 使用本地Node后端的Photon API（支持中文翻译）
+    resp = requests.get(GEO_SEARCH_URL, params={"q": query, "limit": 1}, timeout=timeout)
+    resp.raise_for_status()
+    data = resp.json()
+
+    # data格式: { top: {...}, candidates: [...] }
+    if data and data.get("top"):
+        top = data["top"]
+        lat = top.get("lat")
+        lon = top.get("lon")
+        if lat and lon:
+            return float(lat), float(lon)
+    return None
+
+
+def geocode_location(query: str) -> Optional[Coordinates]:
+    """
+    Resolve a place name to latitude/longitude using Photon API (via local backend).
+    Returns (lat, lon) in degrees if successful, otherwise None.
+    """
+    try:
+        return request_geocode(query)
+    except Exception as e:
+        print(f"⚠️ Geocoding error: {e}")
+        return None
+
+
+def normalize_query(query: str) -> str:
+    """Cache key for a location string: case-, whitespace- and edge-punctuation-insensitive."""
+    text = re.sub(r"\s+", " ", str(query)).strip().lower()
+    return text.strip(" .,;:!?\"'")
+
+
+class CachedGeocoder:
+    """
+    Callable geocoder with an LRU memory tier and an optional SQLite tier.
+
+    Args:
+        backend: raising resolver, ``request_geocode`` by default
+        cache_path: SQLite file for the persistent tier (None = memory only)
+        ttl_seconds: lifetime of successful lookups
+        negative_ttl_seconds: lifetime of "not found" results
+        error_ttl_seconds: lifetime of backend failures (timeouts, 5xx, ...)
+        max_disk_entries: row cap of the SQLite tier (None = unbounded)
+    """
+
+    def __init__(
+        self,
+        backend: Callable[[str], Optional[Coordinates]] = request_geocode,
+        cache_path: Optional[Path] = None,
+        max_memory_entries: int = 2048,
+        ttl_seconds: float = 30 * 24 * 3600,
+        negative_ttl_seconds: float = 24 * 3600,
+        error_ttl_seconds: float = 60,
+        max_disk_entries: Optional[int] = 100_000,
+    ) -> None:
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.error_ttl_seconds = error_ttl_seconds
+        disk = SQLiteCache(Path(cache_path), table="geocode", max_rows=max_disk_entries) if cache_path else None
+        self.cache = TieredCache(LRUCache(max_memory_entries), disk)
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {
+            "requests": 0,
+            "negative_hits": 0,
+            "backend_calls": 0,
+            "backend_errors": 0,
+            "backend_latency_ms_total": 0.0,
+            "backend_latency_ms_max": 0.0,
+            "hit_latency_ms_total": 0.0,
+        }
+
+    def __call__(self, query: str) -> Optional[Coordinates]:
+        return self.geocode(query)
+
+    def geocode(self, query: str) -> Optional[Coordinates]:
+        started = time.perf_counter()
+        key = normalize_query(query)
+        self._add("requests", 1)
+        if not key:
+            return None
+
+        found, value = self.cache.get(key)
+        if found:
+            self._add("hit_latency_ms_total", (time.perf_counter() - started) * 1000)
+            if value is None:
+                self._add("negative_hits", 1)
+                return None
+            return float(value[0]), float(value[1])
+
+        call_started = time.perf_counter()
+        try:
+            coords = self.backend(query)
+        except Exception as e:
+            print(f"⚠️ Geocoding error: {e}")
+            self._add("backend_errors", 1)
+            self._record_backend_latency(call_started)
+            self.cache.set(key, None, self.error_ttl_seconds)
+            return None
+        self._record_backend_latency(call_started)
+
+        if coords is None:
+            self.cache.set(key, None, self.negative_ttl_seconds)
+            return None
+        self.cache.set(key, [coords[0], coords[1]], self.ttl_seconds)
+        return coords
+
+    def _add(self, name: str, amount: float) -> None:
+        with self._lock:
+            self._counters[name] += amount
+
+    def _record_backend_latency(self, started: float) -> None:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._counters["backend_calls"] += 1
+            self._counters["backend_latency_ms_total"] += elapsed_ms
+            self._counters["backend_latency_ms_max"] = max(self._counters["backend_latency_ms_max"], elapsed_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        cache_stats = self.cache.stats()
+        hits = cache_stats["memory_hits"] + cache_stats["disk_hits"]
+        backend_calls = counters["backend_calls"]
+        return {
+            **cache_stats,
+            "requests": int(counters["requests"]),
+            "negative_hits": int(counters["negative_hits"]),
+            "backend_calls": int(backend_calls),
+            "backend_errors": int(counters["backend_errors"]),
+            "backend_latency_ms_avg": round(counters["backend_latency_ms_total"] / backend_calls, 2) if backend_calls else None,
+            "backend_latency_ms_max": round(counters["backend_latency_ms_max"], 2),
+            "hit_latency_ms_avg": round(counters["hit_latency_ms_total"] / hits, 4) if hits else None,
+        }
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+In-process background jobs for the slow GPT selection step.
+
+The API answers a recommendation request with the score-based candidates at
+once and hands the model call to ``JobStore.submit``; clients then poll the
+job (``get``) or block on it (``wait``, used by the SSE endpoint). Jobs stay
+retrievable for ``ttl_seconds`` after they finish. With ``store_path`` every
+state change is also written to a SQLite table shared by all worker processes,
+so a poll or SSE subscription may land on any worker; jobs created elsewhere
+are polled from that table every ``poll_interval`` seconds.
+"""
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from src.recommendation.cache import SQLiteCache
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job:
+    def __init__(self, job_id: str) -> None:
+        self.id = job_id
+        self.status = PENDING
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobStore:
+    """
+    Thread-pool backed job registry.
+
+    Args:
+        max_workers: concurrent background jobs (each mostly waits on the model API)
+        ttl_seconds: how long finished jobs stay retrievable
+        store_path: SQLite file shared between worker processes (None = this process only);
+            job results must then be JSON-serializable
+        poll_interval: seconds between table reads while waiting on another worker's job
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        ttl_seconds: float = 600,
+        store_path: Optional[Path] = None,
+        poll_interval: float = 0.5,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="recommend-job")
+        self._jobs: Dict[str, Job] = {}
+        self._changed = threading.Condition()
+        self._shared = SQLiteCache(Path(store_path), table="jobs") if store_path else None
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> str:
+        job = Job(uuid.uuid4().hex)
+        with self._changed:
+            self._purge_expired()
+            self._jobs[job.id] = job
+        self._publish(job.to_dict())
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job.id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return job.to_dict()
+        return self._get_shared(job_id)
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Block until the job finishes or ``timeout`` elapses; returns its current state."""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                while not job.finished:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._changed.wait(remaining)
+                return job.to_dict()
+        # 其他 worker 创建的任务：轮询共享表
+        state = self._get_shared(job_id)
+        while state is not None and state["status"] not in (DONE, FAILED):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(self.poll_interval, remaining))
+            state = self._get_shared(job_id) or state
+        return state
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._executor.shutdown(wait=wait)
+        if wait and self._shared is not None:
+            self._shared.close()
+
+    def _run(self, job: Job, fn: Callable[..., Any], args: tuple, kwargs: dict) -> None:
+        self._update(job, status=RUNNING)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            print(f"❌ 后台推荐任务失败 ({job.id}): {e}")
+            self._update(job, status=FAILED, error=str(e), finished_at=time.time())
+            return
+        self._update(job, status=DONE, result=result, finished_at=time.time())
+
+    def _update(self, job: Job, **fields: Any) -> None:
+        # 先写共享表再更新本进程状态：本进程已返回的状态，其他 worker 也一定能读到
+        self._publish({**job.to_dict(), **fields})
+        with self._changed:
+            for name, value in fields.items():
+                setattr(job, name, value)
+            self._changed.notify_all()
+
+    def _publish(self, state: Dict[str, Any]) -> None:
+        if self._shared is None:
+            return
+        try:
+            self._shared.set(state["job_id"], state, self.ttl_seconds)
+        except Exception as e:
+            # 本进程内的轮询仍然可用，只是其他 worker 看不到该任务
+            print(f"⚠️  任务状态写入共享存储失败 ({state['job_id']}): {e}")
+
+    def _get_shared(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if self._shared is None:
+            return None
+        found, state, _ = self._shared.get(job_id)
+        return state if found else None
+
+    def _purge_expired(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
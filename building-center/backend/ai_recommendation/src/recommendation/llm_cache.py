@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache for GPT ranking results.
+
+Identical questionnaires produce an identical candidate list and therefore an
+identical prompt, so the parsed ranking can be reused without another paid
+model call. The key is a SHA-256 over the model name, system prompt and user
+prompt; entries expire after a TTL, the memory tier is size-bounded (LRU) and
+an optional SQLite tier keeps results across restarts and worker processes.
+"""
+from __future__ import annotations
+
+import hashlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.recommendation.cache import LRUCache, SQLiteCache, TieredCache
+
+
+def llm_cache_key(model: str, system_prompt: str, user_prompt: str) -> str:
+    digest = hashlib.sha256()
+    for part in (model, system_prompt, user_prompt):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Args:
+        cache_path: SQLite file for the disk tier (None = memory only)
+        max_memory_entries: LRU bound of the in-process tier
+        ttl_seconds: lifetime of a cached ranking
+        max_disk_entries: row cap of the SQLite tier (None = unbounded)
+    """
+
+    def __init__(
+        self,
+        cache_path: Optional[Path] = None,
+        max_memory_entries: int = 512,
+        ttl_seconds: float = 24 * 3600,
+        max_disk_entries: Optional[int] = 20_000,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        disk = SQLiteCache(Path(cache_path), table="llm_responses", max_rows=max_disk_entries) if cache_path else None
+        self.cache = TieredCache(LRUCache(max_memory_entries), disk)
+
+    def get(self, model: str, system_prompt: str, user_prompt: str) -> Optional[List[Dict[str, Any]]]:
+        found, value = self.cache.get(llm_cache_key(model, system_prompt, user_prompt))
+        return value if found else None
+
+    def set(self, model: str, system_prompt: str, user_prompt: str, results: List[Dict[str, Any]]) -> None:
+        self.cache.set(llm_cache_key(model, system_prompt, user_prompt), results, self.ttl_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
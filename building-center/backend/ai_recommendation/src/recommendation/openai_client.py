@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+OpenAI HTTP client used by the recommender.
+
+``AsyncOpenAIClient`` talks to the chat-completions and embeddings endpoints
+over one pooled ``httpx.AsyncClient`` (HTTP/1.1 keep-alive, HTTP/2 optional):
+
+* at most ``max_in_flight`` requests are outstanding at a time (semaphore);
+* 429 / 5xx responses and transport errors are retried with exponential
+  backoff and jitter, honouring ``Retry-After``;
+* every call can carry an absolute deadline (``time.monotonic()`` based);
+  attempt timeouts and backoff sleeps never run past it;
+* with ``hedge_after`` set, a duplicate request is started when the first one
+  has not answered after that many seconds and the first response wins. This
+  trims tail latency at the cost of extra tokens, so it is off by default.
+
+``chat_stream`` requests the completion with ``stream: true`` and yields the
+content deltas as they arrive. It is retried like ``chat`` until the first delta
+has been received; after that an error ends the stream (it is never hedged).
+
+``OpenAIClient`` is the synchronous facade the Flask threads use. It runs one
+``AsyncOpenAIClient`` on a private event-loop thread per process (recreated
+after fork), so all request threads share the pool and the in-flight limit.
+
+For offline testing point ``base_url`` at ``tests.openai_stub``.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import httpx
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+RETRYABLE_STATUS = (408, 409, 429)
+
+
+class OpenAIRequestError(RuntimeError):
+    def __init__(self, message: str, status: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class AsyncOpenAIClient:
+    """
+    Args:
+        base_url: API root, e.g. "https://api.openai.com/v1" or a local stub
+        max_in_flight: concurrent requests allowed through the semaphore
+        max_connections: size of the HTTP connection pool
+        max_retries: retries after the first attempt (429 / 5xx / transport errors)
+        backoff_base / backoff_max: exponential backoff bounds in seconds
+        chat_timeout / embed_timeout: per-attempt timeout when no deadline is tighter
+        hedge_after: seconds before a duplicate (hedged) request is sent; None = off
+        http2: negotiate HTTP/2 (requires the ``h2`` package)
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "gpt-4o",
+        base_url: str = OPENAI_BASE_URL,
+        max_in_flight: int = 8,
+        max_connections: int = 20,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        chat_timeout: float = 240,
+        embed_timeout: float = 180,
+        hedge_after: Optional[float] = None,
+        http2: bool = False,
+    ) -> None:
+        if not api_key:
+            raise ValueError("OpenAI API key is required.")
+        self.model = model
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.chat_timeout = chat_timeout
+        self.embed_timeout = embed_timeout
+        self.hedge_after = hedge_after
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._http = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            http2=http2,
+        )
+        self.counters: Dict[str, int] = {
+            "requests": 0,
+            "attempts": 0,
+            "retries": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "failures": 0,
+            "streams": 0,
+        }
+
+    async def chat(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        deadline: Optional[float] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+        followups: Optional[List[Dict[str, str]]] = None,
+        model: Optional[str] = None,
+    ) -> str:
+        payload = self._chat_payload(system_prompt, user_prompt, response_format, followups, model)
+        data = await self.post("/chat/completions", payload, self.chat_timeout, deadline)
+        return data["choices"][0]["message"]["content"]
+
+    async def chat_stream(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        deadline: Optional[float] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        payload = self._chat_payload(system_prompt, user_prompt, response_format, model=model)
+        payload["stream"] = True
+        self.counters["requests"] += 1
+        self.counters["streams"] += 1
+        try:
+            async for delta in self._stream_with_retries("/chat/completions", payload, self.chat_timeout, deadline):
+                yield delta
+        except Exception:
+            self.counters["failures"] += 1
+            raise
+
+    async def embed(self, text: str, model: str = "text-embedding-3-small", deadline: Optional[float] = None) -> List[float]:
+        payload = {"model": model, "input": text}
+        data = await self.post("/embeddings", payload, self.embed_timeout, deadline)
+        return data["data"][0]["embedding"]
+
+    async def post(self, path: str, payload: Dict[str, Any], timeout: float, deadline: Optional[float] = None) -> Dict[str, Any]:
+        self.counters["requests"] += 1
+        try:
+            if self.hedge_after is None:
+                return await self._post_with_retries(path, payload, timeout, deadline)
+            return await self._post_hedged(path, payload, timeout, deadline)
+        except Exception:
+            self.counters["failures"] += 1
+            raise
+
+    def _chat_payload(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        response_format: Optional[Dict[str, Any]] = None,
+        followups: Optional[List[Dict[str, str]]] = None,
+        model: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {
+            "model": model or self.model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+                *(followups or []),
+            ],
+        }
+        if response_format is not None:
+            payload["response_format"] = response_format
+        return payload
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+    async def _post_hedged(self, path: str, payload: Dict[str, Any], timeout: float, deadline: Optional[float]) -> Dict[str, Any]:
+        primary = asyncio.ensure_future(self._post_with_retries(path, payload, timeout, deadline))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        self.counters["hedges"] += 1
+        hedge = asyncio.ensure_future(self._post_with_retries(path, payload, timeout, deadline))
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error
+
+    async def _post_with_retries(self, path: str, payload: Dict[str, Any], timeout: float, deadline: Optional[float]) -> Dict[str, Any]:
+        attempt = 0
+        while True:
+            attempt_timeout = _attempt_timeout(path, timeout, deadline)
+            retry_after: Optional[float] = None
+            try:
+                async with self._semaphore:
+                    self.counters["attempts"] += 1
+                    resp = await self._http.post(path, json=payload, timeout=attempt_timeout)
+                if resp.status_code < 400:
+                    return resp.json()
+                error: Exception = OpenAIRequestError(
+                    f"OpenAI {path} returned HTTP {resp.status_code}: {resp.text[:200]}", status=resp.status_code
+                )
+                if resp.status_code not in RETRYABLE_STATUS and resp.status_code < 500:
+                    raise error
+                retry_after = _parse_retry_after(resp.headers.get("retry-after"))
+            except httpx.TimeoutException as e:
+                error = TimeoutError(f"OpenAI request to {path} timed out: {e}")
+            except httpx.TransportError as e:
+                error = OpenAIRequestError(f"OpenAI request to {path} failed: {e}")
+
+            await self._backoff(attempt, error, retry_after, deadline)
+            attempt += 1
+
+    async def _stream_with_retries(self, path: str, payload: Dict[str, Any], timeout: float, deadline: Optional[float]) -> AsyncIterator[str]:
+        attempt = 0
+        while True:
+            attempt_timeout = _attempt_timeout(path, timeout, deadline)
+            retry_after: Optional[float] = None
+            started = False
+            try:
+                async with self._semaphore:
+                    self.counters["attempts"] += 1
+                    async with self._http.stream("POST", path, json=payload, timeout=attempt_timeout) as resp:
+                        if resp.status_code < 400:
+                            async for line in resp.aiter_lines():
+                                if deadline is not None and time.monotonic() >= deadline:
+                                    raise TimeoutError(f"OpenAI stream from {path} exceeded its deadline")
+                                delta = _stream_delta(line)
+                                if delta is _STREAM_END:
+                                    return
+                                if delta:
+                                    started = True
+                                    yield delta
+                            return
+                        await resp.aread()
+                        error: Exception = OpenAIRequestError(
+                            f"OpenAI {path} returned HTTP {resp.status_code}: {resp.text[:200]}", status=resp.status_code
+                        )
+                        if resp.status_code not in RETRYABLE_STATUS and resp.status_code < 500:
+                            raise error
+                        retry_after = _parse_retry_after(resp.headers.get("retry-after"))
+            except httpx.TimeoutException as e:
+                error = TimeoutError(f"OpenAI stream from {path} timed out: {e}")
+                if started:
+                    raise error from e
+            except httpx.TransportError as e:
+                error = OpenAIRequestError(f"OpenAI stream from {path} failed: {e}")
+                if started:
+                    raise error from e
+
+            await self._backoff(attempt, error, retry_after, deadline)
+            attempt += 1
+
+    async def _backoff(self, attempt: int, error: Exception, retry_after: Optional[float], deadline: Optional[float]) -> None:
+        """Sleep before retry ``attempt + 1``, or raise ``error`` when retries or time are used up."""
+        if attempt >= self.max_retries:
+            raise error
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt)) * (0.5 + random.random() / 2)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            raise error
+        self.counters["retries"] += 1
+        await asyncio.sleep(delay)
+
+
+def _attempt_timeout(path: str, timeout: float, deadline: Optional[float]) -> float:
+    if deadline is None:
+        return timeout
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError(f"OpenAI request to {path} exceeded its deadline")
+    return min(timeout, remaining)
+
+
+_STREAM_END = object()
+
+
+def _stream_delta(line: str):
+    """Content of one ``data:`` line of a chat-completions stream; ``_STREAM_END`` on ``[DONE]``."""
+    if not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return _STREAM_END
+    try:
+        chunk = json.loads(data)
+    except json.JSONDecodeError:
+        return None
+    choices = chunk.get("choices") or [{}]
+    return (choices[0].get("delta") or {}).get("content")
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class OpenAIClient:
+    """
+    Synchronous, thread-safe facade over ``AsyncOpenAIClient`` (same keyword options).
+
+    ``chat`` / ``embed`` accept an optional absolute ``deadline`` from
+    ``time.monotonic()``; the request budget is enforced inside the client.
+    """
+
+    def __init__(self, api_key: str, model: str = "gpt-4o", **options: Any) -> None:
+        if not api_key:
+            raise ValueError("OpenAI API key is required.")
+        self.api_key = api_key
+        self.model = model
+        self.options = options
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[AsyncOpenAIClient] = None
+
+    def chat(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        deadline: Optional[float] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+        followups: Optional[List[Dict[str, str]]] = None,
+        model: Optional[str] = None,
+    ) -> str:
+        """
+        ``response_format`` is passed through (e.g. a JSON schema); ``followups``
+        are extra turns after the user prompt, such as a repair request;
+        ``model`` overrides the client's default model for this call.
+        """
+        return self._run(
+            lambda client: client.chat(
+                system_prompt,
+                user_prompt,
+                deadline=deadline,
+                response_format=response_format,
+                followups=followups,
+                model=model,
+            )
+        )
+
+    def chat_stream(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        deadline: Optional[float] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None,
+    ) -> Iterator[str]:
+        """Content deltas of a streamed completion; closing the generator cancels the request."""
+        loop, client = self._ensure_started()
+        chunks: queue.Queue = queue.Queue()
+
+        async def pump() -> None:
+            try:
+                async for delta in client.chat_stream(
+                    system_prompt, user_prompt, deadline=deadline, response_format=response_format, model=model
+                ):
+                    chunks.put((delta, None))
+            except Exception as e:
+                chunks.put((None, e))
+            else:
+                chunks.put((None, None))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), loop)
+        try:
+            while True:
+                delta, error = chunks.get()
+                if error is not None:
+                    raise error
+                if delta is None:
+                    return
+                yield delta
+        finally:
+            future.cancel()
+
+    def embed(self, text: str, model: str = "text-embedding-3-small", deadline: Optional[float] = None) -> List[float]:
+        return self._run(lambda client: client.embed(text, model=model, deadline=deadline))
+
+    def stats(self) -> Dict[str, Any]:
+        client = self._client if self._pid == os.getpid() else None
+        return dict(client.counters) if client else {}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pid != os.getpid() or self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result(timeout=5)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._pid = None
+
+    def _run(self, call):
+        loop, client = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(call(client), loop).result()
+
+    def _ensure_started(self):
+        # 事件循环线程不会被 fork 继承：每个进程第一次调用时各自创建
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="openai-client-loop", daemon=True).start()
+                    self._client = asyncio.run_coroutine_threadsafe(self._create_client(), loop).result()
+                    self._loop = loop
+                    self._pid = os.getpid()
+        return self._loop, self._client
+
+    async def _create_client(self) -> AsyncOpenAIClient:
+        return AsyncOpenAIClient(self.api_key, model=self.model, **self.options)
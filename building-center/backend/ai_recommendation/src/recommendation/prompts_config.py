@@ -40,7 +40,7 @@ Estimation rules for missing unit-type prices (adjustable defaults):
 
 Robustness:
 - Select EXACTLY 3 UNIQUE building IDs from the deduplicated, in-radius candidates.
-- Output ONLY the three IDs in the exact format: ID1, ID2, ID3 (no extra text).
+- Output ONLY the JSON described in the user prompt (no extra text); copy every ID exactly from the candidate list.
 - Never invent IDs, never relax the radius rule. Budget is soft only within the single 10% allowance as described.
 
 Scoring guidance:
@@ -160,11 +160,100 @@ CANDIDATE_BUILDING_TEMPLATE = """
    Longitude: {longitude}
 """
 
+# =============================================================================
+# 服务端去重 (Server-side Deduplication)
+# 候选已在服务端按坐标去重时，用下面的文本替换让GPT自行去重的指令，节省token与推理
+# =============================================================================
+
+SYSTEM_DEDUP_RULE = """- Perform deduplication only by geo-coordinates: candidates within ~30 meters great-circle distance are the same physical building.
+"""
+
+SYSTEM_PREDEDUPED_RULE = """- Candidates are already deduplicated by geo-coordinates (no two are within ~{radius_m:.0f} meters); treat every ID as a distinct building.
+"""
+
+USER_TASK_DEDUP_LINE = """Apply the System Prompt policies. Filter by radius (miles), deduplicate buildings by geo-distance ≤ 30 meters, then select 3 buildings.
+"""
+
+USER_TASK_PREDEDUPED_LINE = """Apply the System Prompt policies. Candidates are already deduplicated by location; filter by radius (miles), then select 3 buildings.
+"""
+
+
+# =============================================================================
+# 结构化输出 (Structured Output)
+# 排序调用使用 JSON schema（见 ranking_output.py）时，用下面的简短说明替换数组示例；
+# 解析校验失败时，把错误原因连同原回答发回模型修复一次
+# =============================================================================
+
+USER_OUTPUT_ARRAY_FORMAT = """Return EXACTLY 3 buildings in JSON format with their IDs and reasons:
+[
+  {
+    "id": "building_xxxx",
+    "reasons": ["reason 1", "reason 2", "reason 3"]
+  },
+  {
+    "id": "building_yyyy",
+    "reasons": ["reason 1", "reason 2", "reason 3"]
+  },
+  {
+    "id": "building_zzzz",
+    "reasons": ["reason 1", "reason 2", "reason 3"]
+  }
+]
+"""
+
+USER_OUTPUT_STRUCTURED_FORMAT = """Return EXACTLY 3 buildings, best first, in the "recommendations" array of the response schema; each item has the building "id" and its "reasons".
+"""
+
+RANKING_REPAIR_PROMPT_TEMPLATE = """Your previous answer could not be used: {error}.
+Answer again with ONLY the corrected JSON. Use IDs exactly as written in the CANDIDATE BUILDINGS list, each at most once."""
+
+
+# =============================================================================
+# 紧凑候选编码 (Compact Candidate Encoding)
+# 每栋建筑一行，缩写列名，坐标保留4位小数（约11米），输入token约为块状模板的三分之一
+# =============================================================================
+
+# 候选编码方式："compact"（表格，每行一栋）或 "block"（上面的多行模板）
+CANDIDATE_ENCODING = "compact"
+
+# GPT排序提示词（系统 + 用户）的token预算；超出时按评分从低到高丢弃候选
+PROMPT_TOKEN_BUDGET = 8000
+
+# 候选名称 / 价格字段在紧凑编码中的最大长度
+COMPACT_TEXT_MAX_CHARS = 48
+
+COMPACT_CANDIDATE_HEADER = """Columns (one building per row, "|" separated):
+#|ID|Name|Address|Score|Crime incidents|Safety rating|Transit stops|Car score/100|Amenities|Dining/Shopping/Fitness/Entertainment POIs|Pricing|Lat,Lon"""
+
+COMPACT_CANDIDATE_TEMPLATE = "{idx}|{building_id}|{name}|{address}|{total_score:.3f}|{safety_incidents}|{safety_rating}|{transit_stops}|{car_score}|{amenities_count}|{dining}/{shopping}/{fitness}/{entertainment}|{pricing}|{latitude},{longitude}"
+
+
+def _compact_text(value, max_chars: int = COMPACT_TEXT_MAX_CHARS) -> str:
+    text = " ".join(str(value).replace("|", "/").split())
+    return text if len(text) <= max_chars else text[: max_chars - 1] + "…"
+
+
+def _compact_address(address: str) -> str:
+    # 只保留 "街道, 城市"，去掉州、邮编和 "美国" 等后缀
+    parts = [p.strip() for p in str(address).split(",") if p.strip()]
+    return _compact_text(", ".join(parts[:2]) if parts else "N/A")
+
+
+def _compact_coordinate(value) -> str:
+    try:
+        return f"{float(value):.4f}"
+    except (TypeError, ValueError):
+        return "N/A"
+
+
 # =============================================================================
 # 提示词组装函数
 # =============================================================================
 
-def build_system_prompt() -> str:
+def build_system_prompt(dedupe_radius_m: float = None) -> str:
+    """dedupe_radius_m：候选已在服务端按该距离（米）去重时传入，去掉让GPT自行去重的规则"""
+    if dedupe_radius_m:
+        return SYSTEM_PROMPT.replace(SYSTEM_DEDUP_RULE, SYSTEM_PREDEDUPED_RULE.format(radius_m=dedupe_radius_m)).strip()
     return SYSTEM_PROMPT.strip()
 
 
@@ -181,6 +270,8 @@ def build_user_prompt(
     rooms_text: str = "",
     extra_fields: dict = None,
     style_prefs_text: str = "", 
+    dedupe_radius_m: float = None,
+    structured_output: bool = False,
 ) -> str:
     """
     组装完整用户提示词（全国可用 + 半径英里 + 仅经纬度去重 + 预算10%软超且最多1套 + R2 价格匹配 + 风格软偏好）
@@ -190,6 +281,8 @@ def build_user_prompt(
       - rooms_text：如 "1,2,3" 或 "Flexible"
       - roommate_text：如 "2 persons, household budget"
       - style_prefs_text：将 8 张外立面喜欢/不喜欢的结果总结成简明要点（如 "Likes: modern glass, high-rise; Dislikes: vintage brick"）
+      - dedupe_radius_m：候选已在服务端去重时传入，任务说明中不再要求GPT去重
+      - structured_output：排序调用带 JSON schema 时为 True，输出格式改为简短说明
     """
     parts = [USER_PROMPT_INTRO]
 
@@ -226,7 +319,12 @@ def build_user_prompt(
         if lines:
             parts.append(USER_PROMPT_EXTRA_SECTION_TEMPLATE.format(extra_text="\n".join(lines)))
 
-    parts.append(USER_PROMPT_INSTRUCTIONS)
+    instructions = USER_PROMPT_INSTRUCTIONS
+    if dedupe_radius_m:
+        instructions = instructions.replace(USER_TASK_DEDUP_LINE, USER_TASK_PREDEDUPED_LINE)
+    if structured_output:
+        instructions = instructions.replace(USER_OUTPUT_ARRAY_FORMAT, USER_OUTPUT_STRUCTURED_FORMAT)
+    parts.append(instructions)
     parts.append(candidates_text.strip() if candidates_text else "")
 
     return "\n".join(parts).strip()
@@ -250,8 +348,29 @@ def format_candidate_building(
     pricing: str,
     latitude: str = "",
     longitude: str = "",
+    encoding: str = "block",
 ) -> str:
-    """格式化单个候选（包含经纬度，供半径过滤与同址去重使用）"""
+    """格式化单个候选（包含经纬度，供半径过滤与同址去重使用）；encoding="compact" 时输出单行表格"""
+    if encoding == "compact":
+        return COMPACT_CANDIDATE_TEMPLATE.format(
+            idx=idx,
+            building_id=building_id,
+            name=_compact_text(name),
+            address=_compact_address(address),
+            total_score=total_score,
+            safety_incidents=safety_incidents,
+            safety_rating=safety_rating,
+            transit_stops=transit_stops,
+            car_score=car_score,
+            amenities_count=amenities_count,
+            dining=dining,
+            shopping=shopping,
+            fitness=fitness,
+            entertainment=entertainment,
+            pricing=_compact_text(pricing),
+            latitude=_compact_coordinate(latitude),
+            longitude=_compact_coordinate(longitude),
+        )
     return CANDIDATE_BUILDING_TEMPLATE.format(
         idx=idx,
         building_id=building_id,
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Contract for the GPT ranking answer: response schema and strict validation.
+
+The ranking call asks for ``{"recommendations": [{"id", "reasons"}, ...]}``
+through OpenAI structured outputs (``RANKING_RESPONSE_FORMAT``); a bare JSON
+array is accepted as well for models without schema support. ``parse_ranking``
+validates an answer against the candidate ids that were offered and raises
+``RankingOutputError`` with a message that can be sent back to the model in a
+repair turn.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Collection, Dict, List, Optional, Set
+
+MAX_PICKS = 3
+
+RANKING_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "recommendations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "string"},
+                    "reasons": {"type": "array", "items": {"type": "string"}},
+                },
+                "required": ["id", "reasons"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["recommendations"],
+    "additionalProperties": False,
+}
+
+RANKING_RESPONSE_FORMAT: Dict[str, Any] = {
+    "type": "json_schema",
+    "json_schema": {"name": "building_ranking", "strict": True, "schema": RANKING_SCHEMA},
+}
+
+
+class RankingOutputError(ValueError):
+    pass
+
+
+def parse_ranking(output: Optional[str], candidate_ids: Collection[str], max_picks: int = MAX_PICKS) -> List[Dict[str, Any]]:
+    """
+    Strictly parse a ranking answer into [{'id', 'reasons'}, ...] (at most
+    ``max_picks``). Every id must be one of ``candidate_ids`` and unique.
+    """
+    text = _strip_code_fence(output or "")
+    if not text:
+        raise RankingOutputError("empty response")
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise RankingOutputError(f"response is not valid JSON ({e.msg} at position {e.pos})") from None
+
+    items = data.get("recommendations") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        raise RankingOutputError('expected an object with a "recommendations" array')
+    if not items:
+        raise RankingOutputError("no recommendations returned")
+
+    picks: List[Dict[str, Any]] = []
+    seen: Set[str] = set()
+    for item in items[:max_picks]:
+        picks.append(validate_pick(item, candidate_ids, seen))
+    return picks
+
+
+def validate_pick(item: Any, candidate_ids: Collection[str], seen: Set[str]) -> Dict[str, Any]:
+    """One recommendation object; adds its id to ``seen``."""
+    if not isinstance(item, dict) or not isinstance(item.get("id"), str):
+        raise RankingOutputError('each recommendation must be an object with a string "id"')
+    building_id = item["id"].strip()
+    if building_id not in candidate_ids:
+        raise RankingOutputError(f"id {building_id!r} is not in the candidate list")
+    if building_id in seen:
+        raise RankingOutputError(f"id {building_id!r} is recommended more than once")
+    reasons = item.get("reasons", [])
+    if not isinstance(reasons, list) or not all(isinstance(reason, str) for reason in reasons):
+        raise RankingOutputError(f'"reasons" for {building_id!r} must be an array of strings')
+    seen.add(building_id)
+    return {"id": building_id, "reasons": reasons}
+
+
+def _strip_code_fence(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return text.strip()
@@ -36,34 +36,43 @@ Usage example (from a script or notebook):
 from __future__ import annotations
 
 import json
-import math
 import os
 import textwrap
-from dataclasses import dataclass
+import threading
+import time
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Tuple
-
-import requests
-
-from src.pipeline.geo_utils import haversine_distance
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from src.pipeline.geo_utils import METERS_PER_MILE, haversine_distance_array
+from src.recommendation.building_store import TAG_FEATURE_INDEX, BuildingRecord, BuildingStore
+from src.recommendation.cascade import ROUTE_LARGE, ROUTE_SKIP, CascadeDecision, CascadePolicy
+from src.recommendation.embedding_index import EmbeddingBlock, load_embedding_block
+from src.recommendation.gazetteer import Gazetteer
+from src.recommendation.geocoding import geocode_location
+from src.recommendation.llm_cache import LLMResponseCache
+from src.recommendation.openai_client import OpenAIClient
 from src.recommendation.prompts_config import (
+    CANDIDATE_ENCODING,
+    COMPACT_CANDIDATE_HEADER,
+    PROMPT_TOKEN_BUDGET,
+    RANKING_REPAIR_PROMPT_TEMPLATE,
     build_system_prompt,
     build_user_prompt,
     format_candidate_building,
 )
-
-
-# ---------------------------------------------------------------------------
-# Data containers
-# ---------------------------------------------------------------------------
-
-
-@dataclass
-class BuildingRecord:
-    building_id: str
-    county: str
-    data: Dict[str, Any]
-    embedding: Optional[List[float]]
+from src.recommendation.ranking_output import (
+    MAX_PICKS,
+    RANKING_RESPONSE_FORMAT,
+    RankingOutputError,
+    parse_ranking,
+    validate_pick,
+)
+from src.recommendation.snapshot import fingerprint_sources, load_snapshot, save_snapshot
+from src.recommendation.stream_parser import PickStreamParser
+from src.recommendation.token_budget import estimate_tokens, fit_items
+from src.recommendation.utils import ensure_list, load_json, parse_float
 
 
 # ---------------------------------------------------------------------------
@@ -71,128 +80,24 @@ class BuildingRecord:
 # ---------------------------------------------------------------------------
 
 
-def load_json(path: Path) -> Any:
-    with path.open("r", encoding="utf-8") as fh:
-        return json.load(fh)
-
-
-def ensure_list(value: Any) -> List[Any]:
-    if value is None:
-        return []
-    if isinstance(value, list):
-        return value
-    return [value]
-
-
-def geocode_location(query: str) -> Optional[Tuple[float, float]]:
-    """
-    Resolve a place name to latitude/longitude using Photon API (via local backend).
-    Returns (lat, lon) in degrees if successful, otherwise None.
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
     """
-    try:
-        # 使用本地Node后端的Photon API（支持中文翻译）
-        resp = requests.get(
-            "http://localhost:5003/api/geo/search",
-            params={"q": query, "limit": 1},
-            timeout=15,
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        
-        # data格式: { top: {...}, candidates: [...] }
-        if data and data.get("top"):
-            top = data["top"]
-            lat = top.get("lat")
-            lon = top.get("lon")
-            if lat and lon:
-                return float(lat), float(lon)
-        return None
-    except Exception as e:
-        print(f"⚠️ Geocoding error: {e}")
-        return None
-
-
-def parse_float(value: Any) -> Optional[float]:
-    try:
-        if value is None:
-            return None
-        return float(value)
-    except (TypeError, ValueError):
-        return None
-
-
-def normalize_scalar(value: Optional[float], min_val: float, max_val: float, invert: bool = False) -> float:
-    if value is None:
-        return 0.0
-    if math.isclose(max_val, min_val):
-        return 0.0
-    ratio = (value - min_val) / (max_val - min_val)
-    ratio = max(0.0, min(1.0, ratio))
-    return 1.0 - ratio if invert else ratio
-
-
-def cosine_similarity(vec_a: List[float], vec_b: List[float]) -> float:
-    if not vec_a or not vec_b:
-        return 0.0
-    if len(vec_a) != len(vec_b):
-        return 0.0
-    dot = sum(a * b for a, b in zip(vec_a, vec_b))
-    norm_a = math.sqrt(sum(a * a for a in vec_a))
-    norm_b = math.sqrt(sum(b * b for b in vec_b))
-    if norm_a == 0 or norm_b == 0:
-        return 0.0
-    return dot / (norm_a * norm_b)
-
-
-# ---------------------------------------------------------------------------
-# OpenAI helpers
-# ---------------------------------------------------------------------------
-
-
-class OpenAIClient:
-    """Minimal OpenAI client using HTTP requests (no external SDK dependency)."""
+    Indices of the ``k`` highest scores, best first, without a full sort.
 
-    def __init__(self, api_key: str, model: str = "gpt-4o"):
-        if not api_key:
-            raise ValueError("OpenAI API key is required.")
-        self.api_key = api_key
-        self.model = model
-        self._session = requests.Session()
+    Uses ``np.argpartition``; ties are broken by position (lower index first),
+    which matches a stable descending sort of the whole array.
+    """
+    n = scores.size
+    if k <= 0 or n == 0:
+        return np.zeros(0, dtype=np.int64)
+    if k >= n:
+        return np.argsort(-scores, kind="stable")
 
-    def chat(self, system_prompt: str, user_prompt: str) -> str:
-        payload = {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-        }
-        resp = self._session.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-            },
-            json=payload,
-            timeout=240,  # 增加到4分钟
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        return data["choices"][0]["message"]["content"]
-
-    def embed(self, text: str, model: str = "text-embedding-3-small") -> List[float]:
-        payload = {"model": model, "input": text}
-        resp = self._session.post(
-            "https://api.openai.com/v1/embeddings",
-            headers={
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-            },
-            json=payload,
-            timeout=180,  # 增加到3分钟
-        )
-        resp.raise_for_status()
-        return resp.json()["data"][0]["embedding"]
+    kth_score = scores[np.argpartition(-scores, k - 1)[k - 1]]
+    above = np.flatnonzero(scores > kth_score)
+    ties = np.flatnonzero(scores == kth_score)[: k - above.size]
+    chosen = np.sort(np.concatenate([above, ties]))
+    return chosen[np.argsort(-scores[chosen], kind="stable")]
 
 
 # ---------------------------------------------------------------------------
@@ -210,32 +115,153 @@ class HousingRecommender:
         openai_api_key: Optional[str] = None,
         gpt_model: str = "gpt-4o",
         query_embedding_model: str = "text-embedding-3-small",
+        snapshot_dir: Optional[str] = None,
+        geocoder: Optional[Callable[[str], Optional[Tuple[float, float]]]] = None,
+        places_path: Optional[str] = None,
+        offline_geocoding: str = "first",
+        llm_cache: Optional[LLMResponseCache] = None,
+        openai_client: Optional[OpenAIClient] = None,
+        request_budget_seconds: Optional[float] = None,
+        candidate_encoding: str = CANDIDATE_ENCODING,
+        prompt_token_budget: Optional[int] = PROMPT_TOKEN_BUDGET,
+        dedupe_radius_m: Optional[float] = 30.0,
+        dedupe_at_load: bool = False,
+        structured_output: bool = True,
+        cascade_policy: Optional[CascadePolicy] = None,
     ) -> None:
         self.enriched_paths = [Path(p) for p in enriched_paths]
         self.embedding_paths = [Path(p) for p in embedding_paths]
+        self.snapshot_dir = Path(snapshot_dir) if snapshot_dir else None
+        self.geocoder = geocoder or geocode_location
+        self.places_path = Path(places_path) if places_path else None
+        # "first": 离线地名索引精确命中时直接使用，否则调用 HTTP 地理编码，HTTP 未命中再用离线近似匹配；
+        # "only": 只用离线索引（含近似匹配）；"off": 只用 HTTP
+        if offline_geocoding not in ("first", "only", "off"):
+            raise ValueError(f"Unknown offline_geocoding mode: {offline_geocoding!r}")
+        self.offline_geocoding = offline_geocoding
         self.openai_key = openai_api_key
         self.gpt_model = gpt_model
         self.query_embedding_model = query_embedding_model
-        self._buildings: List[BuildingRecord] = []
-        self._embedding_matrix: Optional[List[List[float]]] = None
-        self._load_data()
-        self._openai_client = OpenAIClient(openai_api_key, model=gpt_model) if openai_api_key else None
+        self.llm_cache = llm_cache
+        # 单次推荐中模型调用（嵌入 + GPT）的总时间预算；None 表示只受客户端超时限制
+        self.request_budget_seconds = request_budget_seconds
+        # GPT提示词：候选编码方式（compact / block）与 token 预算（None 表示不限制）
+        if candidate_encoding not in ("compact", "block"):
+            raise ValueError(f"Unknown candidate_encoding: {candidate_encoding!r}")
+        self.candidate_encoding = candidate_encoding
+        self.prompt_token_budget = prompt_token_budget
+        # 同址去重：评分后合并距离 <= dedupe_radius_m 的候选（None/0 关闭）；
+        # dedupe_at_load 时加载数据后一次性划分同址房源，请求时每处只保留评分最高的一条
+        self.dedupe_radius_m = dedupe_radius_m or None
+        self.dedupe_at_load = dedupe_at_load and self.dedupe_radius_m is not None
+        # 排序调用使用 JSON schema 结构化输出；回答经严格校验，失败时修复重试一次
+        self.structured_output = structured_output
+        self._ranking_counters = {
+            "calls": 0,
+            "parse_failures": 0,
+            "repairs": 0,
+            "repaired": 0,
+            "call_failures": 0,
+            "fallbacks": 0,
+            "route_skip": 0,
+            "route_small": 0,
+            "route_large": 0,
+        }
+        self._counters_lock = threading.Lock()
+        # 模型级联：规则评分已有明显差距时用小模型或跳过GPT（None 表示总是使用 gpt_model）
+        self.cascade_policy = cascade_policy
+        # _store 是不可变数据集；热重载时整体替换，进行中的请求继续使用旧引用
+        self._store: BuildingStore = self._load_store()
+        self._reload_lock = threading.Lock()
+        self.data_version = 1
+        self.data_loaded_at = time.time()
+        if openai_client is None and openai_api_key:
+            openai_client = OpenAIClient(openai_api_key, model=gpt_model)
+        self._openai_client = openai_client
 
     # ------------------------------------------------------------------
     # Data loading
     # ------------------------------------------------------------------
 
-    def _load_data(self) -> None:
-        embeddings_by_id: Dict[str, List[float]] = {}
+    def _load_store(self) -> BuildingStore:
+        """Load the building store, reusing a valid snapshot when configured."""
+        if self.snapshot_dir is None:
+            store = self._build_store()
+        else:
+            sources = self.data_sources()
+            store = load_snapshot(self.snapshot_dir, sources)
+            if store is None:
+                fingerprints = fingerprint_sources(sources)
+                store = self._build_store()
+                try:
+                    save_snapshot(self.snapshot_dir, store, fingerprints)
+                except OSError as e:
+                    print(f"⚠️ Failed to write recommender snapshot: {e}")
+
+        if self.dedupe_at_load:
+            store.site_labels = store.colocated_sites(self.dedupe_radius_m / METERS_PER_MILE)
+            print(f"🧹 标记了 {int((store.site_labels != store.all_rows()).sum())} 个同址重复房源")
+        return store
+
+    def data_sources(self) -> List[Path]:
+        """Files the building store is built from (watched for hot reload)."""
+        sources = self.enriched_paths + self.embedding_paths
+        if self.places_path is not None:
+            sources.append(self.places_path)
+        return sources
+
+    def reload(self) -> bool:
+        """
+        Rebuild the building store from disk and swap it in atomically.
+
+        The new store is fully built before the swap; requests that already
+        captured the old store finish on it. Returns False if another reload
+        is already running.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            self._swap_store()
+            return True
+        finally:
+            self._reload_lock.release()
+
+    def reload_async(self) -> bool:
+        """Start ``reload`` on a background thread; False if one is already running."""
+        # 在调用线程中占用锁，两个并发触发不会同时通过检查；后台线程完成后释放
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+
+        def run() -> None:
+            try:
+                self._swap_store()
+            except Exception as e:
+                print(f"❌ 建筑数据重新加载失败: {e}")
+            finally:
+                self._reload_lock.release()
+
+        try:
+            threading.Thread(target=run, name="recommender-reload", daemon=True).start()
+        except Exception:
+            self._reload_lock.release()
+            raise
+        return True
+
+    def _swap_store(self) -> None:
+        """Build the new store and swap it in; the caller holds ``_reload_lock``."""
+        store = self._load_store()
+        self._store = store
+        self.data_version += 1
+        self.data_loaded_at = time.time()
+        print(f"✅ 建筑数据已重新加载: {len(store)} 个建筑 (version {self.data_version})")
+
+    def _build_store(self) -> BuildingStore:
+        # 优先内存映射 .npy 旁路文件，缺失或过期时回退到解析 JSON
+        embedding_blocks: List[EmbeddingBlock] = []
         for path in self.embedding_paths:
-            if not path.exists():
-                continue
-            data = load_json(path)
-            for record in data:
-                building_id = record.get("building_id")
-                embedding = record.get("embedding")
-                if building_id and isinstance(embedding, list):
-                    embeddings_by_id[building_id] = embedding
+            block = load_embedding_block(path)
+            if block is not None:
+                embedding_blocks.append(block)
 
         all_buildings: List[BuildingRecord] = []
         for path in self.enriched_paths:
@@ -252,18 +278,24 @@ class HousingRecommender:
                         building_id=building_id,
                         county=county,
                         data=building,
-                        embedding=embeddings_by_id.get(building_id),
                     )
                 )
 
-        self._buildings = all_buildings
-        self._embedding_matrix = [b.embedding for b in all_buildings if b.embedding]
+        store = BuildingStore(all_buildings, embeddings=embedding_blocks)
+        store.gazetteer = Gazetteer.from_files(self.places_path, [record.data for record in all_buildings])
+        return store
 
     # ------------------------------------------------------------------
     # Public API
     # ------------------------------------------------------------------
 
-    def recommend(self, user_request: Dict[str, Any], return_top_n: int = 20) -> Dict[str, Any]:
+    def recommend(
+        self,
+        user_request: Dict[str, Any],
+        return_top_n: int = 20,
+        use_gpt: bool = True,
+        deadline: Optional[float] = None,
+    ) -> Dict[str, Any]:
         """
         Main entry point.
         Expected user_request keys (all optional except location/radius/priorities):
@@ -273,78 +305,477 @@ class HousingRecommender:
             - budget: {"max_rent": int, "bedrooms": Optional[int]}
             - housing_type, roommate_preference, layout_requirements (dict), notes: str
             - return_top_n: number of top candidates to return (default 20, can be 40 for refinement)
+        use_gpt=False skips the model call and returns the score-based top 3 as
+        final_recommendations (see select_with_gpt for running it later).
+        "selection" records the cascade route of the selection step (None with use_gpt=False).
+        "store" is the data snapshot the request was ranked against; pass it to
+        get_buildings so a reload in between cannot mix old ids with new data.
+        ``deadline`` is an absolute ``time.monotonic()`` time for all model calls
+        (default: now + request_budget_seconds).
         """
-        filtered = self._filter_by_location(user_request)
-        filtered = self._filter_by_budget(filtered, user_request.get("budget"))
-
-        if not filtered:
-            return {"top20": [], "final_recommendations": []}
-
-        priorities = ensure_list(user_request.get("top_priorities"))
-        weights = self._compute_priority_weights(priorities)
-
-        query_embedding = None
-        if self._openai_client and user_request.get("notes"):
-            query_text = self._build_query_text(user_request)
-            try:
-                query_embedding = self._openai_client.embed(query_text, model=self.query_embedding_model)
-            except Exception:
-                query_embedding = None
-
-        scored = self._score_buildings(filtered, weights, query_embedding=query_embedding)
-        scored.sort(key=lambda x: x["total_score"], reverse=True)
-        top_n = scored[:return_top_n]  # 支持可配置的top_n
-
-        # Prepare GPT selection
-        if self._openai_client:
-            prompt = self._build_prompt(user_request, top_n, weights)
-            gpt_output = self._openai_client.chat(self._prompt_system(), prompt)
-            gpt_results = self._parse_gpt_output(gpt_output)
-            if not gpt_results:
-                # 回退：没有GPT结果时使用top3
-                final_ids = [{'id': entry["building_id"], 'reasons': []} for entry in top_n[:3]]
-            else:
-                final_ids = gpt_results
+        store = self._store  # 整个请求使用同一份数据快照
+        deadline = deadline or self._request_deadline()
+        ranked = self._rank(store, user_request, return_top_n, use_embedding=True, deadline=deadline)
+        if ranked is None:
+            return {"top20": [], "final_recommendations": [], "selection": None, "store": store}
+
+        filtered, totals, by_tag, winners = ranked
+        top_n = self._build_scored_entries(store, filtered[winners], totals[winners], by_tag, winners)
+
+        decision = None
+        if use_gpt:
+            decision = self.plan_selection(user_request, top_n, final_count=None)
+            final_ids = self.select_with_gpt(user_request, top_n, final_count=None, deadline=deadline, decision=decision)
         else:
-            final_ids = [{'id': entry["building_id"], 'reasons': []} for entry in top_n[:3]]
+            final_ids = self._fallback_selection(top_n)
 
         return {
             "top20": top_n,  # 保持键名为top20以兼容现有代码，但实际可能是top40
             "final_recommendations": final_ids,
+            "selection": decision.to_dict() if decision else None,
+            "store": store,
         }
 
-    def _select_top_with_gpt(self, candidates: List[Dict[str, Any]], user_request: Dict[str, Any], final_count: int = 3) -> List[Dict[str, Any]]:
+    def retrieve_candidates(
+        self,
+        user_request: Dict[str, Any],
+        k: int = 20,
+        offset: int = 0,
+        use_embedding: bool = False,
+    ) -> Dict[str, Any]:
         """
-        公开方法：使用GPT从候选列表中选择最佳的N个
-        用于细化推荐时从40个候选中选择3个
+        Retrieval only: location/budget filtering and scoring, no GPT call.
+        The query-embedding call for ``notes`` is skipped unless use_embedding=True.
+        Returns {"candidates": [...], "matched": int, "data_version": int}; each
+        candidate is {"building_id", "county", "lat", "lon", "total_score", "tag_scores"}
+        (no raw building data). ``offset``/``k`` page through the ranking.
+        """
+        store = self._store
+        data_version = self.data_version
+        ranked = self._rank(store, user_request, offset + k, use_embedding=use_embedding)
+        if ranked is None:
+            return {"candidates": [], "matched": 0, "data_version": data_version}
+
+        filtered, totals, by_tag, winners = ranked
+        winners = winners[offset:]
+        candidates = []
+        for row, idx in zip(filtered[winners], winners):
+            lat, lon = store.lat[row], store.lon[row]
+            candidates.append(
+                {
+                    "building_id": store.ids[row],
+                    "county": store.records[row].county,
+                    "lat": None if np.isnan(lat) else float(lat),
+                    "lon": None if np.isnan(lon) else float(lon),
+                    "total_score": float(totals[idx]),
+                    "tag_scores": {tag: float(values[idx]) for tag, values in by_tag.items()},
+                }
+            )
+        return {"candidates": candidates, "matched": int(filtered.size), "data_version": data_version}
+
+    def refine(
+        self,
+        user_request: Dict[str, Any],
+        refinements: Optional[Dict[str, Any]] = None,
+        candidate_count: int = 40,
+        final_count: int = 3,
+    ) -> Dict[str, Any]:
+        """
+        Refinement pass: widen the candidate pool and let GPT pick again, with
+        exactly one model call (candidate generation runs with use_gpt=False).
+        refinements keys (all optional):
+            - amenities: list of required amenity names
+            - custom_amenities: free-text amenity wishes
+            - commute: {"destination": str, "max_minutes": int}
+            - notes: free-text extra requirements
+        They are passed to GPT as structured constraints and added to the
+        query-embedding text; the commute destination is geocoded when possible.
+        Returns the same shape as ``recommend`` ("top20" holds candidate_count entries).
+        """
+        deadline = self._request_deadline()  # 嵌入查询与GPT精选共用同一时间预算
+        refined_request = dict(user_request)
+        refined_request["refinements"] = self._normalize_refinements(refinements)
+        result = self.recommend(refined_request, return_top_n=candidate_count, use_gpt=False, deadline=deadline)
+        if result["top20"]:
+            decision = self.plan_selection(refined_request, result["top20"], final_count=final_count)
+            result["final_recommendations"] = self.select_with_gpt(
+                refined_request, result["top20"], final_count=final_count, deadline=deadline, decision=decision
+            )
+            result["selection"] = decision.to_dict()
+        return result
+
+    def get_building(
+        self,
+        building_id: str,
+        view: str = "full",
+        fields: Optional[List[str]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Building data by id: a named view ("summary" / "card" / "full") or only the
+        given top-level ``fields``. None when the id is unknown.
+        """
+        store = self._store
+        row = store.id_to_row.get(building_id)
+        if row is None:
+            return None
+        return store.project(row, fields) if fields else store.view(row, view)
+
+    def get_buildings(
+        self,
+        building_ids: Iterable[str],
+        view: str = "full",
+        fields: Optional[List[str]] = None,
+        store: Optional[BuildingStore] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Batch ``get_building`` against one data snapshot: {building_id: data}.
+        Unknown ids are left out. ``store`` defaults to the current snapshot;
+        pass the "store" of a ``recommend`` result to read the data it ranked.
+        """
+        store = self._store if store is None else store
+        buildings: Dict[str, Dict[str, Any]] = {}
+        for building_id in building_ids:
+            row = store.id_to_row.get(building_id)
+            if row is not None:
+                buildings[building_id] = store.project(row, fields) if fields else store.view(row, view)
+        return buildings
+
+    @property
+    def gpt_enabled(self) -> bool:
+        return self._openai_client is not None
+
+    def ranking_stats(self) -> Dict[str, int]:
+        """Counters for the GPT ranking step (model calls, parse failures, repairs, fallbacks)."""
+        with self._counters_lock:
+            return dict(self._ranking_counters)
+
+    def plan_selection(
+        self,
+        user_request: Dict[str, Any],
+        candidates: List[Dict[str, Any]],
+        final_count: Optional[int] = 3,
+    ) -> CascadeDecision:
+        """
+        Route for the selection step (see ``cascade.CascadePolicy``): skip GPT,
+        use the small model, or use ``gpt_model``. Without a policy every
+        request takes the large route.
         """
         if not self._openai_client:
-            return [{'id': entry["building_id"], 'reasons': []} for entry in candidates[:final_count]]
-        
+            return CascadeDecision(ROUTE_SKIP, None, "GPT not configured")
+        if self.cascade_policy is None:
+            return CascadeDecision(ROUTE_LARGE, self.gpt_model, "cascade disabled")
+        return self.cascade_policy.decide(user_request, candidates, self.gpt_model, final_count)
+
+    def select_with_gpt(
+        self,
+        user_request: Dict[str, Any],
+        candidates: List[Dict[str, Any]],
+        final_count: Optional[int] = 3,
+        deadline: Optional[float] = None,
+        decision: Optional[CascadeDecision] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Let GPT pick the final buildings from scored candidates (entries of ``top20``).
+        Returns [{'id': ..., 'reasons': [...]}, ...], at most ``final_count`` picks
+        (None = whatever GPT returned). Falls back to the top 3 by score when GPT
+        is not configured or returns nothing usable. ``deadline`` is an absolute
+        ``time.monotonic()`` time (default: now + request_budget_seconds).
+        ``decision`` is the cascade route from ``plan_selection`` (computed when omitted).
+        """
+        decision = self._take_route(decision or self.plan_selection(user_request, candidates, final_count))
+        if decision.route == ROUTE_SKIP:
+            return self._fallback_selection(candidates, final_count or 3)
+
         priorities = ensure_list(user_request.get("top_priorities"))
         weights = self._compute_priority_weights(priorities)
-        
-        prompt = self._build_prompt(user_request, candidates, weights)
-        gpt_output = self._openai_client.chat(self._prompt_system(), prompt)
-        gpt_results = self._parse_gpt_output(gpt_output)
-        
+
+        prompt = self._build_prompt(user_request, candidates, weights, decision.model)
+        candidate_ids = {entry["building_id"] for entry in candidates}
+        gpt_results = self._rank_with_gpt(prompt, deadline or self._request_deadline(), candidate_ids, decision.model)
+
         if not gpt_results:
-            return [{'id': entry["building_id"], 'reasons': []} for entry in candidates[:final_count]]
-        
+            # 回退：没有GPT结果时使用top3
+            return self._fallback_selection(candidates, final_count or 3)
+
         return gpt_results[:final_count]
 
+    def stream_select_with_gpt(
+        self,
+        user_request: Dict[str, Any],
+        candidates: List[Dict[str, Any]],
+        final_count: Optional[int] = 3,
+        deadline: Optional[float] = None,
+        decision: Optional[CascadeDecision] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming ``select_with_gpt``: yields each {'id', 'reasons'} pick as soon
+        as GPT has finished writing it. Cached rankings and the score fallback
+        are yielded at once; the fallback is used only when GPT produced no pick.
+        """
+        decision = self._take_route(decision or self.plan_selection(user_request, candidates, final_count))
+        if decision.route == ROUTE_SKIP:
+            yield from self._fallback_selection(candidates, final_count or 3)
+            return
+
+        priorities = ensure_list(user_request.get("top_priorities"))
+        weights = self._compute_priority_weights(priorities)
+
+        prompt = self._build_prompt(user_request, candidates, weights, decision.model)
+        candidate_ids = {entry["building_id"] for entry in candidates}
+        picks = self._stream_rank_with_gpt(prompt, deadline or self._request_deadline(), candidate_ids, decision.model)
+        count = 0
+        try:
+            for pick in picks:
+                # 达到 final_count 后继续读完排序（不再发出），让完整结果写入缓存
+                if final_count is None or count < final_count:
+                    yield pick
+                    count += 1
+        finally:
+            picks.close()
+
+        if not count:
+            yield from self._fallback_selection(candidates, final_count or 3)
+
+    def _take_route(self, decision: CascadeDecision) -> CascadeDecision:
+        if self._openai_client:
+            print(f"🪜 精选路径: {decision.route} ({decision.model or '不调用GPT'}) - {decision.reason}")
+            self._count(f"route_{decision.route}")
+        return decision
+
+    def _select_top_with_gpt(self, candidates: List[Dict[str, Any]], user_request: Dict[str, Any], final_count: int = 3) -> List[Dict[str, Any]]:
+        """
+        公开方法：使用GPT从候选列表中选择最佳的N个
+        用于细化推荐时从40个候选中选择3个（保留给旧调用方，见 select_with_gpt）
+        """
+        return self.select_with_gpt(user_request, candidates, final_count=final_count)
+
+    def _normalize_refinements(self, refinements: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        refinements = refinements or {}
+        normalized: Dict[str, Any] = {}
+        amenities = [str(a).strip() for a in ensure_list(refinements.get("amenities")) if str(a).strip()]
+        if amenities:
+            normalized["amenities"] = amenities
+        for key in ("custom_amenities", "notes"):
+            text = str(refinements.get(key) or "").strip()
+            if text:
+                normalized[key] = text
+        commute = refinements.get("commute") or {}
+        destination = str(commute.get("destination") or "").strip()
+        if destination:
+            max_minutes = parse_float(commute.get("max_minutes"))
+            normalized["commute"] = {
+                "destination": destination,
+                "max_minutes": int(max_minutes) if max_minutes is not None else 30,
+                "coordinates": self._geocode(self._store, destination),
+            }
+        return normalized
+
+    @staticmethod
+    def _refinement_fields(refinements: Dict[str, Any], with_coordinates: bool = True) -> Dict[str, str]:
+        """Refinements as "Additional Constraints" lines for the prompt."""
+        fields: Dict[str, str] = {}
+        if refinements.get("amenities"):
+            fields["Required amenities"] = ", ".join(refinements["amenities"])
+        if refinements.get("custom_amenities"):
+            fields["Additional amenities"] = refinements["custom_amenities"]
+        commute = refinements.get("commute")
+        if commute:
+            text = f"to {commute['destination']} within {commute['max_minutes']} minutes"
+            if with_coordinates and commute.get("coordinates"):
+                lat, lon = commute["coordinates"]
+                text += f" (destination at {lat:.5f}, {lon:.5f}; compare with candidate coordinates)"
+            fields["Commute"] = text
+        if refinements.get("notes"):
+            fields["Additional requirements"] = refinements["notes"]
+        return fields
+
+    @staticmethod
+    def _fallback_selection(candidates: List[Dict[str, Any]], count: int = 3) -> List[Dict[str, Any]]:
+        return [{'id': entry["building_id"], 'reasons': []} for entry in candidates[:count]]
+
+    def _request_deadline(self) -> Optional[float]:
+        if not self.request_budget_seconds:
+            return None
+        return time.monotonic() + self.request_budget_seconds
+
+    def _rank_with_gpt(
+        self,
+        prompt: str,
+        deadline: Optional[float] = None,
+        candidate_ids: Iterable[str] = (),
+        model: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Run the ranking prompt through GPT and parse the picks strictly
+        (``parse_ranking`` against ``candidate_ids``); an invalid answer gets one
+        repair turn. ``model`` defaults to ``gpt_model``. Parsed results are
+        served from / stored in ``llm_cache`` (keyed by model) when configured;
+        failures are not cached so the next request retries. Returns [] (caller
+        falls back to the score order) when no valid ranking was obtained.
+        """
+        model = model or self.gpt_model
+        candidate_ids = set(candidate_ids)
+        system_prompt = self._prompt_system()
+        if self.llm_cache is not None:
+            cached = self.llm_cache.get(model, system_prompt, prompt)
+            if cached is not None:
+                return [dict(item) for item in cached]
+
+        self._count("calls")
+        try:
+            gpt_output = self._openai_client.chat(
+                system_prompt, prompt, deadline=deadline, response_format=self._response_format(), model=model
+            )
+            try:
+                gpt_results = parse_ranking(gpt_output, candidate_ids)
+            except RankingOutputError as e:
+                gpt_results = self._repair_ranking(system_prompt, prompt, gpt_output, e, deadline, candidate_ids, model)
+        except Exception as e:
+            # 重试与截止时间都已用完：回退到按评分排序的结果，而不是让整个请求失败
+            print(f"⚠️ GPT排序调用失败，使用评分回退: {e}")
+            self._count("call_failures", "fallbacks")
+            return []
+        if not gpt_results:
+            self._count("fallbacks")
+        elif self.llm_cache is not None:
+            self.llm_cache.set(model, system_prompt, prompt, gpt_results)
+        return gpt_results
+
+    def _repair_ranking(
+        self,
+        system_prompt: str,
+        prompt: str,
+        output: str,
+        error: RankingOutputError,
+        deadline: Optional[float],
+        candidate_ids: Iterable[str],
+        model: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """One repair turn for an answer that failed validation; [] if it fails again."""
+        print(f"⚠️ GPT输出未通过校验（{error}），请求修复一次")
+        self._count("parse_failures", "repairs")
+        followups = [
+            {"role": "assistant", "content": output or ""},
+            {"role": "user", "content": RANKING_REPAIR_PROMPT_TEMPLATE.format(error=error)},
+        ]
+        repaired_output = self._openai_client.chat(
+            system_prompt,
+            prompt,
+            deadline=deadline,
+            response_format=self._response_format(),
+            followups=followups,
+            model=model,
+        )
+        try:
+            results = parse_ranking(repaired_output, candidate_ids)
+        except RankingOutputError as e:
+            print(f"⚠️ 修复后仍无法解析（{e}），使用评分回退")
+            self._count("parse_failures")
+            return []
+        self._count("repaired")
+        return results
+
+    def _response_format(self) -> Optional[Dict[str, Any]]:
+        return RANKING_RESPONSE_FORMAT if self.structured_output else None
+
+    def _count(self, *names: str) -> None:
+        with self._counters_lock:
+            for name in names:
+                self._ranking_counters[name] += 1
+
+    def _stream_rank_with_gpt(
+        self,
+        prompt: str,
+        deadline: Optional[float] = None,
+        candidate_ids: Iterable[str] = (),
+        model: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming ``_rank_with_gpt``: picks are parsed incrementally and each is
+        validated before it is yielded (invalid picks are dropped). When the
+        stream yields no valid pick or a pick failed validation, the full text
+        is parsed strictly and, if that fails, repaired with one non-streaming
+        call; repaired picks not yet yielded are yielded after the streamed
+        ones. Only complete rankings in which every pick is valid are cached.
+        """
+        model = model or self.gpt_model
+        candidate_ids = set(candidate_ids)
+        system_prompt = self._prompt_system()
+        if self.llm_cache is not None:
+            cached = self.llm_cache.get(model, system_prompt, prompt)
+            if cached is not None:
+                yield from (dict(item) for item in cached)
+                return
+
+        self._count("calls")
+        parser = PickStreamParser(max_picks=MAX_PICKS)
+        picks: List[Dict[str, Any]] = []
+        seen: set = set()
+        invalid: Optional[RankingOutputError] = None
+        deltas = self._openai_client.chat_stream(
+            system_prompt, prompt, deadline=deadline, response_format=self._response_format(), model=model
+        )
+        try:
+            for delta in deltas:
+                for item in parser.feed(delta):
+                    try:
+                        pick = validate_pick(item, candidate_ids, seen)
+                    except RankingOutputError as e:
+                        invalid = invalid or e
+                        continue
+                    picks.append(pick)
+                    yield pick
+                if parser.done:
+                    break  # 数组已完整：关闭连接，不再为多余的输出付费
+        except Exception as e:
+            print(f"⚠️ GPT流式排序调用失败: {e}")
+            self._count("call_failures")
+            if not picks:
+                self._count("fallbacks")
+            return
+        finally:
+            deltas.close()
+
+        expected = min(MAX_PICKS, len(candidate_ids))
+        ranking: List[Dict[str, Any]] = []  # 只缓存完整且全部通过校验的排序
+        if not picks or invalid is not None:
+            # 流中没有有效推荐或有推荐未通过校验：与非流式路径一样严格解析，失败则修复一次
+            try:
+                try:
+                    ranking = parse_ranking(parser.text, candidate_ids)
+                except RankingOutputError as e:
+                    ranking = self._repair_ranking(system_prompt, prompt, parser.text, e, deadline, candidate_ids, model)
+            except Exception as e:
+                print(f"⚠️ GPT修复调用失败，使用评分回退: {e}")
+                self._count("call_failures")
+            # 已发出的推荐无法撤回：只补发修复结果中尚未发出的
+            sent = {pick["id"] for pick in picks}
+            for pick in ranking:
+                if len(picks) >= expected:
+                    break
+                if pick["id"] not in sent:
+                    picks.append(pick)
+                    yield pick
+        elif len(picks) == expected:
+            ranking = picks
+        if not picks:
+            self._count("fallbacks")
+        elif ranking and self.llm_cache is not None:
+            self.llm_cache.set(model, system_prompt, prompt, ranking)
+
     # ------------------------------------------------------------------
     # Filtering
     # ------------------------------------------------------------------
 
-    def _filter_by_location(self, user_request: Dict[str, Any]) -> List[BuildingRecord]:
+    def _filter_by_location(self, store: BuildingStore, user_request: Dict[str, Any]) -> np.ndarray:
+        """Return the store rows inside the requested radius."""
         radius = parse_float(user_request.get("radius_miles")) or 5.0
         location = user_request.get("location")
         if isinstance(location, dict):
             lat = parse_float(location.get("lat"))
             lon = parse_float(location.get("lon"))
         elif isinstance(location, str):
-            coords = geocode_location(location)
+            coords = self._geocode(store, location)
             lat, lon = coords if coords else (None, None)
         else:
             lat = lon = None
@@ -352,7 +783,7 @@ class HousingRecommender:
         if lat is None or lon is None:
             # Fallback: return all buildings (already restricted to Bay Area)
             print(f"⚠️ 地理编码失败，返回所有湾区建筑")
-            return list(self._buildings)
+            return store.all_rows()
         
         # 验证坐标是否在湾区范围内
         # 湾区大致范围: lat 36.9-38.9, lon -123.2 to -121.2
@@ -365,58 +796,43 @@ class HousingRecommender:
             print(f"⚠️ 坐标({lat:.4f}, {lon:.4f})不在湾区范围内")
             print(f"   地址 '{location}' 可能被错误地理编码")
             print(f"   回退到返回所有湾区建筑")
-            return list(self._buildings)
-
-        results = []
-        for record in self._buildings:
-            b_lat = parse_float(record.data.get("lat"))
-            b_lon = parse_float(record.data.get("lon"))
-            if b_lat is None or b_lon is None:
-                continue
-            distance = haversine_distance(lat, lon, b_lat, b_lon)
-            if distance <= radius:
-                results.append(record)
-        return results
-
-    def _filter_by_budget(self, buildings: List[BuildingRecord], budget: Optional[Dict[str, Any]]) -> List[BuildingRecord]:
+            return store.all_rows()
+
+        return store.spatial_index.query_radius(lat, lon, radius)
+
+    def _geocode(self, store: BuildingStore, query: str) -> Optional[Tuple[float, float]]:
+        gazetteer = store.gazetteer if self.offline_geocoding != "off" else None
+        if gazetteer is not None and self.offline_geocoding == "only":
+            return gazetteer.resolve(query)
+        if gazetteer is not None:
+            # 只有精确地名可以跳过 HTTP；前缀/模糊匹配可能是附近的另一个地方
+            coords = gazetteer.resolve(query, approximate=False)
+            if coords is not None:
+                return coords
+        coords = self.geocoder(query)
+        if coords is None and gazetteer is not None:
+            coords = gazetteer.resolve(query)
+            if coords is not None:
+                print(f"⚠️ HTTP地理编码未命中，使用离线近似匹配: '{query}' -> {coords}")
+        return coords
+
+    def _filter_by_budget(self, store: BuildingStore, rows: np.ndarray, budget: Optional[Dict[str, Any]]) -> np.ndarray:
         if not budget:
-            return buildings
+            return rows
 
         max_rent = parse_float(budget.get("max_rent"))
         bedrooms = budget.get("bedrooms")
         if max_rent is None:
-            return buildings
-
-        def building_matches(record: BuildingRecord) -> bool:
-            rentcast = ensure_list(record.data.get("rentcast_data"))
-            candidate_rents = []
-            if bedrooms is not None:
-                for entry in rentcast:
-                    if entry.get("bedrooms") == bedrooms and entry.get("rent"):
-                        candidate_rents.append(parse_float(entry.get("rent")))
-            else:
-                for entry in rentcast:
-                    candidate_rents.append(parse_float(entry.get("rent")))
-
-            candidate_rents = [r for r in candidate_rents if r is not None]
-            if candidate_rents:
-                return any(r <= max_rent for r in candidate_rents)
-
-            # fall back to pricing string like "$1,780 - $6,670"
-            pricing = record.data.get("pricing") or record.data.get("Pricing")
-            if isinstance(pricing, str):
-                numbers = []
-                for token in pricing.replace("$", "").replace(",", "").split():
-                    try:
-                        numbers.append(float(token))
-                    except ValueError:
-                        continue
-                if numbers:
-                    return min(numbers) <= max_rent
+            return rows
 
-            return True  # if no pricing info, do not filter out
+        rent_index = store.rent_index
+        if rows.size == len(store):
+            # 未按地理位置缩小范围（如地理编码失败）时，直接在有序租金索引上做区间查找
+            return rent_index.rows_within_budget(max_rent, bedrooms)
 
-        return [record for record in buildings if building_matches(record)]
+        rents = rent_index.effective_rents(bedrooms)[rows]
+        # if no pricing info (NaN), do not filter out
+        return rows[np.isnan(rents) | (rents <= max_rent)]
 
     # ------------------------------------------------------------------
     # Scoring
@@ -435,111 +851,186 @@ class HousingRecommender:
 
     def _score_buildings(
         self,
-        buildings: List[BuildingRecord],
+        store: BuildingStore,
+        rows: np.ndarray,
         weights: Dict[str, float],
         query_embedding: Optional[List[float]] = None,
-    ) -> List[Dict[str, Any]]:
-        # Collect stats for normalization
-        safety_values = []
-        transit_values = []
-        commute_values = []
-        grocery_values = []
-        lifestyle_values = []
-        amenities_counts = []
-        car_scores = []
-
-        for record in buildings:
-            data = record.data
-            crime = data.get("crime_stats") or {}
-            safety_values.append(crime.get("total_incidents", 0))
+    ) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Score ``rows``; returns (total score per row, tag score arrays by tag).
 
-            transit = data.get("transit_accessibility") or {}
-            transit_values.append(transit.get("total_transit", 0))
+        Both are aligned with ``rows``. No per-building dicts are built here.
+        """
+        if rows.size == 0:
+            return np.zeros(0), {}
+
+        def relative(values: np.ndarray, invert: bool = False) -> np.ndarray:
+            # min(1, value / max) over the filtered subset; 0.5 when the max is 0
+            max_value = values.max()
+            if not max_value:
+                return np.full(values.size, 0.5)
+            ratio = np.minimum(1.0, values / max_value)
+            return 1.0 - ratio if invert else ratio
+
+        # 原始特征在加载时已提取（BuildingStore.tag_features），这里只做子集归一化
+        features = store.tag_features[rows]
+        col = TAG_FEATURE_INDEX
+        by_tag: Dict[str, np.ndarray] = {}
+
+        # Safety
+        by_tag["Safety"] = relative(features[:, col["crime_incidents"]], invert=True)
+
+        # Public Transit
+        transit_score = relative(features[:, col["transit_total"]])
+        by_tag["Public Transit"] = transit_score
+
+        # Commute
+        commute = features[:, col["commute_minutes"]]
+        finite_commutes = commute[np.isfinite(commute)]
+        max_commute = finite_commutes.max() if finite_commutes.size else 0
+        fallback = np.isnan(commute) | (commute == 0)
+        if max_commute:
+            commute_score = 1.0 - np.minimum(1.0, commute / max_commute)
+        else:
+            commute_score = np.full(rows.size, 0.5)
+        by_tag["Commute"] = np.where(fallback, 1.0 - transit_score, commute_score)
 
-            commute_values.append(data.get("commute_to_downtown_minutes"))
+        # Near Grocery
+        by_tag["Near Grocery"] = relative(features[:, col["grocery_pois"]])
 
-            pois = (data.get("nearby_pois") or {}).get("categories", {})
-            grocery_values.append((pois.get("dining", 0) or 0) + (pois.get("shopping", 0) or 0))
-            lifestyle_values.append((pois.get("entertainment", 0) or 0) + (pois.get("fitness", 0) or 0))
+        # Lifestyle
+        by_tag["Lifestyle"] = relative(features[:, col["lifestyle_pois"]])
 
-            amenities_counts.append(len(ensure_list(data.get("amenities"))))
+        # Car Friendly
+        car_raw = features[:, col["car_score"]]
+        max_car = car_raw.max()
+        if max_car:
+            by_tag["Car Friendly"] = np.minimum(1.0, car_raw / max_car)
+        else:
+            by_tag["Car Friendly"] = np.where(car_raw != 0, car_raw / 100, 0.5)
 
-            car = data.get("car_friendly") or {}
-            car_scores.append(car.get("car_score", 0))
+        # Pet Friendly
+        by_tag["Pet Friendly"] = np.where(features[:, col["pet_friendly"]] > 0, 1.0, 0.3)
 
-        max_safety = max(safety_values) if safety_values else 0
-        max_transit = max(transit_values) if transit_values else 0
-        finite_commutes = [v for v in commute_values if v is not None and not math.isinf(v)]
-        max_commute = max(finite_commutes, default=0)
-        max_grocery = max(grocery_values) if grocery_values else 0
-        max_lifestyle = max(lifestyle_values) if lifestyle_values else 0
-        max_amenities = max(amenities_counts) if amenities_counts else 0
-        max_car = max(car_scores) if car_scores else 0
+        # Amenities
+        by_tag["Amenities"] = relative(features[:, col["amenity_count"]])
 
-        results = []
-        for record in buildings:
-            data = record.data
-            by_tag = {}
-
-            # Safety
-            incidents = ((data.get("crime_stats") or {}).get("total_incidents")) or 0
-            safety_score = 1.0 - min(1.0, incidents / (max_safety or 1)) if max_safety else 0.5
-            by_tag["Safety"] = safety_score
-
-            # Public Transit
-            total_transit = ((data.get("transit_accessibility") or {}).get("total_transit")) or 0
-            transit_score = min(1.0, total_transit / (max_transit or 1)) if max_transit else 0.5
-            by_tag["Public Transit"] = transit_score
-
-            # Commute
-            commute_minutes = data.get("commute_to_downtown_minutes")
-            if commute_minutes in (None, "", 0):
-                commute_score = 1.0 - transit_score  # fallback
-            else:
-                commute_score = 1.0 - min(1.0, float(commute_minutes) / (max_commute or float(commute_minutes))) if max_commute else 0.5
-            by_tag["Commute"] = commute_score
-
-            # Near Grocery
-            pois = (data.get("nearby_pois") or {}).get("categories", {}) or {}
-            grocery_count = (pois.get("dining", 0) or 0) + (pois.get("shopping", 0) or 0)
-            grocery_score = min(1.0, grocery_count / (max_grocery or 1)) if max_grocery else 0.5
-            by_tag["Near Grocery"] = grocery_score
+        # Weighted total
+        totals = np.zeros(rows.size)
+        for tag in weights:
+            if tag in by_tag:
+                totals = totals + weights[tag] * by_tag[tag]
 
-            # Lifestyle
-            lifestyle_count = (pois.get("entertainment", 0) or 0) + (pois.get("fitness", 0) or 0)
-            lifestyle_score = min(1.0, lifestyle_count / (max_lifestyle or 1)) if max_lifestyle else 0.5
-            by_tag["Lifestyle"] = lifestyle_score
+        if query_embedding is not None:
+            similarity = store.embedding_similarity(rows, query_embedding)
+            has_similarity = ~np.isnan(similarity)
+            totals = np.where(has_similarity, totals * 0.8 + np.nan_to_num(similarity) * 0.2, totals)
 
-            # Car Friendly
-            car_score_raw = ((data.get("car_friendly") or {}).get("car_score")) or 0
-            car_score = min(1.0, car_score_raw / (max_car or 100)) if max_car else (car_score_raw / 100 if car_score_raw else 0.5)
-            by_tag["Car Friendly"] = car_score
+        return totals, by_tag
 
-            # Pet Friendly
-            amenities = [a.lower() for a in ensure_list(data.get("amenities"))]
-            pet_score = 1.0 if any("pet" in a or "dog" in a or "cat" in a for a in amenities) else 0.3
-            by_tag["Pet Friendly"] = pet_score
+    def _rank(
+        self,
+        store: BuildingStore,
+        user_request: Dict[str, Any],
+        k: int,
+        use_embedding: bool = True,
+        deadline: Optional[float] = None,
+    ) -> Optional[Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray], np.ndarray]]:
+        """
+        Filter and score; returns (filtered rows, totals, by_tag, winners) where
+        ``winners`` are the positions of the top ``k`` in score order, or None
+        when nothing passes the filters.
+        """
+        filtered = self._filter_by_location(store, user_request)
+        filtered = self._filter_by_budget(store, filtered, user_request.get("budget"))
 
-            # Amenities
-            amenity_count = len(ensure_list(data.get("amenities")))
-            amenities_score = min(1.0, amenity_count / (max_amenities or 1)) if max_amenities else 0.5
-            by_tag["Amenities"] = amenities_score
+        if filtered.size == 0:
+            return None
 
-            # Weighted total
-            total = sum(weights.get(tag, 0) * by_tag.get(tag, 0) for tag in weights)
+        priorities = ensure_list(user_request.get("top_priorities"))
+        weights = self._compute_priority_weights(priorities)
 
-            if query_embedding is not None and record.embedding:
-                similarity = cosine_similarity(query_embedding, record.embedding)
-                total = total * 0.8 + similarity * 0.2
+        query_embedding = None
+        if use_embedding and self._openai_client and (user_request.get("notes") or user_request.get("refinements")):
+            query_text = self._build_query_text(user_request)
+            try:
+                query_embedding = self._openai_client.embed(
+                    query_text, model=self.query_embedding_model, deadline=deadline
+                )
+            except Exception:
+                query_embedding = None
 
+        totals, by_tag = self._score_buildings(store, filtered, weights, query_embedding=query_embedding)
+        if store.site_labels is not None:
+            winners = self._select_by_site(store.site_labels[filtered], totals, k)
+        elif self.dedupe_radius_m is not None:
+            winners = self._select_distinct(store, filtered, totals, k)
+        else:
+            winners = top_k_indices(totals, k)  # 支持可配置的top_n，只对前K个部分选择
+        return filtered, totals, by_tag, winners
+
+    def _select_distinct(self, store: BuildingStore, rows: np.ndarray, totals: np.ndarray, k: int) -> np.ndarray:
+        """
+        Top-``k`` positions in score order with co-located candidates collapsed:
+        a candidate within ``dedupe_radius_m`` of a better-scored one already kept
+        is skipped, and lower-ranked candidates backfill the list.
+        """
+        if k <= 0 or rows.size == 0:
+            return np.zeros(0, dtype=np.int64)
+        radius_miles = self.dedupe_radius_m / METERS_PER_MILE
+        pool = min(rows.size, 2 * k + 10)
+        while True:
+            kept: List[int] = []
+            kept_lat: List[float] = []
+            kept_lon: List[float] = []
+            for pos in top_k_indices(totals, pool):
+                lat, lon = store.lat[rows[pos]], store.lon[rows[pos]]
+                if kept and not (np.isnan(lat) or np.isnan(lon)):
+                    distances = haversine_distance_array(lat, lon, np.asarray(kept_lat), np.asarray(kept_lon))
+                    if np.any(distances <= radius_miles):
+                        continue
+                kept.append(int(pos))
+                kept_lat.append(lat)
+                kept_lon.append(lon)
+                if len(kept) == k:
+                    return np.asarray(kept, dtype=np.int64)
+            if pool >= rows.size:
+                return np.asarray(kept, dtype=np.int64)
+            # 重复太多，候选池不够补齐：扩大候选池重新选择
+            pool = min(rows.size, pool * 2)
+
+    @staticmethod
+    def _select_by_site(labels: np.ndarray, totals: np.ndarray, k: int) -> np.ndarray:
+        """
+        ``_select_distinct`` with sites precomputed at load (``colocated_sites``):
+        the best-scored listing of each site, top-``k`` in score order.
+        """
+        if k <= 0 or labels.size == 0:
+            return np.zeros(0, dtype=np.int64)
+        order = np.argsort(-totals, kind="stable")
+        _, first = np.unique(labels[order], return_index=True)
+        return order[np.sort(first)[:k]]
+
+    def _build_scored_entries(
+        self,
+        store: BuildingStore,
+        rows: np.ndarray,
+        totals: np.ndarray,
+        by_tag: Dict[str, np.ndarray],
+        positions: np.ndarray,
+    ) -> List[Dict[str, Any]]:
+        """Result dicts for the selected ``rows`` (``positions`` index into ``by_tag``)."""
+        results = []
+        for row, total, idx in zip(rows, totals, positions):
+            record = store.records[row]
             results.append(
                 {
                     "building_id": record.building_id,
                     "name": record.data.get("title"),
                     "address": record.data.get("address"),
                     "county": record.county,
-                    "total_score": total,
-                    "tag_scores": by_tag,
+                    "total_score": float(total),
+                    "tag_scores": {tag: float(values[idx]) for tag, values in by_tag.items()},
                     "data": record.data,
                 }
             )
@@ -552,7 +1043,7 @@ class HousingRecommender:
 
     def _prompt_system(self) -> str:
         """返回系统提示词（从配置文件加载，方便微调）"""
-        return build_system_prompt()
+        return build_system_prompt(dedupe_radius_m=self.dedupe_radius_m)
 
     def _build_query_text(self, user_request: Dict[str, Any]) -> str:
         parts = []
@@ -576,10 +1067,18 @@ class HousingRecommender:
         notes = user_request.get("notes")
         if notes:
             parts.append(f"Additional notes: {notes}")
+        for label, text in self._refinement_fields(user_request.get("refinements") or {}, with_coordinates=False).items():
+            parts.append(f"{label}: {text}")
         return " | ".join(parts)
 
-    def _build_prompt(self, user_request: Dict[str, Any], candidates: List[Dict[str, Any]], weights: Dict[str, float]) -> str:
-        """构建用户提示词（使用配置文件中的模板，方便微调）"""
+    def _build_prompt(
+        self,
+        user_request: Dict[str, Any],
+        candidates: List[Dict[str, Any]],
+        weights: Dict[str, float],
+        model: Optional[str] = None,
+    ) -> str:
+        """构建用户提示词（使用配置文件中的模板，方便微调）；token 预算按实际调用的 model 估算"""
         # 格式化搜索区域
         location = user_request.get("location", "")
         if isinstance(location, dict):
@@ -660,64 +1159,46 @@ class HousingRecommender:
                 pricing=pricing if pricing else 'N/A',
                 latitude=str(data.get('lat', 'N/A')),
                 longitude=str(data.get('lon', 'N/A')),
+                encoding=self.candidate_encoding,
             )
             candidate_lines.append(line)
 
-        # 组装候选建筑文本
-        newline = '\n\n'
-        candidates_text = newline.join(candidate_lines)
-        
-        # 使用配置文件中的函数构建完整提示词
-        prompt = build_user_prompt(
-            priorities_text=priorities_text,
-            budget_text=budget_text,
-            housing_type=housing_type,
-            roommate_text=roommate_text,
-            layout_text=layout_text or 'None',
-            notes=notes or 'None',
-            candidates_text=candidates_text,
-            location_text=location_text,
-            radius_text=radius_text,
-            rooms_text=rooms_text,
-            style_prefs_text=style_prefs_text or '',
-        )
-        
-        return prompt
+        compact = self.candidate_encoding == "compact"
+        extra_fields = self._refinement_fields(user_request.get("refinements") or {})
 
-    def _parse_gpt_output(self, output: str) -> List[Dict[str, Any]]:
-        """解析GPT输出，返回包含ID和推荐理由的列表"""
-        if not output:
-            return []
-        
-        import json
-        import re
-        
-        # 尝试提取JSON数组
-        json_match = re.search(r'\[[\s\S]*\]', output)
-        if json_match:
-            try:
-                parsed = json.loads(json_match.group(0))
-                if isinstance(parsed, list):
-                    result = []
-                    for item in parsed[:3]:  # 只取前3个
-                        if isinstance(item, dict) and 'id' in item:
-                            result.append({
-                                'id': item['id'],
-                                'reasons': item.get('reasons', [])
-                            })
-                    return result
-            except json.JSONDecodeError:
-                pass
+        def render(lines: List[str]) -> str:
+            # 组装候选建筑文本
+            newline = '\n' if compact else '\n\n'
+            candidates_text = newline.join(lines)
+            if compact:
+                candidates_text = f"{COMPACT_CANDIDATE_HEADER}\n{candidates_text}"
+            
+            # 使用配置文件中的函数构建完整提示词
+            return build_user_prompt(
+                priorities_text=priorities_text,
+                budget_text=budget_text,
+                housing_type=housing_type,
+                roommate_text=roommate_text,
+                layout_text=layout_text or 'None',
+                notes=notes or 'None',
+                candidates_text=candidates_text,
+                location_text=location_text,
+                radius_text=radius_text,
+                rooms_text=rooms_text,
+                style_prefs_text=style_prefs_text or '',
+                extra_fields=extra_fields,
+                dedupe_radius_m=self.dedupe_radius_m,
+                structured_output=self.structured_output,
+            )
+
+        # token 预算：候选已按评分排序，超出时从末尾（低分）开始丢弃
+        if self.prompt_token_budget is not None:
+            model = model or self.gpt_model
+            fixed_tokens = estimate_tokens(self._prompt_system(), model) + estimate_tokens(render([]), model)
+            line_tokens = [estimate_tokens(line, model) + 1 for line in candidate_lines]
+            keep = fit_items(fixed_tokens, line_tokens, self.prompt_token_budget)
+            if keep < len(candidate_lines):
+                print(f"✂️ 提示词超出 {self.prompt_token_budget} token 预算，保留前 {keep}/{len(candidate_lines)} 个候选")
+                candidate_lines = candidate_lines[:keep]
         
-        # 回退到旧格式：逗号分隔的ID
-        tokens = [token.strip() for token in output.replace("\n", ",").split(",")]
-        ids = [t for t in tokens if t]
-        seen = set()
-        result = []
-        for item in ids:
-            if item not in seen:
-                result.append({'id': item, 'reasons': []})
-                seen.add(item)
-            if len(result) == 3:
-                break
-        return result
+        return render(candidate_lines)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Background file watcher that hot-reloads ``HousingRecommender`` data.
+
+Polls the recommender's source files (size + mtime) and calls
+``recommender.reload()`` once a change has been stable for one polling
+interval, so a data refresh that rewrites several files triggers one reload.
+
+Each worker process holds its own copy of the data, so a reload requested in
+one worker is broadcast through ``trigger_path``: ``broadcast()`` rewrites the
+file and every other worker's watcher reloads on its next poll. A worker whose
+data predates the last trigger (e.g. respawned from the preloaded master)
+reloads on its first poll.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+Signature = Dict[str, Optional[Tuple[int, int]]]
+
+
+def files_signature(paths) -> Signature:
+    signature: Signature = {}
+    for path in paths:
+        path = Path(path)
+        try:
+            stat = path.stat()
+            signature[str(path)] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            signature[str(path)] = None
+    return signature
+
+
+class DataFileWatcher:
+    """
+    Polling watcher; ``start()`` runs it on a daemon thread.
+
+    Args:
+        interval_seconds: polling interval
+        trigger_path: reload signal file shared by all workers (None = no broadcast)
+        watch_sources: also reload when the data files themselves change
+    """
+
+    def __init__(
+        self,
+        recommender,
+        interval_seconds: float = 30.0,
+        trigger_path: Optional[Path] = None,
+        watch_sources: bool = True,
+    ) -> None:
+        self.recommender = recommender
+        self.interval_seconds = interval_seconds
+        self.trigger_path = Path(trigger_path) if trigger_path else None
+        self.watch_sources = watch_sources
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._trigger_lock = threading.Lock()
+        self._trigger_seen = self._initial_trigger()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="recommender-data-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def broadcast(self) -> bool:
+        """Ask the other workers to reload; this process is expected to reload itself."""
+        if self.trigger_path is None:
+            return False
+        self.trigger_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._trigger_lock:
+            # 写入 pid 和时间，保证大小或 mtime 一定变化
+            self.trigger_path.write_text(f"{os.getpid()} {time.time_ns()}\n")
+            self._trigger_seen = self._trigger_signature()
+        return True
+
+    def _trigger_signature(self) -> Optional[Tuple[int, int]]:
+        if self.trigger_path is None:
+            return None
+        return files_signature([self.trigger_path])[str(self.trigger_path)]
+
+    def _initial_trigger(self) -> Optional[Tuple[int, int]]:
+        signature = self._trigger_signature()
+        if signature is not None and signature[1] / 1e9 > self.recommender.data_loaded_at:
+            return None  # 数据早于最近一次重载信号，首次轮询时重新加载
+        return signature
+
+    def _run(self) -> None:
+        current = files_signature(self.recommender.data_sources()) if self.watch_sources else {}
+        pending: Optional[Signature] = None
+        while not self._stop.wait(self.interval_seconds):
+            if self._check_trigger():
+                current = files_signature(self.recommender.data_sources()) if self.watch_sources else {}
+                pending = None
+                continue
+            if not self.watch_sources:
+                continue
+            latest = files_signature(self.recommender.data_sources())
+            if latest == current:
+                pending = None
+                continue
+            if latest != pending:
+                # 文件仍在变化，等下一个周期确认写入完成
+                pending = latest
+                continue
+            print("🔄 检测到建筑数据文件变化，开始重新加载")
+            try:
+                if self.recommender.reload():
+                    current = latest
+            except Exception as e:
+                print(f"❌ 建筑数据重新加载失败: {e}")
+                current = latest  # 等待下一次文件变化再重试
+            pending = None
+
+    def _check_trigger(self) -> bool:
+        """Reload if another worker broadcast since the last check; True if reloaded."""
+        if self.trigger_path is None:
+            return False
+        with self._trigger_lock:
+            latest = self._trigger_signature()
+            if latest is None or latest == self._trigger_seen:
+                return False
+        print("🔄 收到其他 worker 的重载信号，开始重新加载")
+        try:
+            reloaded = self.recommender.reload()
+        except Exception as e:
+            print(f"❌ 建筑数据重新加载失败: {e}")
+            reloaded = True  # 等待下一次信号再重试
+        if reloaded:
+            with self._trigger_lock:
+                # 重载期间本进程 broadcast() 过则已是最新；否则记下本次处理的信号，更新的信号下个周期再处理
+                if self._trigger_seen != self._trigger_signature():
+                    self._trigger_seen = latest
+        # 本进程正在重载时（返回 False）保留信号，下个周期重试，避免加载到旧数据
+        return reloaded
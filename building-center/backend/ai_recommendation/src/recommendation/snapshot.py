@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+On-disk snapshot of the fully-loaded ``BuildingStore``.
+
+Parsing six JSON files and rebuilding the columnar features, spatial index and
+embedding matrices on every process start is the slow part of worker startup.
+A snapshot directory caches the processed state:
+
+    manifest.json           version, snapshot key, source fingerprints
+    store-<key>.pkl         BuildingStore without embeddings (records, columns, index)
+    embeddings-<key>.npy    float32 unit-normalized embeddings, memory-mapped on load
+
+The snapshot is valid when ``SNAPSHOT_VERSION`` matches and every source file
+still has the recorded content: size + mtime are compared first and only files
+whose mtime changed are re-hashed, so a ``touch`` does not force a rebuild.
+Files for a key are written once and never modified; ``manifest.json`` is
+swapped in last, so concurrently starting workers never read a half-written
+snapshot.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pickle
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from src.recommendation.building_store import BuildingStore
+
+# 修改 BuildingStore 的字段或构建逻辑时递增，使旧快照失效
+SNAPSHOT_VERSION = 9
+MANIFEST_NAME = "manifest.json"
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint_sources(paths: Sequence[Path]) -> List[Dict[str, Any]]:
+    """Size, mtime and content hash of each source file (missing files included)."""
+    fingerprints = []
+    for path in paths:
+        path = Path(path)
+        if not path.exists():
+            fingerprints.append({"path": str(path), "exists": False})
+            continue
+        stat = path.stat()
+        fingerprints.append(
+            {
+                "path": str(path),
+                "exists": True,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": file_sha256(path),
+            }
+        )
+    return fingerprints
+
+
+def snapshot_key(fingerprints: Sequence[Dict[str, Any]]) -> str:
+    """Content key: depends on the version, source paths and hashes (not mtimes)."""
+    payload = json.dumps(
+        {
+            "version": SNAPSHOT_VERSION,
+            "sources": [(f["path"], f.get("sha256")) for f in fingerprints],
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _sources_unchanged(recorded: Sequence[Dict[str, Any]], paths: Sequence[Path]) -> bool:
+    if [f.get("path") for f in recorded] != [str(Path(p)) for p in paths]:
+        return False
+    for entry, path in zip(recorded, paths):
+        path = Path(path)
+        if not entry.get("exists"):
+            if path.exists():
+                return False
+            continue
+        if not path.exists():
+            return False
+        stat = path.stat()
+        if stat.st_size != entry.get("size"):
+            return False
+        if stat.st_mtime_ns != entry.get("mtime_ns") and file_sha256(path) != entry.get("sha256"):
+            return False
+    return True
+
+
+def _read_manifest(snapshot_dir: Path) -> Optional[Dict[str, Any]]:
+    manifest_path = snapshot_dir / MANIFEST_NAME
+    if not manifest_path.exists():
+        return None
+    try:
+        with manifest_path.open("r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def load_snapshot(snapshot_dir: Path, sources: Sequence[Path]) -> Optional[BuildingStore]:
+    """Return the cached store if the snapshot is still valid for ``sources``."""
+    snapshot_dir = Path(snapshot_dir)
+    manifest = _read_manifest(snapshot_dir)
+    if not manifest or manifest.get("version") != SNAPSHOT_VERSION:
+        return None
+    if not _sources_unchanged(manifest.get("sources", []), sources):
+        return None
+
+    key = manifest.get("key")
+    store_path = snapshot_dir / f"store-{key}.pkl"
+    embeddings_path = snapshot_dir / f"embeddings-{key}.npy"
+    try:
+        # 快照目录只由本服务写入，pickle 仅用于本地缓存
+        with store_path.open("rb") as fh:
+            store: BuildingStore = pickle.load(fh)
+        matrix = np.load(embeddings_path, mmap_mode="r")
+    except (OSError, ValueError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+        print(f"⚠️ Failed to load recommender snapshot {snapshot_dir}: {e}")
+        return None
+
+    store.attach_compact_embeddings(matrix)
+    return store
+
+
+def save_snapshot(snapshot_dir: Path, store: BuildingStore, fingerprints: Sequence[Dict[str, Any]]) -> Path:
+    """
+    Write ``store`` as the current snapshot; returns the manifest path.
+
+    ``fingerprints`` must be taken with ``fingerprint_sources`` *before* the
+    store was built, so a source edited mid-build invalidates the snapshot.
+    """
+    snapshot_dir = Path(snapshot_dir)
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+
+    key = snapshot_key(fingerprints)
+    store_path = snapshot_dir / f"store-{key}.pkl"
+    embeddings_path = snapshot_dir / f"embeddings-{key}.npy"
+    tmp_suffix = f".{os.getpid()}.{uuid.uuid4().hex}.tmp"
+
+    matrix, shell = store.detach_embeddings()
+    tmp = embeddings_path.with_name(embeddings_path.name + tmp_suffix)
+    with tmp.open("wb") as fh:
+        np.save(fh, matrix)
+    os.replace(tmp, embeddings_path)
+
+    tmp = store_path.with_name(store_path.name + tmp_suffix)
+    with tmp.open("wb") as fh:
+        pickle.dump(shell, fh, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, store_path)
+
+    manifest_path = snapshot_dir / MANIFEST_NAME
+    tmp = manifest_path.with_name(manifest_path.name + tmp_suffix)
+    with tmp.open("w", encoding="utf-8") as fh:
+        json.dump({"version": SNAPSHOT_VERSION, "key": key, "sources": list(fingerprints)}, fh, indent=2)
+    os.replace(tmp, manifest_path)
+
+    _remove_stale_files(snapshot_dir, key)
+    return manifest_path
+
+
+def _remove_stale_files(snapshot_dir: Path, key: str) -> None:
+    for path in list(snapshot_dir.glob("store-*.pkl")) + list(snapshot_dir.glob("embeddings-*.npy")):
+        if key in path.name:
+            continue
+        try:
+            path.unlink()
+        except OSError:
+            pass
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Incremental parser for the ranking output while it is still being streamed.
+
+The model answers with a JSON array of ``{"id": ..., "reasons": [...]}``
+objects, possibly wrapped in prose or a Markdown code fence. ``PickStreamParser``
+is fed text deltas as they arrive and returns every top-level object of the
+first array of objects as soon as its closing brace has been seen, so the first
+pick can be shown after one object instead of after the whole completion.
+A ``[`` only opens that array when the next non-space character is ``{``, so
+brackets in surrounding prose ("my [top] picks") are skipped; an array that
+closes without a single valid pick is ignored and scanning continues.
+
+    parser = PickStreamParser()
+    for delta in client.chat_stream(system_prompt, user_prompt):
+        for pick in parser.feed(delta):
+            ...
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Optional
+
+
+class PickStreamParser:
+    def __init__(self, max_picks: Optional[int] = None) -> None:
+        self.max_picks = max_picks
+        self.text = ""  # 完整输出，流结束后可交给非流式解析兜底
+        self.picks: List[Dict[str, Any]] = []
+        self._pos = 0
+        self._depth = 0  # 0: 数组外, 1: 数组内, >=2: 对象内
+        self._in_string = False
+        self._escaped = False
+        self._object_start: Optional[int] = None
+        self._array_picks = 0  # 进入当前数组时已解析的推荐数
+        self._done = False
+
+    @property
+    def done(self) -> bool:
+        """True once the array has closed or ``max_picks`` objects were returned."""
+        return self._done
+
+    def feed(self, delta: str) -> List[Dict[str, Any]]:
+        """Consume the next chunk of output; returns picks completed by it."""
+        self.text += delta
+        completed: List[Dict[str, Any]] = []
+        text = self.text
+        while self._pos < len(text) and not self._done:
+            ch = text[self._pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif self._depth == 0:
+                if ch == "[":
+                    following = _next_significant(text, self._pos + 1)
+                    if following is None:
+                        break  # 还看不到下一个字符，等下一段再判断
+                    if following == "{":
+                        self._depth = 1
+                        self._array_picks = len(self.picks)
+            elif ch == '"':
+                # 数组内、对象外的字符串（如旧格式的 "id1", "id2"）同样需要跳过
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 1 and ch == "{":
+                    self._object_start = self._pos
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1 and ch == "}" and self._object_start is not None:
+                    pick = self._decode(text[self._object_start:self._pos + 1])
+                    self._object_start = None
+                    if pick is not None:
+                        self.picks.append(pick)
+                        completed.append(pick)
+                        if self.max_picks is not None and len(self.picks) >= self.max_picks:
+                            self._done = True
+                elif self._depth <= 0:
+                    if len(self.picks) > self._array_picks:
+                        self._done = True
+                    else:
+                        # 不是推荐数组（如正文里的 "[{...}]" 片段）：回到数组外继续查找
+                        self._depth = 0
+                        self._object_start = None
+            self._pos += 1
+        return completed
+
+    @staticmethod
+    def _decode(fragment: str) -> Optional[Dict[str, Any]]:
+        try:
+            item = json.loads(fragment)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(item, dict) or "id" not in item:
+            return None
+        reasons = item.get("reasons", [])
+        return {"id": item["id"], "reasons": reasons if isinstance(reasons, list) else [reasons]}
+
+
+def _next_significant(text: str, start: int) -> Optional[str]:
+    """First non-whitespace character at or after ``start`` (None if not received yet)."""
+    for ch in text[start:]:
+        if not ch.isspace():
+            return ch
+    return None
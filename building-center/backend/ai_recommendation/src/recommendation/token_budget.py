@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Prompt-size estimation and budgeting for the GPT ranking stage.
+
+``estimate_tokens`` uses ``tiktoken`` when it is installed and otherwise a
+character heuristic (about 4 ASCII characters per token, one token per
+non-ASCII character), which errs on the high side for English prompts.
+``fit_items`` decides how many score-ordered candidates fit a token budget.
+"""
+from __future__ import annotations
+
+import math
+from typing import Optional, Sequence
+
+try:  # optional: exact counts for OpenAI models
+    import tiktoken
+except ImportError:  # pragma: no cover - depends on the environment
+    tiktoken = None
+
+_ENCODINGS: dict = {}
+
+
+def _encoding(model: Optional[str]):
+    if tiktoken is None:
+        return None
+    key = model or ""
+    if key not in _ENCODINGS:
+        try:
+            _ENCODINGS[key] = tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("o200k_base")
+        except (KeyError, ValueError):
+            _ENCODINGS[key] = tiktoken.get_encoding("o200k_base")
+    return _ENCODINGS[key]
+
+
+def estimate_tokens(text: str, model: Optional[str] = None) -> int:
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return math.ceil((len(text) - non_ascii) / 4) + non_ascii
+
+
+def fit_items(fixed_tokens: int, item_tokens: Sequence[int], budget: Optional[int], min_items: int = 3) -> int:
+    """
+    Number of leading items (already in priority order) that fit in ``budget``
+    together with ``fixed_tokens``. Never fewer than ``min_items`` (or all items
+    when there are fewer); ``budget=None`` keeps everything.
+    """
+    if budget is None:
+        return len(item_tokens)
+    total = fixed_tokens
+    count = 0
+    for tokens in item_tokens:
+        if total + tokens > budget:
+            break
+        total += tokens
+        count += 1
+    return max(count, min(min_items, len(item_tokens)))
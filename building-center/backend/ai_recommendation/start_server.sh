@@ -46,9 +46,15 @@ echo "  地址: http://localhost:5001"
 echo "  健康检查: http://localhost:5001/health"
 echo "  推荐接口: http://localhost:5001/api/ai/recommend"
 echo "  测试接口: http://localhost:5001/api/ai/test"
+echo "  运行模式: ${SERVER_MODE:-development}"
 echo "  按 Ctrl+C 停止服务器"
 echo "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━"
 echo ""
 
+if [ "$SERVER_MODE" = "production" ]; then
+    # gunicorn：worker/线程数见 gunicorn.conf.py（WEB_CONCURRENCY / GUNICORN_THREADS）
+    exec gunicorn -c gunicorn.conf.py wsgi:app
+fi
+
 python3 api_server.py
 
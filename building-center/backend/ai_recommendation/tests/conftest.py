@@ -0,0 +1,74 @@
+"""Shared fixtures: a recommender over the processed data in data/processed and a scripted OpenAI client."""
+from __future__ import annotations
+
+import shutil
+from pathlib import Path
+
+import pytest
+
+from src.recommendation import HousingRecommender
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+COUNTIES = ("san_francisco", "san_mateo", "santa_clara")
+ENRICHED_PATHS = [BASE_DIR / f"data/processed/buildings/{county}/buildings_enriched.json" for county in COUNTIES]
+EMBEDDING_PATHS = [BASE_DIR / f"data/processed/buildings/{county}/buildings_with_embeddings.json" for county in COUNTIES]
+PLACES_PATH = BASE_DIR / "data/places/bay_area_places.json"
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+
+class ScriptedClient:
+    """
+    Stands in for OpenAIClient: each ``chat`` / ``chat_stream`` call consumes the
+    next scripted output (an exception instance is raised instead) and is recorded.
+    """
+
+    def __init__(self, *outputs, chunk_size: int = 7):
+        self.outputs = list(outputs)
+        self.chunk_size = chunk_size
+        self.calls = []
+
+    def chat(self, system_prompt, user_prompt, deadline=None, response_format=None, followups=None, model=None):
+        self.calls.append({"user_prompt": user_prompt, "response_format": response_format, "followups": followups, "model": model})
+        return self._next()
+
+    def chat_stream(self, system_prompt, user_prompt, deadline=None, response_format=None, model=None):
+        self.calls.append({"user_prompt": user_prompt, "response_format": response_format, "stream": True, "model": model})
+        output = self._next()
+        for start in range(0, len(output), self.chunk_size):
+            yield output[start:start + self.chunk_size]
+
+    def _next(self):
+        output = self.outputs.pop(0)
+        if isinstance(output, Exception):
+            raise output
+        return output
+
+
+@pytest.fixture(scope="session")
+def recommender() -> HousingRecommender:
+    # 关闭邻近去重，与拆分前的逐条实现保持相同的排序语义
+    return HousingRecommender(
+        enriched_paths=[str(p) for p in ENRICHED_PATHS],
+        embedding_paths=[str(p) for p in EMBEDDING_PATHS],
+        geocoder=lambda query: None,  # 测试不访问网络
+        offline_geocoding="only",
+        dedupe_radius_m=None,
+    )
+
+
+@pytest.fixture(scope="session")
+def store(recommender):
+    return recommender._store
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """Writable copy of the enriched files, one directory per county (the directory name is the county)."""
+    for county, path in zip(COUNTIES, ENRICHED_PATHS):
+        (tmp_path / county).mkdir()
+        shutil.copy(path, tmp_path / county / path.name)
+    return tmp_path
+
+
+def copied_enriched_paths(data_dir):
+    return [data_dir / county / path.name for county, path in zip(COUNTIES, ENRICHED_PATHS)]
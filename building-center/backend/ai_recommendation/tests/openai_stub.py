@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI API, for offline testing of ``OpenAIClient``
+(development and tests only; not part of the deployed package).
+
+    python -m tests.openai_stub --port 5099 --latency 0.2 --fail-rate 0.3
+    OPENAI_BASE_URL=http://localhost:5099/v1 OPENAI_API_KEY=stub python api_server.py
+
+``POST /v1/chat/completions`` answers with the first three candidate ids found
+in the user prompt (block or compact encoding), in the JSON format the recommender parses;
+with ``"stream": true`` the same content is sent as server-sent events in small
+chunks, ``--chunk-delay`` apart.
+``POST /v1/embeddings`` returns a deterministic unit vector derived from the
+input text. ``--fail-rate`` makes that share of requests fail with
+``--fail-status`` (429 by default, with a ``Retry-After`` header) and
+``--latency`` delays every response, to exercise retries, deadlines and hedging.
+With a ``response_format`` the picks are wrapped in ``{"recommendations": [...]}``;
+``--invalid-rate`` makes that share of chat answers name an unknown building id.
+
+For deterministic tests, ``fail_first`` fails exactly the first N requests,
+``slow_first`` limits ``latency`` to the first N requests and ``retry_after``
+sets the header sent with failures; ``request_times`` records when each
+request arrived (``time.monotonic()``).
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+import numpy as np
+
+EMBEDDING_DIM = 1536
+# 块状模板 "ID=xxx" 或紧凑表格行 "1|xxx|..."
+_CANDIDATE_ID = re.compile(r"ID=(\S+)|^\d+\|([^|]+)\|", re.MULTILINE)
+
+
+def stub_chat_content(user_prompt: str, count: int = 3, structured: bool = False, invalid: bool = False) -> str:
+    ids: List[str] = []
+    for match in _CANDIDATE_ID.finditer(user_prompt):
+        building_id = match.group(1) or match.group(2)
+        if building_id not in ids:
+            ids.append(building_id)
+    picks = [{"id": building_id, "reasons": ["Stub pick"]} for building_id in ids[:count]]
+    if invalid and picks:
+        picks[0]["id"] = "building_does_not_exist"
+    return json.dumps({"recommendations": picks} if structured else picks)
+
+
+def stub_embedding(text: str, dim: int = EMBEDDING_DIM) -> List[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class StubOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        latency: float = 0.0,
+        fail_rate: float = 0.0,
+        fail_status: int = 429,
+        chunk_delay: float = 0.0,
+        invalid_rate: float = 0.0,
+        fail_first: int = 0,
+        slow_first: int = 0,
+        retry_after: str = "0",
+    ) -> None:
+        super().__init__(address, _StubHandler)
+        self.latency = latency
+        self.fail_first = fail_first
+        self.slow_first = slow_first
+        self.retry_after = retry_after
+        self.request_times: List[float] = []
+        self.chunk_delay = chunk_delay
+        self.invalid_rate = invalid_rate
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.lock = threading.Lock()
+        self.request_count = 0
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start_background(self, poll_interval: float = 0.5) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, args=(poll_interval,), name="openai-stub", daemon=True)
+        thread.start()
+        return thread
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    server: StubOpenAIServer
+
+    def do_POST(self) -> None:  # noqa: N802 (http.server naming)
+        with self.server.lock:
+            self.server.request_count += 1
+            number = self.server.request_count
+            self.server.request_times.append(time.monotonic())
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send(400, {"error": {"message": "invalid JSON"}})
+            return
+
+        if self.server.latency and (not self.server.slow_first or number <= self.server.slow_first):
+            time.sleep(self.server.latency)
+        if number <= self.server.fail_first or (self.server.fail_rate and random.random() < self.server.fail_rate):
+            self._send(self.server.fail_status, {"error": {"message": "stub failure"}}, {"Retry-After": self.server.retry_after})
+            return
+
+        if self.path.endswith("/chat/completions"):
+            user_prompt = next((m.get("content", "") for m in payload.get("messages", []) if m.get("role") == "user"), "")
+            content = stub_chat_content(
+                user_prompt,
+                structured="response_format" in payload,
+                invalid=bool(self.server.invalid_rate) and random.random() < self.server.invalid_rate,
+            )
+            if payload.get("stream"):
+                self._send_stream(content)
+                return
+            self._send(200, {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]})
+        elif self.path.endswith("/embeddings"):
+            self._send(200, {"data": [{"index": 0, "embedding": stub_embedding(str(payload.get("input", "")))}]})
+        else:
+            self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def _send(self, status: int, body: Dict[str, Any], headers: Dict[str, str] = None) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, content: str, chunk_size: int = 8) -> None:
+        # HTTP/1.0 响应：不带 Content-Length，连接关闭即表示流结束
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        try:
+            for start in range(0, len(content), chunk_size):
+                chunk = {"choices": [{"index": 0, "delta": {"content": content[start:start + chunk_size]}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                if self.server.chunk_delay:
+                    time.sleep(self.server.chunk_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 客户端读到完整数组后会主动断开
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a local OpenAI API stub.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests that fail (0-1)")
+    parser.add_argument("--fail-status", type=int, default=429)
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="share of chat answers with an unknown id (0-1)")
+    args = parser.parse_args()
+
+    server = StubOpenAIServer(
+        (args.host, args.port), args.latency, args.fail_rate, args.fail_status, args.chunk_delay, args.invalid_rate
+    )
+    print(f"🧪 OpenAI stub listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
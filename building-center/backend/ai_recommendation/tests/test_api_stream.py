@@ -0,0 +1,79 @@
+"""Event sequence of the SSE endpoint /api/ai/recommend/stream."""
+from __future__ import annotations
+
+import json
+import os
+
+import pytest
+
+import api_server
+from tests.conftest import ScriptedClient
+
+QUESTIONNAIRE = {
+    "location": {"coordinates": {"lat": 37.5630, "lon": -122.3255}, "radius": 3},
+    "priorities": ["Safety", "Public Transit"],
+}
+
+
+def parse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture
+def client(recommender, monkeypatch):
+    # 使用测试用推荐器，跳过进程资源（缓存、线程池、监视线程）初始化
+    monkeypatch.setattr(api_server, "recommender", recommender)
+    monkeypatch.setattr(api_server, "_resources_pid", os.getpid())
+    monkeypatch.setattr(recommender, "cascade_policy", None)
+    return api_server.app.test_client()
+
+
+def stream(client):
+    response = client.post("/api/ai/recommend/stream", json=QUESTIONNAIRE)
+    assert response.mimetype == "text/event-stream"
+    return parse_events(response.get_data(as_text=True))
+
+
+def test_candidates_recommendations_done(client, recommender, monkeypatch):
+    top = recommender.recommend(api_server.convert_questionnaire_to_request(QUESTIONNAIRE), use_gpt=False)["top20"]
+    ids = [entry["building_id"] for entry in top[2:4]]
+    answer = json.dumps({"recommendations": [{"id": building_id, "reasons": ["fits"]} for building_id in ids]})
+    monkeypatch.setattr(recommender, "_openai_client", ScriptedClient(answer))
+
+    events = stream(client)
+
+    assert [name for name, _ in events] == ["candidates", "recommendation", "recommendation", "done"]
+    assert [c["building_id"] for c in events[0][1]["top20"]] == [entry["building_id"] for entry in top]
+    assert events[0][1]["selection"]["route"] == "large"
+    assert [data["building_id"] for _, data in events[1:3]] == ids
+    assert events[1][1]["reasons"] == ["fits"]
+    assert events[-1][1] == {"count": 2}
+
+
+def test_without_gpt_streams_score_fallback(client, recommender):
+    events = stream(client)
+    assert [name for name, _ in events] == ["candidates"] + ["recommendation"] * 3 + ["done"]
+    assert events[0][1]["selection"]["route"] == "skip"
+
+
+def test_error_before_candidates(client, recommender, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("ranking exploded")
+
+    monkeypatch.setattr(recommender, "recommend", fail)
+    assert stream(client) == [("error", {"error": "ranking exploded"}), ("done", {"count": 0, "error": True})]
+
+
+def test_error_mid_stream_ends_with_done(client, recommender, monkeypatch):
+    def picks(user_request, candidates, **kwargs):
+        yield {"id": candidates[0]["building_id"], "reasons": []}
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(recommender, "stream_select_with_gpt", picks)
+    events = stream(client)
+    assert [name for name, _ in events] == ["candidates", "recommendation", "error", "done"]
+    assert events[-1][1] == {"count": 1, "error": True}
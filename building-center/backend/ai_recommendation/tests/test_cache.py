@@ -0,0 +1,239 @@
+"""Lookup caches: LRU and SQLite tiers, TieredCache, the cached geocoder and the LLM response cache."""
+from __future__ import annotations
+
+import pytest
+
+from src.recommendation import cache
+from src.recommendation.cache import LRUCache, SQLiteCache, TieredCache
+from src.recommendation.geocoding import CachedGeocoder
+from src.recommendation.llm_cache import LLMResponseCache, llm_cache_key
+
+
+class Clock:
+    """Stands in for the ``time`` module of the cache so expiry needs no sleeping."""
+
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+
+class Backend:
+    """Scripted geocoding backend: query -> coordinates, None, or an exception to raise."""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = []
+
+    def __call__(self, query):
+        self.calls.append(query)
+        answer = self.answers[query]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+def test_lru_evicts_least_recently_used(clock):
+    lru = LRUCache(max_size=2)
+    lru.set("a", 1, 60)
+    lru.set("b", 2, 60)
+    assert lru.get("a") == 1  # a 变为最近使用
+    lru.set("c", 3, 60)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1 and lru.get("c") == 3
+    assert len(lru) == 2
+
+
+def test_lru_entries_expire_individually(clock):
+    lru = LRUCache()
+    lru.set("short", 1, 10)
+    lru.set("long", 2, 100)
+    clock.advance(10)
+    assert lru.get("short", "miss") == "miss"
+    assert lru.get("long") == 2
+    assert len(lru) == 1
+
+
+def test_sqlite_cache_persists_across_connections(tmp_path, clock):
+    path = tmp_path / "cache.sqlite3"
+    first = SQLiteCache(path, table="geocode")
+    first.set("sf", [37.77, -122.42], 60)
+    second = SQLiteCache(path, table="geocode")
+    assert second.get("sf") == (True, [37.77, -122.42], clock.now + 60)
+    clock.advance(60)
+    assert second.get("sf") == (False, None, 0.0)
+
+
+def test_sqlite_cache_rejects_invalid_table_name(tmp_path):
+    with pytest.raises(ValueError):
+        SQLiteCache(tmp_path / "cache.sqlite3", table="geo; DROP TABLE x")
+
+
+def test_tiered_cache_tells_cached_none_from_miss(clock):
+    tiered = TieredCache(LRUCache())
+    assert tiered.get("nowhere") == (False, None)
+    tiered.set("nowhere", None, 60)
+    assert tiered.get("nowhere") == (True, None)
+    assert tiered.stats()["misses"] == 1 and tiered.stats()["memory_hits"] == 1
+
+
+def test_disk_hit_is_promoted_with_remaining_ttl(tmp_path, clock):
+    path = tmp_path / "cache.sqlite3"
+    TieredCache(LRUCache(), SQLiteCache(path)).set("sf", [37.77, -122.42], 100)
+    clock.advance(40)
+
+    restarted = TieredCache(LRUCache(), SQLiteCache(path))
+    assert restarted.get("sf") == (True, [37.77, -122.42])
+    assert restarted.get("sf") == (True, [37.77, -122.42])
+    assert restarted.stats()["disk_hits"] == 1 and restarted.stats()["memory_hits"] == 1
+    clock.advance(60)
+    # 内存层沿用磁盘上剩余的 60 秒，不会重新计满 TTL
+    assert restarted.get("sf") == (False, None)
+
+
+def test_geocoder_ttls_per_result_kind(clock):
+    backend = Backend({"sfsu": (37.7241, -122.4799), "atlantis": None, "flaky": TimeoutError("timed out")})
+    geocoder = CachedGeocoder(backend=backend, ttl_seconds=1000, negative_ttl_seconds=100, error_ttl_seconds=10)
+    for query in ("sfsu", "atlantis", "flaky"):
+        geocoder(query)
+    assert geocoder("sfsu") == (37.7241, -122.4799)
+    assert geocoder("atlantis") is None and geocoder("flaky") is None
+    assert len(backend.calls) == 3
+
+    clock.advance(10)  # 错误结果先过期
+    for query in ("sfsu", "atlantis", "flaky"):
+        geocoder(query)
+    assert backend.calls[3:] == ["flaky"]
+    clock.advance(90)  # 未找到的结果随后过期
+    for query in ("sfsu", "atlantis"):
+        geocoder(query)
+    assert backend.calls[4:] == ["atlantis"]
+    clock.advance(900)
+    geocoder("sfsu")
+    assert backend.calls[5:] == ["sfsu"]
+
+
+def test_geocoder_normalizes_queries(clock):
+    backend = Backend({"SFSU": (37.7241, -122.4799)})
+    geocoder = CachedGeocoder(backend=backend)
+    assert geocoder("SFSU") == (37.7241, -122.4799)
+    assert geocoder("  sfsu. ") == (37.7241, -122.4799)
+    assert geocoder("   ") is None
+    assert backend.calls == ["SFSU"]
+
+
+def test_geocoder_stats(clock):
+    backend = Backend({"sfsu": (37.7241, -122.4799), "atlantis": None, "flaky": RuntimeError("502")})
+    geocoder = CachedGeocoder(backend=backend)
+    for query in ("sfsu", "sfsu", "atlantis", "atlantis", "flaky"):
+        geocoder(query)
+    stats = geocoder.stats()
+    assert stats["requests"] == 5
+    assert stats["backend_calls"] == 3 and stats["backend_errors"] == 1
+    assert stats["memory_hits"] == 2 and stats["negative_hits"] == 1
+    assert stats["hit_rate"] == 0.4
+
+
+def test_geocoder_disk_tier_survives_restart(tmp_path, clock):
+    path = tmp_path / "geocode.sqlite3"
+    backend = Backend({"sfsu": (37.7241, -122.4799), "atlantis": None})
+    first = CachedGeocoder(backend=backend, cache_path=path)
+    for query in ("sfsu", "atlantis"):
+        first(query)
+    restarted = CachedGeocoder(backend=backend, cache_path=path)
+    assert restarted("sfsu") == (37.7241, -122.4799)
+    assert restarted("atlantis") is None
+    assert backend.calls == ["sfsu", "atlantis"]
+    assert restarted.stats()["disk_hits"] == 2
+
+
+def sqlite_keys(disk):
+    return {row[0] for row in disk._conn.execute(f"SELECT key FROM {disk.table}")}
+
+
+def test_purge_expired_removes_only_expired_rows(tmp_path, clock):
+    disk = SQLiteCache(tmp_path / "cache.sqlite3")
+    disk.set("short", 1, 10)
+    disk.set("long", 2, 100)
+    clock.advance(10)
+    assert disk.purge_expired() == 1
+    assert sqlite_keys(disk) == {"long"}
+
+
+def test_expired_rows_are_purged_on_open(tmp_path, clock):
+    path = tmp_path / "cache.sqlite3"
+    SQLiteCache(path).set("short", 1, 10)
+    clock.advance(10)
+    assert sqlite_keys(SQLiteCache(path)) == set()
+
+
+def test_max_rows_evicts_rows_closest_to_expiry(tmp_path, clock):
+    disk = SQLiteCache(tmp_path / "cache.sqlite3", max_rows=3)
+    for key, ttl in (("a", 50), ("b", 10), ("c", 40), ("d", 30), ("e", 20)):
+        disk.set(key, key, ttl)
+    assert disk.purge_expired() == 2
+    assert sqlite_keys(disk) == {"a", "c", "d"}
+
+
+def test_cap_is_enforced_every_purge_every_writes(tmp_path, clock):
+    disk = SQLiteCache(tmp_path / "cache.sqlite3", max_rows=2, purge_every=4)
+    for index in range(3):
+        disk.set(f"k{index}", index, 10 + index)
+    assert len(sqlite_keys(disk)) == 3  # 未到第4次写入，允许暂时超出上限
+    disk.set("k3", 3, 13)
+    assert sqlite_keys(disk) == {"k2", "k3"}
+
+
+def test_llm_cache_key_covers_model_and_prompts():
+    key = llm_cache_key("gpt-4o", "system", "user")
+    assert key == llm_cache_key("gpt-4o", "system", "user")
+    assert key != llm_cache_key("gpt-4o-mini", "system", "user")
+    assert key != llm_cache_key("gpt-4o", "system prompt", "user")
+    # 分隔符避免 ("ab", "c") 与 ("a", "bc") 拼接后相同
+    assert llm_cache_key("m", "ab", "c") != llm_cache_key("m", "a", "bc")
+
+
+def test_llm_cache_roundtrip_and_ttl(clock):
+    picks = [{"id": "building_0001", "reasons": ["Close to campus"]}]
+    llm_cache = LLMResponseCache(ttl_seconds=60)
+    assert llm_cache.get("gpt-4o", "system", "user") is None
+    llm_cache.set("gpt-4o", "system", "user", picks)
+    assert llm_cache.get("gpt-4o", "system", "user") == picks
+    assert llm_cache.get("gpt-4o-mini", "system", "user") is None
+    clock.advance(60)
+    assert llm_cache.get("gpt-4o", "system", "user") is None
+
+
+def test_llm_cache_memory_tier_is_bounded(clock):
+    llm_cache = LLMResponseCache(max_memory_entries=2)
+    for prompt in ("p1", "p2", "p3"):
+        llm_cache.set("gpt-4o", "system", prompt, [{"id": prompt}])
+    assert llm_cache.get("gpt-4o", "system", "p1") is None
+    assert llm_cache.get("gpt-4o", "system", "p3") == [{"id": "p3"}]
+    assert llm_cache.stats()["memory_size"] == 2
+
+
+def test_llm_cache_disk_tier_is_shared_and_capped(tmp_path, clock):
+    path = tmp_path / "llm.sqlite3"
+    writer = LLMResponseCache(cache_path=path, max_disk_entries=2)
+    reader = LLMResponseCache(cache_path=path, max_disk_entries=2)
+    writer.set("gpt-4o", "system", "user", [{"id": "building_0001"}])
+    assert reader.get("gpt-4o", "system", "user") == [{"id": "building_0001"}]
+    assert reader.stats()["disk_hits"] == 1
+
+    for prompt in ("p1", "p2"):
+        clock.advance(1)  # 后写入的条目过期更晚
+        writer.set("gpt-4o", "system", prompt, [{"id": prompt}])
+    writer.cache.disk.purge_expired()
+    assert sqlite_keys(writer.cache.disk) == {llm_cache_key("gpt-4o", "system", p) for p in ("p1", "p2")}
@@ -0,0 +1,155 @@
+"""Cascade routing for the final selection step: skip / small / large."""
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from src.recommendation import recommender as recommender_module
+from src.recommendation.cascade import ROUTE_LARGE, ROUTE_SKIP, ROUTE_SMALL, CascadePolicy, boundary_margin
+from tests.conftest import ScriptedClient
+
+LARGE = "gpt-4o"
+REQUEST = {"location": {"lat": 37.7749, "lon": -122.4194}, "radius_miles": 5, "top_priorities": ["Safety", "Commute"]}
+
+
+def scored(*scores):
+    return [{"building_id": f"b{i}", "total_score": score} for i, score in enumerate(scores)]
+
+
+def test_boundary_margin():
+    candidates = scored(4.0, 3.0, 2.0, 1.5, 1.0)
+    assert boundary_margin(candidates, 3) == pytest.approx(0.125)
+    assert boundary_margin(candidates, 1) == pytest.approx(0.25)
+    assert boundary_margin(scored(0.0, 0.0, 0.0, 0.0), 3) == 0.0
+
+
+@pytest.mark.parametrize(
+    "scores, route",
+    [
+        ((100, 90, 50, 48, 40), ROUTE_SMALL),  # 边界差距正好等于 small_margin
+        ((100, 90, 50, 40, 30), ROUTE_SMALL),
+        ((100, 90, 50, 49, 40), ROUTE_LARGE),
+        ((100, 90, 50, 50, 50), ROUTE_LARGE),
+    ],
+)
+def test_small_margin_threshold(scores, route):
+    decision = CascadePolicy(small_margin=0.02).decide({}, scored(*scores), LARGE)
+    assert decision.route == route
+    assert decision.model == (LARGE if route == ROUTE_LARGE else "gpt-4o-mini")
+    assert decision.margin == pytest.approx((scores[2] - scores[3]) / scores[0])
+
+
+@pytest.mark.parametrize(
+    "scores, route",
+    [
+        ((100, 90, 50, 40), ROUTE_SKIP),
+        ((100, 90, 50, 45), ROUTE_SMALL),
+        ((100, 90, 50, 49.5), ROUTE_LARGE),
+    ],
+)
+def test_skip_margin_threshold(scores, route):
+    decision = CascadePolicy(small_margin=0.02, skip_margin=0.1).decide({}, scored(*scores), LARGE)
+    assert decision.route == route
+    if route == ROUTE_SKIP:
+        assert decision.model is None
+
+
+def test_disabled_thresholds():
+    decisive = scored(100, 90, 50, 0)
+    assert CascadePolicy(skip_margin=None).decide({}, decisive, LARGE).route == ROUTE_SMALL
+    assert CascadePolicy(small_margin=None).decide({}, decisive, LARGE).route == ROUTE_LARGE
+
+
+def test_final_count_moves_the_boundary():
+    candidates = scored(100, 60, 59, 10, 9)
+    policy = CascadePolicy(small_margin=0.02)
+    assert policy.decide({}, candidates, LARGE, final_count=3).route == ROUTE_SMALL
+    assert policy.decide({}, candidates, LARGE, final_count=2).route == ROUTE_LARGE
+    assert policy.decide({}, candidates, LARGE, final_count=None).route == ROUTE_SMALL  # None 按 3 处理
+
+
+def test_few_candidates_use_small_model():
+    decision = CascadePolicy(skip_margin=0.0).decide({}, scored(100, 100, 100), LARGE)
+    assert (decision.route, decision.margin) == (ROUTE_SMALL, None)
+
+
+@pytest.mark.parametrize(
+    "request_fields, reason",
+    [
+        ({"notes": "near a quiet park"}, "notes present"),
+        ({"style_preference": "Modern, bright"}, "style preferences present"),
+        ({"refinements": {"commute": {"address": "Stanford"}}}, "free-text refinements present"),
+        ({"refinements": {"custom_amenities": ["rooftop"]}}, "free-text refinements present"),
+    ],
+)
+def test_free_text_escalates_to_large(request_fields, reason):
+    decisive = scored(100, 90, 50, 0)
+    decision = CascadePolicy(skip_margin=0.1).decide(request_fields, decisive, LARGE)
+    assert (decision.route, decision.model, decision.reason) == (ROUTE_LARGE, LARGE, reason)
+    relaxed = CascadePolicy(skip_margin=0.1, escalate_on_notes=False, escalate_on_style=False, escalate_on_refinements=False)
+    assert relaxed.decide(request_fields, decisive, LARGE).route == ROUTE_SKIP
+
+
+def test_placeholder_notes_do_not_escalate():
+    decision = CascadePolicy(skip_margin=0.1).decide({"notes": "None", "refinements": {"notes": ""}}, scored(100, 90, 50, 0), LARGE)
+    assert decision.route == ROUTE_SKIP
+
+
+@pytest.fixture
+def routed(recommender, monkeypatch):
+    client = ScriptedClient()
+    monkeypatch.setattr(recommender, "_openai_client", client)
+    monkeypatch.setattr(recommender, "cascade_policy", CascadePolicy(small_model="small-model", small_margin=0.0, skip_margin=None))
+    top = recommender.recommend(REQUEST, return_top_n=20, use_gpt=False)["top20"]
+    return client, top
+
+
+def test_plan_selection_without_client_or_policy(recommender, monkeypatch):
+    top = recommender.recommend(REQUEST, return_top_n=20, use_gpt=False)["top20"]
+    assert recommender.plan_selection(REQUEST, top).route == ROUTE_SKIP  # 未配置 GPT
+    monkeypatch.setattr(recommender, "_openai_client", ScriptedClient())
+    monkeypatch.setattr(recommender, "cascade_policy", None)
+    decision = recommender.plan_selection(REQUEST, top)
+    assert (decision.route, decision.model) == (ROUTE_LARGE, recommender.gpt_model)
+
+
+def test_small_route_calls_the_small_model(recommender, routed):
+    client, top = routed
+    client.outputs = [json.dumps([{"id": top[1]["building_id"], "reasons": ["quiet"]}])]
+    decision = recommender.plan_selection(REQUEST, top)
+    assert decision.route == ROUTE_SMALL
+    picks = recommender.select_with_gpt(REQUEST, top, decision=decision)
+    assert picks == [{"id": top[1]["building_id"], "reasons": ["quiet"]}]
+    assert [call["model"] for call in client.calls] == ["small-model"]
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_prompt_budget_uses_the_routed_model(recommender, routed, monkeypatch, stream):
+    client, top = routed
+    client.outputs = [json.dumps([{"id": top[0]["building_id"], "reasons": ["safe"]}])]
+    estimate_tokens = recommender_module.estimate_tokens
+    estimated_for = set()
+
+    def spy(text, model=None):
+        estimated_for.add(model)
+        return estimate_tokens(text, model)
+
+    monkeypatch.setattr(recommender_module, "estimate_tokens", spy)
+    monkeypatch.setattr(recommender, "prompt_token_budget", 100_000)
+    decision = recommender.plan_selection(REQUEST, top)
+    select = recommender.stream_select_with_gpt if stream else recommender.select_with_gpt
+    assert list(select(REQUEST, top, decision=decision))
+    # 预算估算、模型调用（以及 LLM 缓存键）使用同一个模型
+    assert estimated_for == {"small-model"}
+    assert [call["model"] for call in client.calls] == ["small-model"]
+
+
+def test_skip_route_makes_no_model_call(recommender, routed, monkeypatch):
+    client, top = routed
+    monkeypatch.setattr(recommender, "cascade_policy", CascadePolicy(skip_margin=0.0))
+    decision = recommender.plan_selection(REQUEST, top)
+    assert decision.route == ROUTE_SKIP
+    picks = recommender.select_with_gpt(REQUEST, top, decision=decision)
+    assert [pick["id"] for pick in picks] == [entry["building_id"] for entry in top[:3]]
+    assert client.calls == []
@@ -0,0 +1,117 @@
+"""Co-located dedupe: request-time _select_distinct and the sites precomputed with dedupe_at_load."""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from src.pipeline.geo_utils import METERS_PER_MILE
+from src.recommendation import HousingRecommender
+from src.recommendation.building_store import BuildingRecord, BuildingStore
+from tests.conftest import EMBEDDING_PATHS, ENRICHED_PATHS
+
+RADIUS_M = 30.0
+METERS_PER_DEG_LAT = 111_320.0
+
+
+def make_store(points):
+    """Store whose rows sit at ``points``: (lat, lon) or None for no coordinates."""
+    records = []
+    for row, point in enumerate(points):
+        data = {"building_id": f"b{row}"}
+        if point is not None:
+            data["lat"], data["lon"] = point
+        records.append(BuildingRecord(f"b{row}", "test", data))
+    return BuildingStore(records)
+
+
+def north(meters, lat=37.0, lon=-122.0):
+    return (lat + meters / METERS_PER_DEG_LAT, lon)
+
+
+# 站点A：行0-2（相距10米以内）；站点B：行3-4（1公里外）；行5无坐标；行6在2公里外
+POINTS = [north(0), north(10), north(20), north(1000), north(1005), None, north(2000)]
+TOTALS = np.array([0.2, 0.9, 0.5, 0.4, 0.6, 0.1, 0.3])
+
+
+@pytest.fixture
+def deduping(recommender, monkeypatch):
+    monkeypatch.setattr(recommender, "dedupe_radius_m", RADIUS_M)
+    return recommender
+
+
+def select(recommender, store, totals, k):
+    return recommender._select_distinct(store, store.all_rows(), totals, k).tolist()
+
+
+def test_colocated_sites_label_rows_by_first_listing():
+    store = make_store(POINTS)
+    radius_miles = RADIUS_M / METERS_PER_MILE
+    np.testing.assert_array_equal(store.colocated_sites(radius_miles), [0, 0, 0, 3, 3, 5, 6])
+    np.testing.assert_array_equal(
+        store.colocated_duplicates(radius_miles), [False, True, True, False, True, False, False]
+    )
+
+
+def test_select_distinct_keeps_best_scored_row_per_site(deduping):
+    store = make_store(POINTS)
+    # 评分顺序 1,4,2,3,6,0,5：2、0 与 1 同址，3 与 4 同址；无坐标的行5不参与去重
+    assert select(deduping, store, TOTALS, 3) == [1, 4, 6]
+    assert select(deduping, store, TOTALS, 10) == [1, 4, 6, 5]
+
+
+def test_select_distinct_backfills_and_grows_the_pool(deduping):
+    # 30 条同址房源占据评分前列，初始候选池（2k+10）只能选出一处
+    points = [north(0)] * 30 + [north(1000 * (i + 1)) for i in range(10)]
+    totals = np.concatenate([1.0 - 0.01 * np.arange(30), 0.5 - 0.01 * np.arange(10)])
+    store = make_store(points)
+    assert select(deduping, store, totals, 3) == [0, 30, 31]
+    assert select(deduping, store, totals, 20) == [0] + list(range(30, 40))
+
+
+@pytest.mark.parametrize("k", [0, -1])
+def test_non_positive_k_returns_no_candidates(deduping, k):
+    store = make_store(POINTS)
+    assert select(deduping, store, TOTALS, k) == []
+    labels = store.colocated_sites(RADIUS_M / METERS_PER_MILE)
+    assert HousingRecommender._select_by_site(labels, TOTALS, k).size == 0
+
+
+def test_empty_rows_return_no_candidates(deduping):
+    store = make_store(POINTS)
+    empty = np.zeros(0, dtype=np.int64)
+    assert deduping._select_distinct(store, empty, np.zeros(0), 3).size == 0
+
+
+@pytest.mark.parametrize("k", [1, 3, 4, 10])
+def test_select_by_site_matches_select_distinct(deduping, k):
+    store = make_store(POINTS)
+    labels = store.colocated_sites(RADIUS_M / METERS_PER_MILE)
+    assert HousingRecommender._select_by_site(labels, TOTALS, k).tolist() == select(deduping, store, TOTALS, k)
+
+
+@pytest.fixture(scope="module")
+def dedupe_pair():
+    options = dict(
+        enriched_paths=[str(p) for p in ENRICHED_PATHS],
+        embedding_paths=[str(p) for p in EMBEDDING_PATHS],
+        geocoder=lambda query: None,
+        offline_geocoding="only",
+        dedupe_radius_m=RADIUS_M,
+    )
+    return HousingRecommender(**options), HousingRecommender(**options, dedupe_at_load=True)
+
+
+@pytest.mark.parametrize("location", [(37.5630, -122.3255), (37.7700, -122.4200), (37.3500, -121.9000)])
+@pytest.mark.parametrize("priorities", [["Safety", "Public Transit"], ["Amenities"], ["Lifestyle", "Pet Friendly"]])
+@pytest.mark.parametrize("return_top_n", [5, 40])
+def test_dedupe_at_load_matches_request_time_dedupe(dedupe_pair, location, priorities, return_top_n):
+    request_time, at_load = dedupe_pair
+    request = {
+        "location": {"lat": location[0], "lon": location[1]},
+        "radius_miles": 5,
+        "top_priorities": priorities,
+    }
+    expected = request_time.recommend(request, return_top_n=return_top_n, use_gpt=False)["top20"]
+    actual = at_load.recommend(request, return_top_n=return_top_n, use_gpt=False)["top20"]
+    assert [b["building_id"] for b in actual] == [b["building_id"] for b in expected]
+    assert [b["total_score"] for b in actual] == [b["total_score"] for b in expected]
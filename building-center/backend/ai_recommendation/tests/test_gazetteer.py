@@ -0,0 +1,95 @@
+"""Offline gazetteer lookups and when they may preempt the HTTP geocoder."""
+from __future__ import annotations
+
+import pytest
+
+from src.recommendation.gazetteer import Gazetteer, normalize_name
+from tests.conftest import PLACES_PATH
+
+SF_CENTER = (37.7749, -122.4194)
+ZOO = (37.7330, -122.5030)
+
+
+@pytest.fixture(scope="module")
+def gazetteer(store):
+    return Gazetteer.from_files(PLACES_PATH, [record.data for record in store.records])
+
+
+def test_normalize_name():
+    assert normalize_name("680 Mission Street, San Francisco, CA 94105美国") == "680 mission st san francisco"
+    assert normalize_name("Stanford University, USA") == "stanford university"
+
+
+def test_exact_and_head_matches(gazetteer):
+    assert gazetteer.lookup("San Mateo", approximate=False).kind == "city"
+    assert gazetteer.lookup("SFSU, San Francisco, CA", approximate=False).name == "SFSU"
+    entry = gazetteer.lookup("680 Mission St, San Francisco, CA 94105", approximate=False)
+    assert entry is not None and entry.kind == "address"
+
+
+@pytest.mark.parametrize("query", ["San Francisco Zoo", "Mission St", "Market St", "Stanfrod University"])
+def test_near_misses_are_not_exact(gazetteer, query):
+    assert gazetteer.lookup(query, approximate=False) is None
+
+
+def test_bare_street_parts_are_not_indexed(gazetteer):
+    assert gazetteer.lookup("680 Mission St", approximate=False) is None
+    assert gazetteer.lookup("680 Mission St San Francisco", approximate=False) is not None
+
+
+def test_approximate_matches(gazetteer):
+    assert gazetteer.lookup("Stanfrod University").name == "Stanford University"
+    assert gazetteer.lookup("Stanford").name.startswith("Stanford")
+
+
+class RecordingGeocoder:
+    def __init__(self, result):
+        self.result = result
+        self.queries = []
+
+    def __call__(self, query):
+        self.queries.append(query)
+        return self.result
+
+
+@pytest.fixture
+def geocode(recommender, store, gazetteer, monkeypatch):
+    monkeypatch.setattr(store, "gazetteer", gazetteer)
+
+    def run(query, mode="first", http_result=None):
+        http = RecordingGeocoder(http_result)
+        monkeypatch.setattr(recommender, "geocoder", http)
+        monkeypatch.setattr(recommender, "offline_geocoding", mode)
+        return recommender._geocode(store, query), http.queries
+
+    return run
+
+
+def test_exact_hit_skips_http(geocode):
+    coords, queries = geocode("San Francisco", http_result=ZOO)
+    assert coords == SF_CENTER
+    assert queries == []
+
+
+@pytest.mark.parametrize("query", ["San Francisco Zoo", "Mission St", "Market St"])
+def test_fuzzy_hit_does_not_preempt_http(geocode, query):
+    coords, queries = geocode(query, http_result=ZOO)
+    assert coords == ZOO
+    assert queries == [query]
+
+
+def test_approximate_match_is_fallback_after_http_miss(geocode):
+    coords, queries = geocode("Stanfrod University", http_result=None)
+    assert queries == ["Stanfrod University"]
+    assert coords == (37.4275, -122.1697)
+
+
+def test_only_mode_never_calls_http(geocode):
+    coords, queries = geocode("Stanfrod University", mode="only", http_result=ZOO)
+    assert coords == (37.4275, -122.1697)
+    assert queries == []
+
+
+def test_off_mode_ignores_gazetteer(geocode):
+    coords, queries = geocode("San Francisco", mode="off", http_result=ZOO)
+    assert coords == ZOO and queries == ["San Francisco"]
@@ -0,0 +1,92 @@
+"""Vectorized geo helpers against their scalar counterparts."""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from src.pipeline.geo_utils import (
+    bbox_thresholds,
+    count_nearby_points,
+    count_nearby_points_array,
+    filter_nearby_indices,
+    filter_nearby_points,
+    haversine_distance,
+    haversine_distance_array,
+    is_within_radius,
+)
+
+CENTERS = [
+    (37.7225, -122.4777),  # SFSU
+    (0.0, 179.9),  # 换日线东侧
+    (-33.9, -179.95),  # 换日线西侧
+    (85.0, 10.0),
+    (89.99, 0.0),
+    (90.0, 0.0),  # 北极
+    (-90.0, 45.0),  # 南极
+]
+
+
+def scatter(center_lat, center_lon, n_points=3000, seed=7):
+    """Random points around a center (wrapped across the antimeridian, some missing)."""
+    rng = np.random.default_rng(seed)
+    lats = np.clip(center_lat + rng.uniform(-1.0, 1.0, n_points), -90.0, 90.0)
+    lons = (center_lon + rng.uniform(-2.0, 2.0, n_points) + 180.0) % 360.0 - 180.0
+    lats[::97] = np.nan
+    points = [{"lat": None if np.isnan(lat) else float(lat), "lon": float(lon)} for lat, lon in zip(lats, lons)]
+    return lats, lons, points
+
+
+@pytest.mark.parametrize("center_lat, center_lon", CENTERS)
+def test_distance_array_matches_scalar(center_lat, center_lon):
+    lats, lons, _ = scatter(center_lat, center_lon)
+    distances = haversine_distance_array(center_lat, center_lon, lats, lons)
+    assert np.isnan(distances[np.isnan(lats)]).all()
+    valid = ~np.isnan(lats)
+    scalar = [haversine_distance(center_lat, center_lon, lat, lon) for lat, lon in zip(lats[valid], lons[valid])]
+    np.testing.assert_allclose(distances[valid], scalar, rtol=1e-12, atol=1e-9)
+
+
+@pytest.mark.parametrize("radius_miles", [1.0, 5.0, 25.0, 150.0])
+@pytest.mark.parametrize("center_lat, center_lon", CENTERS)
+def test_radius_filters_match_scalar_and_brute_force(center_lat, center_lon, radius_miles):
+    lats, lons, points = scatter(center_lat, center_lon)
+    expected = [
+        i for i, p in enumerate(points)
+        if p["lat"] is not None and is_within_radius(center_lat, center_lon, p["lat"], p["lon"], radius_miles)
+    ]
+    got = filter_nearby_indices(center_lat, center_lon, lats, lons, radius_miles)
+    np.testing.assert_array_equal(got, expected)
+    # 粗滤不能漏掉圆内的点
+    np.testing.assert_array_equal(got, np.flatnonzero(haversine_distance_array(center_lat, center_lon, lats, lons) <= radius_miles))
+    assert count_nearby_points_array(center_lat, center_lon, lats, lons, radius_miles) == count_nearby_points(
+        center_lat, center_lon, points, radius_miles
+    )
+    assert len(filter_nearby_points(center_lat, center_lon, points, radius_miles)) == len(expected)
+
+
+def test_dateline_distance():
+    assert haversine_distance(0.0, 179.0, 0.0, -179.0) == pytest.approx(138.2, abs=0.1)
+    np.testing.assert_allclose(
+        haversine_distance_array(0.0, 179.0, np.array([0.0, 0.0]), np.array([-179.0, 179.0])),
+        [haversine_distance(0.0, 179.0, 0.0, -179.0), 0.0],
+    )
+
+
+@pytest.mark.parametrize("center_lat", [90.0, -90.0, 89.9])
+def test_polar_circles_ignore_longitude(center_lat):
+    dlat, dlon = bbox_thresholds(center_lat, 20.0)
+    assert dlon == 180.0
+    lats = np.full(8, center_lat - np.sign(center_lat) * 0.2)
+    lons = np.linspace(-180.0, 135.0, 8)
+    np.testing.assert_array_equal(
+        filter_nearby_indices(center_lat, 0.0, lats, lons, 20.0),
+        np.flatnonzero(haversine_distance_array(center_lat, 0.0, lats, lons) <= 20.0),
+    )
+
+
+def test_zero_radius_keeps_only_coincident_points():
+    lats = np.array([37.7, 37.7, 37.7001, np.nan])
+    lons = np.array([-122.4, -122.4, -122.4, -122.4])
+    np.testing.assert_array_equal(filter_nearby_indices(37.7, -122.4, lats, lons, 0.0), [0, 1])
+    assert is_within_radius(37.7, -122.4, 37.7, -122.4, 0.0)
+    assert not is_within_radius(37.7, -122.4, 37.7001, -122.4, 0.0)
@@ -0,0 +1,163 @@
+"""JobStore: background job lifecycle (submit / get / wait / purge) and the SQLite table shared between workers."""
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+
+from src.recommendation.jobs import DONE, FAILED, PENDING, RUNNING, JobStore
+
+
+@pytest.fixture
+def jobs():
+    store = JobStore(max_workers=2, ttl_seconds=60)
+    yield store
+    store.shutdown(wait=True)
+
+
+def blocked(release):
+    def run():
+        assert release.wait(5)
+        return {"picks": ["b1"]}
+    return run
+
+
+def test_submit_runs_job_and_wait_returns_result(jobs):
+    job_id = jobs.submit(lambda a, b=0: a + b, 1, b=2)
+    state = jobs.wait(job_id, timeout=5)
+    assert state["status"] == DONE
+    assert state["result"] == 3
+    assert state["error"] is None
+    assert state["finished_at"] >= state["created_at"]
+    assert jobs.get(job_id) == state
+
+
+def test_get_reports_progress_before_the_job_finishes(jobs):
+    release = threading.Event()
+    job_id = jobs.submit(blocked(release))
+    assert jobs.get(job_id)["status"] in (PENDING, RUNNING)
+    assert jobs.get(job_id)["result"] is None
+    release.set()
+    assert jobs.wait(job_id, timeout=5)["result"] == {"picks": ["b1"]}
+
+
+def test_wait_times_out_with_current_state(jobs):
+    release = threading.Event()
+    job_id = jobs.submit(blocked(release))
+    started = time.monotonic()
+    state = jobs.wait(job_id, timeout=0.1)
+    assert 0.1 <= time.monotonic() - started < 2
+    assert state["status"] in (PENDING, RUNNING)
+    release.set()
+    assert jobs.wait(job_id, timeout=5)["status"] == DONE
+
+
+def test_failed_job_records_error(jobs):
+    def fail():
+        raise RuntimeError("model unavailable")
+
+    state = jobs.wait(jobs.submit(fail), timeout=5)
+    assert state["status"] == FAILED
+    assert state["error"] == "model unavailable"
+    assert state["result"] is None
+
+
+def test_unknown_job_is_none(jobs):
+    assert jobs.get("missing") is None
+    assert jobs.wait("missing", timeout=0.05) is None
+
+
+def test_finished_jobs_are_purged_after_ttl():
+    jobs = JobStore(max_workers=1, ttl_seconds=0.05)
+    try:
+        release = threading.Event()
+        finished = jobs.submit(lambda: "done")
+        assert jobs.wait(finished, timeout=5)["status"] == DONE
+        running = jobs.submit(blocked(release))
+        time.sleep(0.1)
+        # 下一次 submit 时清理：已完成且超过 TTL 的任务被移除，未完成的保留
+        jobs.submit(lambda: None)
+        assert jobs.get(finished) is None
+        assert jobs.get(running) is not None
+        release.set()
+    finally:
+        jobs.shutdown(wait=True)
+
+
+@pytest.fixture
+def workers(tmp_path):
+    # 两个 JobStore 共用一个 SQLite 文件，模拟两个 gunicorn worker
+    path = tmp_path / "jobs.sqlite3"
+    pair = [JobStore(max_workers=2, ttl_seconds=60, store_path=path, poll_interval=0.02) for _ in range(2)]
+    yield pair
+    for store in pair:
+        store.shutdown(wait=True)
+
+
+def test_other_worker_sees_job_states(workers):
+    owner, other = workers
+    release = threading.Event()
+    job_id = owner.submit(blocked(release))
+    assert other.get(job_id)["status"] in (PENDING, RUNNING)
+    release.set()
+    owner.wait(job_id, timeout=5)
+    assert other.get(job_id) == owner.get(job_id)
+    assert other.get(job_id)["result"] == {"picks": ["b1"]}
+
+
+def test_other_worker_wait_polls_until_done(workers):
+    owner, other = workers
+    release = threading.Event()
+    job_id = owner.submit(blocked(release))
+    threading.Timer(0.1, release.set).start()
+    state = other.wait(job_id, timeout=5)
+    assert state["status"] == DONE
+    assert state["result"] == {"picks": ["b1"]}
+
+
+def test_other_worker_wait_times_out_with_current_state(workers):
+    owner, other = workers
+    release = threading.Event()
+    job_id = owner.submit(blocked(release))
+    started = time.monotonic()
+    state = other.wait(job_id, timeout=0.1)
+    assert 0.1 <= time.monotonic() - started < 2
+    assert state["status"] in (PENDING, RUNNING)
+    release.set()
+
+
+def test_other_worker_sees_failures(workers):
+    owner, other = workers
+
+    def fail():
+        raise RuntimeError("model unavailable")
+
+    job_id = owner.submit(fail)
+    state = other.wait(job_id, timeout=5)
+    assert state["status"] == FAILED
+    assert state["error"] == "model unavailable"
+
+
+def test_shared_job_expires_after_ttl(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    owner = JobStore(ttl_seconds=0.1, store_path=path)
+    other = JobStore(ttl_seconds=0.1, store_path=path)
+    try:
+        job_id = owner.submit(lambda: "done")
+        assert owner.wait(job_id, timeout=5)["status"] == DONE
+        assert other.get(job_id)["result"] == "done"
+        time.sleep(0.15)
+        assert other.get(job_id) is None
+    finally:
+        owner.shutdown(wait=True)
+        other.shutdown(wait=True)
+
+
+def test_unserializable_result_stays_local(workers):
+    owner, other = workers
+    job_id = owner.submit(lambda: {"store": object()})
+    state = owner.wait(job_id, timeout=5)
+    assert state["status"] == DONE
+    # 共享表保留最后一次可写入的状态
+    assert other.get(job_id)["status"] in (PENDING, RUNNING)
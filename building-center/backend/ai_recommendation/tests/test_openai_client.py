@@ -0,0 +1,151 @@
+"""OpenAIClient retries, deadlines and hedging against the local OpenAI stub."""
+from __future__ import annotations
+
+import json
+import time
+
+import pytest
+
+from src.recommendation.openai_client import OpenAIClient, OpenAIRequestError
+from tests.openai_stub import StubOpenAIServer
+
+PROMPT = "CANDIDATE BUILDINGS\n1|building_0001|A\n2|building_0002|B\n3|building_0003|C\n"
+PICKS = ["building_0001", "building_0002", "building_0003"]
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**options):
+        server = StubOpenAIServer(("127.0.0.1", 0), **options)
+        server.start_background(poll_interval=0.05)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def make_client():
+    clients = []
+
+    def make(server, **options):
+        options.setdefault("backoff_base", 0.01)
+        options.setdefault("backoff_max", 0.05)
+        client = OpenAIClient("test-key", base_url=server.base_url, **options)
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        client.close()
+
+
+def picked_ids(output):
+    return [pick["id"] for pick in json.loads(output)]
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_retries_retryable_status(stub, make_client, status):
+    server = stub(fail_first=2, fail_status=status)
+    client = make_client(server, max_retries=3)
+    assert picked_ids(client.chat("system", PROMPT)) == PICKS
+    assert server.request_count == 3
+    stats = client.stats()
+    assert (stats["attempts"], stats["retries"], stats["failures"]) == (3, 2, 0)
+
+
+def test_gives_up_after_max_retries(stub, make_client):
+    server = stub(fail_first=10)
+    client = make_client(server, max_retries=2)
+    with pytest.raises(OpenAIRequestError) as info:
+        client.chat("system", PROMPT)
+    assert info.value.status == 429
+    assert server.request_count == 3
+    assert client.stats()["failures"] == 1
+
+
+def test_client_errors_are_not_retried(stub, make_client):
+    server = stub(fail_first=1, fail_status=400)
+    client = make_client(server, max_retries=3)
+    with pytest.raises(OpenAIRequestError) as info:
+        client.chat("system", PROMPT)
+    assert info.value.status == 400
+    assert server.request_count == 1
+
+
+def test_retry_after_sets_the_minimum_backoff(stub, make_client):
+    server = stub(fail_first=1, retry_after="0.4")
+    client = make_client(server, max_retries=1)
+    client.chat("system", PROMPT)
+    assert server.request_times[1] - server.request_times[0] >= 0.4
+
+
+def test_deadline_caps_the_attempt_timeout(stub, make_client):
+    server = stub(latency=3.0)
+    client = make_client(server, max_retries=3, chat_timeout=60)
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        client.chat("system", PROMPT, deadline=started + 0.3)
+    assert time.monotonic() - started < 1.5
+    assert server.request_count == 1
+
+
+def test_deadline_caps_the_backoff_sleep(stub, make_client):
+    server = stub(fail_first=1, retry_after="30")
+    client = make_client(server, max_retries=3)
+    started = time.monotonic()
+    with pytest.raises(OpenAIRequestError):
+        client.chat("system", PROMPT, deadline=started + 1.0)
+    # 等待 Retry-After 会越过截止时间：不睡眠、直接放弃
+    assert time.monotonic() - started < 0.5
+    assert server.request_count == 1
+    assert client.stats()["retries"] == 0
+
+
+def test_hedged_request_wins_over_slow_primary(stub, make_client):
+    server = stub(latency=2.0, slow_first=1)
+    client = make_client(server, hedge_after=0.1)
+    started = time.monotonic()
+    assert picked_ids(client.chat("system", PROMPT)) == PICKS
+    assert time.monotonic() - started < 1.5
+    stats = client.stats()
+    assert (stats["hedges"], stats["hedge_wins"]) == (1, 1)
+    assert server.request_count == 2
+
+
+def test_fast_response_is_not_hedged(stub, make_client):
+    server = stub()
+    client = make_client(server, hedge_after=1.0)
+    client.chat("system", PROMPT)
+    assert client.stats()["hedges"] == 0
+    assert server.request_count == 1
+
+
+def test_stream_retries_before_the_first_delta(stub, make_client):
+    server = stub(fail_first=1, fail_status=502)
+    client = make_client(server, max_retries=2)
+    deltas = list(client.chat_stream("system", PROMPT))
+    assert len(deltas) > 1
+    assert picked_ids("".join(deltas)) == PICKS
+    assert server.request_count == 2
+
+
+def test_recommend_falls_back_to_score_order(stub, make_client, recommender, monkeypatch):
+    server = stub(fail_first=100, fail_status=503)
+    monkeypatch.setattr(recommender, "_openai_client", make_client(server, max_retries=1))
+    monkeypatch.setattr(recommender, "cascade_policy", None)
+    before = recommender.ranking_stats()
+
+    request = {"location": {"lat": 37.5630, "lon": -122.3255}, "radius_miles": 3, "top_priorities": ["Safety"]}
+    result = recommender.recommend(request, use_gpt=True)
+
+    assert [pick["id"] for pick in result["final_recommendations"]] == [b["building_id"] for b in result["top20"][:3]]
+    assert server.request_count == 2
+    after = recommender.ranking_stats()
+    assert after["call_failures"] - before["call_failures"] == 1
+    assert after["fallbacks"] - before["fallbacks"] == 1
@@ -0,0 +1,128 @@
+"""Strict ranking parsing and the single repair turn of the GPT ranking call."""
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from src.recommendation import HousingRecommender
+from src.recommendation.ranking_output import RANKING_RESPONSE_FORMAT, RankingOutputError, parse_ranking
+from tests.conftest import EMBEDDING_PATHS, ENRICHED_PATHS, ScriptedClient
+
+IDS = {"building_0001", "building_0002", "building_0003", "building_0004"}
+REQUEST = {
+    "location": {"lat": 37.5630, "lon": -122.3255},
+    "radius_miles": 3,
+    "top_priorities": ["Safety", "Public Transit"],
+}
+
+
+def answer(*ids):
+    return json.dumps({"recommendations": [{"id": building_id, "reasons": [f"why {building_id}"]} for building_id in ids]})
+
+
+def test_parse_object_array_and_code_fence():
+    expected = [{"id": "building_0002", "reasons": ["why building_0002"]}]
+    assert parse_ranking(answer("building_0002"), IDS) == expected
+    assert parse_ranking(json.dumps(json.loads(answer("building_0002"))["recommendations"]), IDS) == expected
+    assert parse_ranking("```json\n" + answer("building_0002") + "\n```", IDS) == expected
+
+
+def test_parse_strips_ids_and_caps_picks():
+    raw = json.dumps([{"id": f" {building_id} ", "reasons": []} for building_id in sorted(IDS)])
+    assert [pick["id"] for pick in parse_ranking(raw, IDS)] == sorted(IDS)[:3]
+    assert len(parse_ranking(raw, IDS, max_picks=1)) == 1
+
+
+@pytest.mark.parametrize(
+    "output, message",
+    [
+        (None, "empty response"),
+        ("   ", "empty response"),
+        ('{"recommendations": [', "not valid JSON"),
+        ('{"picks": []}', '"recommendations" array'),
+        ('{"recommendations": []}', "no recommendations"),
+        ('{"recommendations": ["building_0001"]}', 'string "id"'),
+        (answer("building_9999"), "not in the candidate list"),
+        (answer("building_0001", "building_0001"), "more than once"),
+        ('[{"id": "building_0001", "reasons": "close"}]', "array of strings"),
+    ],
+)
+def test_parse_rejects_invalid_answers(output, message):
+    with pytest.raises(RankingOutputError, match=message):
+        parse_ranking(output, IDS)
+
+
+@pytest.fixture(scope="module")
+def gpt_recommender():
+    return HousingRecommender(
+        enriched_paths=[str(p) for p in ENRICHED_PATHS],
+        embedding_paths=[str(p) for p in EMBEDDING_PATHS],
+        openai_api_key="test",
+        openai_client=ScriptedClient(),
+        offline_geocoding="only",
+    )
+
+
+@pytest.fixture(scope="module")
+def top(gpt_recommender):
+    return gpt_recommender.recommend(REQUEST, return_top_n=20, use_gpt=False)["top20"]
+
+
+@pytest.fixture
+def scripted(gpt_recommender, monkeypatch):
+    def install(*outputs, structured_output=True):
+        client = ScriptedClient(*outputs)
+        monkeypatch.setattr(gpt_recommender, "_openai_client", client)
+        monkeypatch.setattr(gpt_recommender, "structured_output", structured_output)
+        return client
+
+    return install
+
+
+def test_valid_answer_uses_one_structured_call(gpt_recommender, scripted, top):
+    ids = [entry["building_id"] for entry in top[3:6]]
+    client = scripted(answer(*ids))
+    picks = gpt_recommender.select_with_gpt(REQUEST, top)
+    assert [pick["id"] for pick in picks] == ids
+    assert len(client.calls) == 1
+    assert client.calls[0]["response_format"] == RANKING_RESPONSE_FORMAT
+    assert client.calls[0]["followups"] is None
+
+
+def test_invalid_answer_gets_one_repair_turn(gpt_recommender, scripted, top):
+    ids = [entry["building_id"] for entry in top[:2]]
+    bad = answer(ids[0], "building_9999")
+    client = scripted(bad, answer(*ids))
+    before = gpt_recommender.ranking_stats()
+
+    picks = gpt_recommender.select_with_gpt(REQUEST, top)
+
+    assert [pick["id"] for pick in picks] == ids
+    assert len(client.calls) == 2
+    repair = client.calls[1]
+    assert repair["user_prompt"] == client.calls[0]["user_prompt"]
+    assert repair["followups"][0] == {"role": "assistant", "content": bad}
+    assert "building_9999" in repair["followups"][1]["content"]
+    after = gpt_recommender.ranking_stats()
+    assert after["repairs"] - before["repairs"] == 1
+    assert after["repaired"] - before["repaired"] == 1
+
+
+def test_second_invalid_answer_falls_back_to_scores(gpt_recommender, scripted, top):
+    client = scripted("not json", answer("building_9999"))
+    before = gpt_recommender.ranking_stats()
+
+    picks = gpt_recommender.select_with_gpt(REQUEST, top)
+
+    assert len(client.calls) == 2  # 只修复一次
+    assert [pick["id"] for pick in picks] == [entry["building_id"] for entry in top[:3]]
+    after = gpt_recommender.ranking_stats()
+    assert after["parse_failures"] - before["parse_failures"] == 2
+    assert after["fallbacks"] - before["fallbacks"] == 1
+
+
+def test_plain_json_mode_sends_no_schema(gpt_recommender, scripted, top):
+    client = scripted(json.dumps([{"id": top[0]["building_id"], "reasons": []}]), structured_output=False)
+    assert gpt_recommender.select_with_gpt(REQUEST, top)[0]["id"] == top[0]["building_id"]
+    assert client.calls[0]["response_format"] is None
@@ -0,0 +1,133 @@
+"""Hot reload: the store swap is atomic, single-flight, and responses keep the snapshot they ranked."""
+from __future__ import annotations
+
+import json
+import threading
+import time
+
+import pytest
+
+import api_server
+from src.recommendation import HousingRecommender
+from tests.conftest import EMBEDDING_PATHS, copied_enriched_paths
+
+REQUEST = {
+    "location": {"lat": 37.5630, "lon": -122.3255},
+    "radius_miles": 3,
+    "top_priorities": ["Safety", "Public Transit"],
+}
+
+
+@pytest.fixture
+def reloadable(data_dir):
+    return HousingRecommender(
+        enriched_paths=[str(p) for p in copied_enriched_paths(data_dir)],
+        embedding_paths=[str(p) for p in EMBEDDING_PATHS],
+        geocoder=lambda query: None,
+        offline_geocoding="only",
+        dedupe_radius_m=None,
+    )
+
+
+def rewrite_titles(data_dir, title):
+    for target in copied_enriched_paths(data_dir):
+        buildings = json.loads(target.read_text(encoding="utf-8"))
+        for building in buildings:
+            building["title"] = title
+        target.write_text(json.dumps(buildings), encoding="utf-8")
+
+
+def wait_unlocked(recommender, timeout=5.0):
+    end = time.monotonic() + timeout
+    while recommender._reload_lock.locked():
+        assert time.monotonic() < end, "reload did not finish"
+        time.sleep(0.01)
+
+
+def test_reload_swaps_store_and_bumps_version(reloadable, data_dir):
+    old_store = reloadable._store
+    rewrite_titles(data_dir, "Reloaded")
+    assert reloadable.reload()
+    assert reloadable._store is not old_store
+    assert reloadable.data_version == 2
+    building_id = old_store.ids[0]
+    assert reloadable.get_building(building_id, fields=["title"]) == {"title": "Reloaded"}
+    assert old_store.project(old_store.id_to_row[building_id], ["title"]) != {"title": "Reloaded"}
+
+
+def test_response_uses_store_the_request_ranked(reloadable, data_dir, monkeypatch):
+    result = reloadable.recommend(REQUEST, use_gpt=False)
+    picks = result["final_recommendations"]
+    assert picks and result["store"] is reloadable._store
+    before = {b["building_id"]: b["data"]["title"] for b in result["top20"]}
+
+    rewrite_titles(data_dir, "Reloaded")
+    assert reloadable.reload()
+
+    monkeypatch.setattr(api_server, "recommender", reloadable)
+    recommendations = api_server.build_recommendations(picks, result["top20"], fields=["title"], store=result["store"])
+    assert [r["data"]["title"] for r in recommendations] == [before[p["id"]] for p in picks]
+    # 不传 store 时读取的是重载后的数据
+    current = api_server.build_recommendations(picks, result["top20"], fields=["title"])
+    assert {r["data"]["title"] for r in current} == {"Reloaded"}
+
+
+def test_store_is_swapped_only_when_fully_built(reloadable, monkeypatch):
+    old_store = reloadable._store
+    started, release = threading.Event(), threading.Event()
+    load_store = reloadable._load_store
+
+    def blocking_load():
+        started.set()
+        assert release.wait(5)
+        return load_store()
+
+    monkeypatch.setattr(reloadable, "_load_store", blocking_load)
+    assert reloadable.reload_async()
+    assert started.wait(5)
+    # 新数据构建期间请求仍读取旧快照
+    assert reloadable._store is old_store
+    assert reloadable.data_version == 1
+    assert reloadable.recommend(REQUEST, use_gpt=False)["store"] is old_store
+
+    release.set()
+    wait_unlocked(reloadable)
+    assert reloadable._store is not old_store
+    assert reloadable.data_version == 2
+
+
+def test_reload_async_is_single_flight(reloadable, monkeypatch):
+    calls = []
+    release = threading.Event()
+
+    def blocking_load():
+        calls.append(1)
+        assert release.wait(5)
+        return reloadable._store
+
+    monkeypatch.setattr(reloadable, "_load_store", blocking_load)
+    assert reloadable.reload_async()
+    assert not reloadable.reload_async()
+    assert not reloadable.reload()
+
+    release.set()
+    wait_unlocked(reloadable)
+    assert len(calls) == 1
+    assert reloadable.data_version == 2
+    # 完成后可以再次触发
+    assert reloadable.reload_async()
+    wait_unlocked(reloadable)
+    assert reloadable.data_version == 3
+
+
+def test_failed_reload_keeps_store_and_releases_lock(reloadable, monkeypatch):
+    old_store = reloadable._store
+
+    def failing_load():
+        raise ValueError("corrupt data file")
+
+    monkeypatch.setattr(reloadable, "_load_store", failing_load)
+    assert reloadable.reload_async()
+    wait_unlocked(reloadable)
+    assert reloadable._store is old_store
+    assert reloadable.data_version == 1
@@ -0,0 +1,79 @@
+"""RentIndex budget filtering against the per-building rule it replaced."""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from src.recommendation.building_store import BuildingRecord, BuildingStore, parse_pricing_min
+from src.recommendation.utils import ensure_list, parse_float
+
+
+def matches_budget(data, max_rent, bedrooms):
+    """Original per-request rule: rentcast rents for the bedroom count, else the pricing string."""
+    rentcast = ensure_list(data.get("rentcast_data"))
+    if bedrooms is not None:
+        rents = [parse_float(e.get("rent")) for e in rentcast if e.get("bedrooms") == bedrooms and e.get("rent")]
+    else:
+        rents = [parse_float(e.get("rent")) for e in rentcast]
+    rents = [r for r in rents if r is not None]
+    if rents:
+        return any(r <= max_rent for r in rents)
+    pricing_min = parse_pricing_min(data.get("pricing") or data.get("Pricing"))
+    if pricing_min is not None:
+        return pricing_min <= max_rent
+    return True
+
+
+def expected_rows(store, max_rent, bedrooms):
+    return np.array(
+        [row for row, record in enumerate(store.records) if matches_budget(record.data, max_rent, bedrooms)],
+        dtype=np.int64,
+    )
+
+
+SYNTHETIC = [
+    {"rentcast_data": [{"bedrooms": 1, "rent": 2100}, {"bedrooms": 2, "rent": 2900}, {"bedrooms": 2, "rent": 2700}]},
+    {"rentcast_data": [{"bedrooms": 0, "rent": "1,650"}], "pricing": "$1,200 - $4,000"},
+    {"pricing": "$1,780 - $6,670"},
+    {"Pricing": "Call for pricing"},
+    {},
+    {"rentcast_data": [{"bedrooms": 3, "rent": 0}, {"bedrooms": None, "rent": 3100}]},
+    {"rentcast_data": [{"bedrooms": [2], "rent": 1500}, {"bedrooms": 1, "rent": None}], "pricing": "$2,400"},
+]
+
+
+@pytest.fixture(scope="module")
+def synthetic_store():
+    records = [BuildingRecord(f"b{row}", "test", data) for row, data in enumerate(SYNTHETIC)]
+    return BuildingStore(records)
+
+
+@pytest.mark.parametrize("bedrooms", [None, 0, 1, 2, 3, 5])
+@pytest.mark.parametrize("max_rent", [0, 1500, 1780, 2100, 2500, 3100, 10_000])
+def test_synthetic_budget_filter(synthetic_store, max_rent, bedrooms):
+    rows = synthetic_store.rent_index.rows_within_budget(max_rent, bedrooms)
+    np.testing.assert_array_equal(rows, expected_rows(synthetic_store, max_rent, bedrooms))
+
+
+@pytest.mark.parametrize("bedrooms", [None, 0, 1, 2, 3, 4])
+def test_building_budget_filter(store, bedrooms):
+    for max_rent in (1000, 1500, 2000, 2290, 2500, 3000, 4000):
+        rows = store.rent_index.rows_within_budget(max_rent, bedrooms)
+        np.testing.assert_array_equal(rows, expected_rows(store, max_rent, bedrooms))
+
+
+@pytest.mark.parametrize("bedrooms", [None, 1, 2])
+def test_subset_filter_matches_range_lookup(recommender, store, bedrooms):
+    budget = {"max_rent": 2500, "bedrooms": bedrooms}
+    subset = np.arange(0, len(store), 3)
+    filtered = recommender._filter_by_budget(store, subset, budget)
+    np.testing.assert_array_equal(filtered, np.intersect1d(subset, expected_rows(store, 2500, bedrooms)))
+    np.testing.assert_array_equal(
+        recommender._filter_by_budget(store, store.all_rows(), budget),
+        expected_rows(store, 2500, bedrooms),
+    )
+
+
+def test_unhashable_bedrooms_fall_back_to_pricing(synthetic_store):
+    rows = synthetic_store.rent_index.rows_within_budget(2000, bedrooms=[1])
+    np.testing.assert_array_equal(rows, expected_rows(synthetic_store, 2000, [1]))
@@ -0,0 +1,115 @@
+"""Store snapshots: invalidation on version or source changes, and a rebuilt snapshot ranking like a fresh load."""
+from __future__ import annotations
+
+import os
+
+import numpy as np
+import pytest
+
+from src.recommendation import HousingRecommender, snapshot
+from src.recommendation.snapshot import fingerprint_sources, load_snapshot, save_snapshot
+from tests.conftest import EMBEDDING_PATHS, copied_enriched_paths
+
+REQUESTS = [
+    {"location": {"lat": 37.5630, "lon": -122.3255}, "radius_miles": 3, "top_priorities": ["Safety", "Public Transit"]},
+    {"location": {"lat": 37.7700, "lon": -122.4200}, "radius_miles": 5, "top_priorities": ["Amenities", "Pet Friendly"]},
+    {
+        "location": {"lat": 37.3500, "lon": -121.9000},
+        "radius_miles": 8,
+        "top_priorities": ["Commute", "Near Grocery"],
+        "budget": {"max_rent": 3000, "bedrooms": 1},
+    },
+]
+
+
+@pytest.fixture
+def sources(data_dir):
+    return copied_enriched_paths(data_dir) + list(EMBEDDING_PATHS)
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path):
+    return tmp_path / "snapshot"
+
+
+def make_recommender(data_dir, snapshot_dir):
+    return HousingRecommender(
+        enriched_paths=[str(p) for p in copied_enriched_paths(data_dir)],
+        embedding_paths=[str(p) for p in EMBEDDING_PATHS],
+        geocoder=lambda query: None,
+        offline_geocoding="only",
+        dedupe_radius_m=None,
+        snapshot_dir=str(snapshot_dir),
+    )
+
+
+@pytest.fixture
+def saved(data_dir, sources, snapshot_dir):
+    """Snapshot written by a first recommender start; returns that recommender."""
+    recommender = make_recommender(data_dir, snapshot_dir)
+    assert (snapshot_dir / snapshot.MANIFEST_NAME).exists()
+    assert load_snapshot(snapshot_dir, sources) is not None
+    return recommender
+
+
+def test_version_bump_invalidates_snapshot(saved, sources, snapshot_dir, monkeypatch):
+    monkeypatch.setattr(snapshot, "SNAPSHOT_VERSION", snapshot.SNAPSHOT_VERSION + 1)
+    assert load_snapshot(snapshot_dir, sources) is None
+
+
+def test_size_change_invalidates_snapshot(saved, sources, snapshot_dir):
+    with open(sources[0], "a", encoding="utf-8") as fh:
+        fh.write("\n")
+    assert load_snapshot(snapshot_dir, sources) is None
+
+
+def test_touch_without_content_change_keeps_snapshot(saved, sources, snapshot_dir):
+    stat = os.stat(sources[0])
+    os.utime(sources[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert load_snapshot(snapshot_dir, sources) is not None
+
+
+def test_same_size_content_change_invalidates_snapshot(saved, sources, snapshot_dir):
+    # 大小不变、mtime 改变：按内容哈希判定
+    content = sources[0].read_bytes()
+    changed = content.replace(b'"building_', b'"Building_', 1)
+    assert len(changed) == len(content) and changed != content
+    stat = os.stat(sources[0])
+    sources[0].write_bytes(changed)
+    os.utime(sources[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert load_snapshot(snapshot_dir, sources) is None
+
+
+def test_changed_source_list_invalidates_snapshot(saved, sources, snapshot_dir):
+    assert load_snapshot(snapshot_dir, sources[:-1]) is None
+
+
+def test_fingerprints_taken_before_build_detect_mid_build_edits(data_dir, sources, snapshot_dir, recommender):
+    fingerprints = fingerprint_sources(sources)
+    with open(sources[0], "a", encoding="utf-8") as fh:
+        fh.write("\n")
+    save_snapshot(snapshot_dir, recommender._store, fingerprints)
+    assert load_snapshot(snapshot_dir, sources) is None
+
+
+def test_rebuilt_snapshot_ranks_like_fresh_load(saved, data_dir, snapshot_dir, recommender, monkeypatch):
+    def no_build(self):
+        raise AssertionError("snapshot was not reused")
+
+    monkeypatch.setattr(HousingRecommender, "_build_store", no_build)
+    restored = make_recommender(data_dir, snapshot_dir)
+
+    fresh = recommender._store
+    np.testing.assert_array_equal(restored._store.lat, fresh.lat)
+    np.testing.assert_array_equal(restored._store.tag_features, fresh.tag_features)
+    query = np.random.default_rng(3).standard_normal(fresh.embedding_dim)
+    rows = fresh.all_rows()
+    np.testing.assert_allclose(
+        restored._store.embedding_similarity(rows, query), fresh.embedding_similarity(rows, query), rtol=1e-6
+    )
+    for request in REQUESTS:
+        expected = recommender.recommend(request, use_gpt=False)
+        actual = restored.recommend(request, use_gpt=False)
+        assert [b["building_id"] for b in actual["top20"]] == [b["building_id"] for b in expected["top20"]]
+        assert [b["total_score"] for b in actual["top20"]] == [b["total_score"] for b in expected["top20"]]
+        assert actual["final_recommendations"] == expected["final_recommendations"]
@@ -0,0 +1,52 @@
+"""GridIndex radius queries against a brute-force Haversine scan."""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from src.pipeline.geo_utils import haversine_distance_array
+from src.pipeline.spatial_index import GridIndex
+
+
+def brute_force(lats, lons, lat, lon, radius_miles):
+    distances = haversine_distance_array(lat, lon, lats, lons)
+    return np.flatnonzero(distances <= radius_miles)  # NaN 距离比较为 False
+
+
+@pytest.mark.parametrize("radius_miles", [0.1, 0.5, 1.0, 3.0, 10.0, 50.0])
+def test_building_queries_match_brute_force(store, radius_miles):
+    index = store.spatial_index
+    rng = np.random.default_rng(7)
+    valid = np.flatnonzero(~np.isnan(store.lat))
+    centers = [(store.lat[row], store.lon[row]) for row in rng.choice(valid, 10, replace=False)]
+    centers += [(37.7225, -122.4777), (37.4275, -122.1697), (40.0, -100.0)]
+    for lat, lon in centers:
+        expected = brute_force(store.lat, store.lon, lat, lon, radius_miles)
+        np.testing.assert_array_equal(index.query_radius(lat, lon, radius_miles), expected)
+
+
+@pytest.mark.parametrize("cell_size_deg", [0.005, 0.02, 1.0, 45.0])
+def test_random_points_match_brute_force(cell_size_deg):
+    rng = np.random.default_rng(11)
+    lats = rng.uniform(-89.0, 89.0, 3000)
+    lons = rng.uniform(-180.0, 180.0, 3000)
+    lats[::50] = np.nan  # 缺失坐标不会出现在结果中
+    index = GridIndex(lats, lons, cell_size_deg=cell_size_deg)
+    for lat, lon in zip(rng.uniform(-89.0, 89.0, 40), rng.uniform(-180.0, 180.0, 40)):
+        radius_miles = float(rng.choice([5.0, 200.0, 1500.0]))
+        expected = brute_force(lats, lons, lat, lon, radius_miles)
+        np.testing.assert_array_equal(index.query_radius(lat, lon, radius_miles), expected)
+
+
+def test_query_wraps_across_the_antimeridian():
+    lats = np.array([0.0, 0.0, 0.0, 0.0])
+    lons = np.array([179.99, -179.99, 170.0, np.nan])
+    index = GridIndex(lats, lons)
+    np.testing.assert_array_equal(index.query_radius(0.0, 180.0, 5.0), [0, 1])
+    np.testing.assert_array_equal(index.query_radius(0.0, -179.995, 5.0), brute_force(lats, lons, 0.0, -179.995, 5.0))
+
+
+def test_empty_index():
+    index = GridIndex(np.array([np.nan]), np.array([np.nan]))
+    assert len(index) == 0
+    assert index.query_radius(37.7, -122.4, 10.0).size == 0
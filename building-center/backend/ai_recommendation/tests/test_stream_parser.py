@@ -0,0 +1,83 @@
+"""PickStreamParser on streamed ranking output."""
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from src.recommendation.stream_parser import PickStreamParser
+
+PICKS = [
+    {"id": "building_0001", "reasons": ["Quiet street", "Close to BART"]},
+    {"id": "building_0002", "reasons": ["Gym {24h}", 'Called "the best" by residents', "C:\\\\ path ]"]},
+    {"id": "building_0003", "reasons": []},
+]
+ARRAY = json.dumps(PICKS)
+
+
+def feed_all(text, chunk_size=None, max_picks=None):
+    parser = PickStreamParser(max_picks=max_picks)
+    chunks = [text] if chunk_size is None else [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+    picks = []
+    for chunk in chunks:
+        picks.extend(parser.feed(chunk))
+    return picks, parser
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        ARRAY,
+        json.dumps({"recommendations": PICKS}),
+        "```json\n" + json.dumps(PICKS, indent=2) + "\n```",
+        "Here are my [top] picks:\n" + ARRAY + "\nHope this helps [really].",
+        "Options [1] and [2] were close, see [{note}] below.\n" + ARRAY,
+        'Old style ["building_0009", "building_0008"] then\n' + ARRAY,
+    ],
+    ids=["array", "structured", "fence", "prose-brackets", "prose-object-bracket", "string-array"],
+)
+@pytest.mark.parametrize("chunk_size", [None, 1, 5])
+def test_extracts_picks(text, chunk_size):
+    picks, parser = feed_all(text, chunk_size)
+    assert picks == PICKS
+    assert parser.picks == PICKS
+    assert parser.done
+
+
+def test_escaped_quotes_and_braces_in_strings():
+    picks, _ = feed_all(ARRAY, chunk_size=1)
+    assert picks[1]["reasons"] == PICKS[1]["reasons"]
+
+
+def test_picks_are_returned_as_soon_as_complete():
+    parser = PickStreamParser()
+    first = json.dumps(PICKS[0])
+    assert parser.feed("[" + first[:-1]) == []
+    assert parser.feed("}") == [PICKS[0]]
+    assert not parser.done
+    assert parser.feed(", " + json.dumps(PICKS[1])) == [PICKS[1]]
+
+
+def test_bracket_at_delta_boundary_waits_for_next_character():
+    parser = PickStreamParser()
+    assert parser.feed("see [") == []
+    assert parser.feed("1] then [") == []
+    assert parser.feed(json.dumps(PICKS[0])) == [PICKS[0]]
+
+
+def test_max_picks_stops_early():
+    picks, parser = feed_all(ARRAY, chunk_size=3, max_picks=2)
+    assert picks == PICKS[:2]
+    assert parser.done
+
+
+def test_unusable_objects_are_skipped_and_text_is_kept():
+    text = '[{"name": "no id"}, {"id": "building_0001", "reasons": "single"}]'
+    picks, parser = feed_all(text, chunk_size=4)
+    assert picks == [{"id": "building_0001", "reasons": ["single"]}]
+    assert parser.text == text
+
+
+def test_no_array():
+    picks, parser = feed_all("I cannot rank these buildings [sorry].")
+    assert picks == [] and not parser.done
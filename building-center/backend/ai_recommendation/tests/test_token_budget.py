@@ -0,0 +1,80 @@
+"""Token estimation, fit_items and candidate trimming in the ranking prompt."""
+from __future__ import annotations
+
+import re
+
+import pytest
+
+from src.recommendation import token_budget
+from src.recommendation.token_budget import estimate_tokens, fit_items
+
+REQUEST = {
+    "location": {"lat": 37.7749, "lon": -122.4194},
+    "radius_miles": 10,
+    "top_priorities": ["Safety", "Commute", "Near Grocery"],
+    "budget": {"max_rent": 3500},
+}
+ROW = re.compile(r"^\d+\|(\S+?)\|", re.MULTILINE)
+
+
+@pytest.fixture
+def heuristic(monkeypatch):
+    # 不依赖 tiktoken 是否安装，固定使用字符估算
+    monkeypatch.setattr(token_budget, "tiktoken", None)
+
+
+def test_heuristic_estimate(heuristic):
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd" * 10) == 10
+    assert estimate_tokens("abcde") == 2
+    assert estimate_tokens("租金上限") == 4
+    assert estimate_tokens("rent 租金") == 4
+
+
+def test_fit_items_keeps_longest_fitting_prefix():
+    assert fit_items(10, [5, 5, 5, 5], budget=25) == 3
+    assert fit_items(10, [5, 5, 5, 5], budget=30) == 4
+    # 只保留前缀：后面更短的项目不会跳过超预算的项目补进来
+    assert fit_items(10, [5, 50, 1, 1], budget=30, min_items=1) == 1
+
+
+def test_fit_items_floor_and_unbounded():
+    assert fit_items(100, [5, 5, 5, 5], budget=50) == 3
+    assert fit_items(100, [5, 5], budget=50) == 2
+    assert fit_items(100, [5, 5, 5, 5], budget=50, min_items=0) == 0
+    assert fit_items(10**6, [5] * 40, budget=None) == 40
+
+
+@pytest.fixture(scope="module")
+def candidates(recommender):
+    return recommender.recommend(REQUEST, return_top_n=40, use_gpt=False)["top20"]
+
+
+def build_prompt(recommender, candidates, monkeypatch, budget):
+    monkeypatch.setattr(recommender, "prompt_token_budget", budget)
+    weights = recommender._compute_priority_weights(REQUEST["top_priorities"])
+    return recommender._build_prompt(REQUEST, candidates, weights)
+
+
+def prompt_tokens(recommender, prompt):
+    return estimate_tokens(recommender._prompt_system(), recommender.gpt_model) + estimate_tokens(prompt, recommender.gpt_model)
+
+
+def test_prompt_without_budget_keeps_all_candidates(recommender, candidates, monkeypatch):
+    prompt = build_prompt(recommender, candidates, monkeypatch, None)
+    assert ROW.findall(prompt) == [c["building_id"] for c in candidates]
+
+
+def test_prompt_drops_lowest_scored_candidates_to_fit(recommender, candidates, monkeypatch, heuristic):
+    full = prompt_tokens(recommender, build_prompt(recommender, candidates, monkeypatch, None))
+    budget = full - 400
+    prompt = build_prompt(recommender, candidates, monkeypatch, budget)
+    kept = ROW.findall(prompt)
+    assert 3 <= len(kept) < len(candidates)
+    assert kept == [c["building_id"] for c in candidates[: len(kept)]]
+    assert prompt_tokens(recommender, prompt) <= budget
+
+
+def test_prompt_keeps_minimum_candidates_over_budget(recommender, candidates, monkeypatch, heuristic):
+    prompt = build_prompt(recommender, candidates, monkeypatch, 10)
+    assert ROW.findall(prompt) == [c["building_id"] for c in candidates[:3]]
@@ -0,0 +1,13 @@
+#!/usr/bin/env python3
+"""
+生产环境 WSGI 入口
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+导入时即加载建筑数据；配合 gunicorn.conf.py 中的 preload_app，数据只在 master 中加载一次，
+fork 出的 workers 共享同一份内存。
+"""
+
+from api_server import create_app
+
+app = create_app()